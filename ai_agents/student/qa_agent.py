@@ -2,9 +2,13 @@ from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain_community.vectorstores import FAISS
 from utils.model_client import ChatGLMClient
+from backend.app.services.conversation_memory import ConversationMemory, count_tokens
+from backend.app.services.semantic_cache import get_semantic_cache
+import asyncio
 import json
 import re
-from typing import List, Optional
+import time
+from typing import AsyncIterator, List, Optional
 
 # class QAAgent:
 #     def __init__(self):
@@ -35,24 +39,7 @@ from typing import List, Optional
 #         # 调用模型生成答案
 #         response = await self.client.generate_text(prompt)
 #         return response.strip()
-class QAAgent:
-    def __init__(self):
-        self.client = ChatGLMClient()
-
-    async def answer_question(self, question: str, vector_store: FAISS, history: Optional[List[dict]] = None) -> str:
-        related_docs = vector_store.similarity_search(question, k=3)
-        context = "\n".join([doc.page_content for doc in related_docs])
-        # 构建历史对话
-        history_prompt = ""
-        if history:
-            for turn in history[-10:]:
-                if turn["role"] == "user":
-                    history_prompt += f"学生：{turn['content']}\n"
-                else:
-                    history_prompt += f"助手：{turn['content']}\n"
-        prompt_template = PromptTemplate(
-            input_variables=["history", "question", "context"],
-            template="""
+QA_PROMPT_TEMPLATE = """
 你是一位智能学习问答助手。请根据历史对话、当前问题和相关知识，回答学生的问题。
 
 【历史对话】：
@@ -66,7 +53,102 @@ class QAAgent:
 
 请直接输出答案。
 """
+
+
+class QAAgent:
+    def __init__(self):
+        self.client = ChatGLMClient()
+        self.memory = ConversationMemory()
+
+    @staticmethod
+    def _has_prior_turns(question: str, history: Optional[List[dict]]) -> bool:
+        """是否有之前的对话（前端传入的 history 末尾可能就是当前问题本身）"""
+        turns = list(history or [])
+        if turns and turns[-1].get("role") == "user" and turns[-1].get("content", "").strip() == question.strip():
+            turns = turns[:-1]
+        return bool(turns)
+
+    def _lookup_cache(
+        self, question: str, vector_store: FAISS, history: Optional[List[dict]], summary: Optional[str] = None
+    ):
+        """
+        计算问题向量并查询语义缓存。依赖上下文的追问不走缓存。
+
+        Returns:
+            (query_vector, cache, cached_answer)，cache 为 None 表示本次不使用缓存
+        """
+        query_vector = vector_store.embeddings.embed_query(question)
+        cache = get_semantic_cache()
+        if cache is None or summary or self._has_prior_turns(question, history):
+            return query_vector, None, None
+        kb_version = getattr(vector_store, "version", None)
+        return query_vector, cache, cache.lookup(query_vector, kb_version)
+
+    def _build_prompt(
+        self,
+        question: str,
+        vector_store: FAISS,
+        history: Optional[List[dict]] = None,
+        query_vector: Optional[List[float]] = None,
+        summary: Optional[str] = None
+    ) -> str:
+        # 混合检索（关键词 + 向量）；已算好的问题向量直接复用
+        related_docs = vector_store.retrieve(question, k=3, embedding=query_vector)
+        # 摘要和历史对话先按历史预算截取，检索内容占用剩余的总预算
+        history_prompt = self.memory.fit_history(history, summary)
+        context = self.memory.fit_context(
+            [doc.page_content for doc in related_docs],
+            count_tokens(QA_PROMPT_TEMPLATE) + count_tokens(question) + count_tokens(history_prompt)
         )
-        prompt = prompt_template.format(history=history_prompt, question=question, context=context)
+        prompt_template = PromptTemplate(
+            input_variables=["history", "question", "context"],
+            template=QA_PROMPT_TEMPLATE
+        )
+        return prompt_template.format(history=history_prompt, question=question, context=context)
+
+    async def answer_question(
+        self,
+        question: str,
+        vector_store: FAISS,
+        history: Optional[List[dict]] = None,
+        summary: Optional[str] = None
+    ) -> str:
+        """summary 为会话中较早对话的滚动摘要，history 为其后的最近对话"""
+        started = time.perf_counter()
+        # 问题向量化和检索是同步的网络/CPU 调用，放到线程池执行，不阻塞其他请求的流式输出
+        query_vector, cache, cached_answer = await asyncio.to_thread(
+            self._lookup_cache, question, vector_store, history, summary
+        )
+        if cached_answer is not None:
+            return cached_answer
+        prompt = await asyncio.to_thread(self._build_prompt, question, vector_store, history, query_vector, summary)
         response = await self.client.generate_text(prompt)
-        return response.strip()
\ No newline at end of file
+        answer = response.strip()
+        if cache is not None:
+            cache.store(query_vector, getattr(vector_store, "version", None), question, answer,
+                        time.perf_counter() - started)
+        return answer
+
+    async def stream_answer(
+        self,
+        question: str,
+        vector_store: FAISS,
+        history: Optional[List[dict]] = None,
+        summary: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """流式回答，模型每输出一段就返回一段；命中语义缓存时一次返回完整回答"""
+        started = time.perf_counter()
+        query_vector, cache, cached_answer = await asyncio.to_thread(
+            self._lookup_cache, question, vector_store, history, summary
+        )
+        if cached_answer is not None:
+            yield cached_answer
+            return
+        prompt = await asyncio.to_thread(self._build_prompt, question, vector_store, history, query_vector, summary)
+        parts = []
+        async for delta in self.client.stream_text(prompt):
+            parts.append(delta)
+            yield delta
+        if cache is not None:
+            cache.store(query_vector, getattr(vector_store, "version", None), question, "".join(parts).strip(),
+                        time.perf_counter() - started)
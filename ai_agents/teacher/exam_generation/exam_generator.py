@@ -1,14 +1,17 @@
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from langchain.agents import Tool
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from langchain_community.vectorstores import FAISS
 import random
 import json
+import asyncio
 from datetime import datetime
-import re
 from backend.app.schemas.exam import QuestionCreate, Exam, ExamCreate  # 路径根据你的实际项目结构调整
 from utils.model_client import ChatGLMClient
+from utils.llm_gateway import Priority
+from utils.structured_output import StructuredOutputError, parse_json_items, parse_or_fix, validate
+from ai_agents.teacher.exam_generation.question_schemas import QUESTION_SCHEMAS, GeneratedQuestion
 
 # 定义各题型的 prompt 模板字典
 PROMPT_TEMPLATES = {
@@ -39,19 +42,17 @@ SECTION_NAMES = {
 }
 
 
-def extract_json_from_codeblock(text: str) -> str:
-    print("ai_agents/teacher/exam_generation/exam_generator.py的extract_json_from_codeblock在工作")
-    # match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", text)
-    # if match:
-    #     return match.group(1)
-    match = re.search(r"\{[\s\S]*\}", text)
-    if match:
-        return match.group(0)
-    return text.strip()
+# 批量出题：在单题 prompt 外包一层，要求返回 JSON 数组
+BATCH_PROMPT_TEMPLATE = """
+请一次生成{count}道题目，每道题都满足下面的要求，各题的考查角度和题干不要重复。
+请严格返回一个包含{count}个元素的JSON数组（不要返回markdown代码块），数组中每个元素的格式与下面要求的JSON相同。
+{question_prompt}"""
+
 
 class ExamGeneratorAgent:
     def __init__(self):
-        self.client = ChatGLMClient()
+        # 组卷属于批量任务，在网关中排在学生问答之后
+        self.client = ChatGLMClient(priority=Priority.BATCH)
     
     # async def _generate_question(
     #     self,
@@ -144,40 +145,36 @@ class ExamGeneratorAgent:
     #     )
 
     
-    async def _generate_question(
+    async def _retrieve_context(
         self,
         knowledge_point: str,
-        question_type: str,
-        difficulty: int,
         vector_store: FAISS,
         extra_context: Optional[str] = None,
-        score: int = 5  # 新增
-    ) -> QuestionCreate:
-        # 检索相关知识
-        related_docs = vector_store.similarity_search(knowledge_point, k=3)
-        context = "\n".join([doc.page_content for doc in related_docs])
+        retrieval_memo: Optional[Dict[str, str]] = None
+    ) -> str:
+        """retrieval_memo: 单次组卷内共享的 {知识点: 检索结果}，同一知识点只检索一次"""
+        if retrieval_memo is not None and knowledge_point in retrieval_memo:
+            context = retrieval_memo[knowledge_point]
+        else:
+            # 检索相关知识（embedding 请求 + 向量检索是同步调用，放到线程池执行，不阻塞事件循环）
+            related_docs = await asyncio.to_thread(vector_store.similarity_search, knowledge_point, k=3)
+            context = "\n".join([doc.page_content for doc in related_docs])
+            if retrieval_memo is not None:
+                retrieval_memo[knowledge_point] = context
         # 拼接上传内容
         if extra_context:
             context += "\n" + extra_context
+        return context
 
-        # 构建 LangChain 的 PromptTemplate
-        # prompt_template = PromptTemplate(
-        #     input_variables=["knowledge_point", "question_type", "difficulty", "context"],
-        #     template="""
-        #     请根据以下知识点生成一道{question_type}:
-        #     知识点: {knowledge_point}
-        #     难度等级: {difficulty}/5
-        #     相关知识:
-        #     {context}
-
-        #     返回JSON格式包含:
-        #     1. content: 题目内容
-        #     2. options: 选项列表(选择题必需)
-        #     3. answer: 标准答案
-        #     4. analysis: 解题思路
-        #     5. score: 分值
-        #     """
-        # )
+    def _build_prompt(
+        self,
+        knowledge_point: str,
+        question_type: str,
+        difficulty: int,
+        context: str,
+        score: int,
+        count: int = 1
+    ) -> str:
         template_str = PROMPT_TEMPLATES.get(question_type)
         if template_str is None:
             raise ValueError(f"未知题型: {question_type}")
@@ -192,60 +189,139 @@ class ExamGeneratorAgent:
             context=context,
             score=score
         )
+        if count > 1:
+            prompt = BATCH_PROMPT_TEMPLATE.format(count=count, question_prompt=prompt)
+        return prompt
 
-        # response = await self.client.generate_text(prompt)
-        # json_str = extract_json_from_codeblock(response)
-        # result = json.loads(json_str)
-
-        # # 处理 options 字段
-        # options = result.get("options")
-        # if options and isinstance(options, list) and isinstance(options[0], dict):
-        #     options = [f"{opt.get('label', chr(65+i))}. {opt.get('text', '')}" for i, opt in enumerate(options)]
-        # else:
-        #     options = options
-
-        print("ai_agents/teacher/exam_generation/exam_generator.py的_generate_question在工作")
-        response = await self.client.generate_text(prompt)
-        json_str = extract_json_from_codeblock(response)
-        print("大模型返回的json_str:", json_str)
-        try:
-            result = json.loads(json_str)
-        except Exception as e:
-            print("解析JSON失败:", e)
-            raise
-
-        options = result.get("options")
-        if isinstance(options, list) and options:
-            if all(isinstance(opt, dict) for opt in options):
-                # 转换 dict -> 字符串格式
-                options = [f"{opt.get('label', chr(65+i))}. {opt.get('text', '')}" for i, opt in enumerate(options)]
-            elif all(isinstance(opt, str) for opt in options):
-                # 已经是字符串列表，直接用
-                pass
-            else:
-                # 结构异常，做日志或异常处理
-                options = None
-        else:
-            options = None
-
-        # 处理 answer 字段，确保是字符串
-        answer = result.get("answer")
-        if isinstance(answer, list):
-            answer = ",".join(answer)
-
+    @staticmethod
+    def _build_question(
+        parsed: GeneratedQuestion,
+        question_type: str,
+        difficulty: int,
+        knowledge_point: str,
+        score: int
+    ) -> QuestionCreate:
+        """把通过 schema 校验的题目转成 QuestionCreate"""
         return QuestionCreate(
             id=None,
             type=question_type,
-            content=result["content"],
-            options=options,
-            answer=answer,
-            analysis=result.get("analysis"),
+            content=parsed.content,
+            options=parsed.options,
+            answer=parsed.answer,
+            analysis=parsed.analysis,
             difficulty=difficulty,
             knowledge_point=knowledge_point,
             score=score,
             exam_id=None
         )
 
+    async def _generate_question(
+        self,
+        knowledge_point: str,
+        question_type: str,
+        difficulty: int,
+        vector_store: FAISS,
+        extra_context: Optional[str] = None,
+        score: int = 5,  # 新增
+        retrieval_memo: Optional[Dict[str, str]] = None
+    ) -> QuestionCreate:
+        context = await self._retrieve_context(knowledge_point, vector_store, extra_context, retrieval_memo)
+        prompt = self._build_prompt(knowledge_point, question_type, difficulty, context, score)
+
+        print("ai_agents/teacher/exam_generation/exam_generator.py的_generate_question在工作")
+        response = await self.client.generate_text(prompt)
+        # 本地解析/修复失败时只请模型修正这段输出，修正也失败才整题重新生成
+        parsed = await parse_or_fix(response, QUESTION_SCHEMAS[question_type], self.client.generate_text)
+        return self._build_question(parsed, question_type, difficulty, knowledge_point, score)
+
+    async def _generate_batch_with_retry(
+        self,
+        knowledge_point: str,
+        question_type: str,
+        difficulty: int,
+        vector_store: FAISS,
+        count: int,
+        extra_context: Optional[str] = None,
+        score: int = 5,
+        on_question: Optional[Callable[[], None]] = None,
+        retrieval_memo: Optional[Dict[str, str]] = None
+    ) -> List[QuestionCreate]:
+        """
+        一次请求生成同一题型、同一知识点的 count 道题
+
+        检索上下文只做一次；返回的数组逐题校验，未通过的题目先请模型修正，下一轮只补生成仍缺少的道数。
+        """
+        context = await self._retrieve_context(knowledge_point, vector_store, extra_context, retrieval_memo)
+        schema = QUESTION_SCHEMAS[question_type]
+        questions: List[QuestionCreate] = []
+        max_retries = self.client.config.QUESTION_MAX_RETRIES
+
+        async def fix_item(item: dict) -> Optional[GeneratedQuestion]:
+            try:
+                return await parse_or_fix(json.dumps(item, ensure_ascii=False), schema, self.client.generate_text)
+            except Exception as e:
+                print(f"{question_type} 题修正失败，稍后补生成: {e}")
+                return None
+
+        for attempt in range(max_retries + 1):
+            remaining = count - len(questions)
+            prompt = self._build_prompt(knowledge_point, question_type, difficulty, context, score, remaining)
+            try:
+                response = await self.client.generate_text(prompt)
+                items = parse_json_items(response)
+            except Exception as e:
+                print(f"{question_type} 题批量生成失败: {e}")
+                items = []
+            parsed_items, invalid = [], []
+            for item in items[:remaining]:
+                try:
+                    parsed_items.append(validate(item, schema))
+                except StructuredOutputError as e:
+                    print(f"{question_type} 题校验未通过，请模型修正: {e}")
+                    invalid.append(item)
+            if invalid:
+                fixed = await asyncio.gather(*(fix_item(item) for item in invalid))
+                parsed_items.extend(parsed for parsed in fixed if parsed is not None)
+            for parsed in parsed_items:
+                questions.append(self._build_question(parsed, question_type, difficulty, knowledge_point, score))
+                if on_question is not None:
+                    on_question()
+            if len(questions) >= count:
+                return questions
+            if attempt < max_retries:
+                print(f"{question_type} 题还缺 {count - len(questions)} 道，第{attempt + 1}次补生成")
+                await asyncio.sleep(0.5 * (attempt + 1))
+        raise ValueError(
+            f"{question_type} 题生成失败（知识点: {knowledge_point}，已重试{max_retries}次），"
+            f"仅得到 {len(questions)}/{count} 道合格题目"
+        )
+
+    async def _generate_question_with_retry(
+        self,
+        knowledge_point: str,
+        question_type: str,
+        difficulty: int,
+        vector_store: FAISS,
+        extra_context: Optional[str] = None,
+        score: int = 5,
+        retrieval_memo: Optional[Dict[str, str]] = None
+    ) -> QuestionCreate:
+        """生成单道题，失败只重试这一道题（并发上限由模型网关控制）"""
+        max_retries = self.client.config.QUESTION_MAX_RETRIES
+        for attempt in range(max_retries + 1):
+            try:
+                return await self._generate_question(
+                    knowledge_point, question_type, difficulty, vector_store,
+                    extra_context=extra_context, score=score, retrieval_memo=retrieval_memo
+                )
+            except Exception as e:
+                if attempt >= max_retries:
+                    raise ValueError(
+                        f"{question_type} 题生成失败（知识点: {knowledge_point}，已重试{max_retries}次）: {e}"
+                    ) from e
+                print(f"{question_type} 题生成失败，第{attempt + 1}次重试: {e}")
+                await asyncio.sleep(0.5 * (attempt + 1))
+
     async def generate_exam(
         self,
         course_id: int,
@@ -257,14 +333,18 @@ class ExamGeneratorAgent:
         created_by: int = None,
         vector_store: FAISS = None,
         exam_title: Optional[str] = None,
-        extra_context: Optional[str] = None
+        extra_context: Optional[str] = None,
+        on_progress: Optional[Callable[[str], None]] = None
     ) -> ExamCreate:
+        """on_progress: 每完成一道小题时以题型为参数回调，用于上报组卷进度"""
         questions = []
         total_score = 0
         print("ai_agents/teacher/exam_generation/exam_generator.py的_generate_exam在工作")
 
         # 题型顺序
         section_order = ["single_choice", "multiple_choice", "true_false", "completion", "case_analysis", "programming"]
+        # 先确定每个大题的题型、分值和每道小题的知识点，再并发生成所有小题
+        sections = []
         section_number = 1
         for q_type in section_order:
             count = question_config.get(q_type, 0)
@@ -282,19 +362,68 @@ class ExamGeneratorAgent:
                 section_total=section_total,
                 section_desc=section_desc
             )
-            # 生成本大题所有小题
-            for i in range(count):
-                k_point = random.choice(knowledge_points)
-                question = await self._generate_question(
-                    k_point, q_type, difficulty, vector_store, extra_context=extra_context, score=score
+            k_points = [random.choice(knowledge_points) for _ in range(count)]
+            sections.append((q_type, score, section_intro, k_points))
+            section_number += 1
+
+        # 本次组卷内同一知识点只做一次 embedding + 检索
+        retrieval_memo: Dict[str, str] = {}
+        batch_size = max(1, self.client.config.QUESTION_BATCH_SIZE)
+
+        # 同一大题内知识点相同的小题合并成批，每批最多 batch_size 道；slots 记录这些小题在试卷中的位置
+        groups = []
+        total_questions = 0
+        for q_type, score, _, k_points in sections:
+            slots_by_point: Dict[str, List[int]] = {}
+            for k_point in k_points:
+                slots_by_point.setdefault(k_point, []).append(total_questions)
+                total_questions += 1
+            for k_point, slots in slots_by_point.items():
+                for i in range(0, len(slots), batch_size):
+                    groups.append((q_type, score, k_point, slots[i:i + batch_size]))
+
+        async def generate_group(q_type: str, score: int, k_point: str, count: int) -> List[QuestionCreate]:
+            report = (lambda: on_progress(q_type)) if on_progress is not None else None
+            if count == 1:
+                question = await self._generate_question_with_retry(
+                    k_point, q_type, difficulty, vector_store,
+                    extra_context=extra_context, score=score, retrieval_memo=retrieval_memo
                 )
+                if report is not None:
+                    report()
+                return [question]
+            return await self._generate_batch_with_retry(
+                k_point, q_type, difficulty, vector_store, count,
+                extra_context=extra_context, score=score, on_question=report, retrieval_memo=retrieval_memo
+            )
+
+        tasks = [
+            asyncio.ensure_future(generate_group(q_type, score, k_point, len(slots)))
+            for q_type, score, k_point, slots in groups
+        ]
+        try:
+            group_results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        # 按位置放回，保证题目顺序与逐题生成时一致
+        results: List[QuestionCreate] = [None] * total_questions
+        for (_, _, _, slots), group_questions in zip(groups, group_results):
+            for slot, question in zip(slots, group_questions):
+                results[slot] = question
+
+        position = 0
+        for q_type, score, section_intro, k_points in sections:
+            section_questions = results[position:position + len(k_points)]
+            position += len(k_points)
+            for i, question in enumerate(section_questions):
                 # 在每个小题内容前加题号
                 question.content = f"{i+1}. {question.content}"
                 questions.append(question)
                 total_score += score
             # 在大题第一个小题前插入大题说明
-            questions[-count].content = section_intro + "\n" + questions[-count].content
-            section_number += 1
+            section_questions[0].content = section_intro + "\n" + section_questions[0].content
 
         return ExamCreate(
             id=None,
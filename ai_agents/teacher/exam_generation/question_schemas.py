@@ -0,0 +1,105 @@
+"""
+组卷各题型的输出 schema，与 exam_generator.PROMPT_TEMPLATES 中要求的 JSON 格式一一对应
+
+模型常见的格式偏差在校验器中就地规范化，不需要重新生成：
+    - 选项写成 {"A": "...", "B": "..."} 或 [{"label": "A", "text": "..."}] 时转成 ["A. ...", "B. ..."]
+    - 答案写成数组（多选题）时拼成 "A,C"，判断题答案为 true/false 时转成 正确/错误
+    - 解析写成数组时按行拼接
+模型返回的 score 不使用，分值以组卷请求为准。
+"""
+import re
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+_LETTER_ANSWER = re.compile(r"^\s*[A-Za-z](?:\s*[,，、;；]?\s*[A-Za-z])*\s*$")
+
+
+def normalize_options(value: Any) -> Any:
+    if isinstance(value, dict):
+        return [f"{label}. {text}" for label, text in value.items()]
+    if isinstance(value, list) and value and all(isinstance(opt, dict) for opt in value):
+        return [f"{opt.get('label', chr(65 + i))}. {opt.get('text', '')}" for i, opt in enumerate(value)]
+    return value
+
+
+class GeneratedQuestion(BaseModel):
+    """填空题、判断题、案例分析题、编程题"""
+    content: str
+    answer: str
+    analysis: Optional[str] = None
+    options: Optional[List[str]] = None
+
+    @field_validator("content")
+    @classmethod
+    def _content_not_empty(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("题目内容为空")
+        return value
+
+    @field_validator("answer", mode="before")
+    @classmethod
+    def _normalize_answer(cls, value: Any) -> Any:
+        if isinstance(value, bool):
+            return "正确" if value else "错误"
+        if isinstance(value, list):
+            return ",".join(str(item) for item in value)
+        if isinstance(value, (int, float)):
+            return str(value)
+        return value
+
+    @field_validator("answer")
+    @classmethod
+    def _answer_not_empty(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("答案为空")
+        return value
+
+    @field_validator("analysis", mode="before")
+    @classmethod
+    def _normalize_analysis(cls, value: Any) -> Any:
+        if isinstance(value, list):
+            return "\n".join(str(item) for item in value)
+        return value
+
+    @field_validator("options", mode="before")
+    @classmethod
+    def _normalize_options(cls, value: Any) -> Any:
+        value = normalize_options(value)
+        # 非选择题的选项可有可无，结构异常时直接丢弃
+        if not isinstance(value, list) or not value or not all(isinstance(opt, str) for opt in value):
+            return None
+        return value
+
+
+class ChoiceQuestion(GeneratedQuestion):
+    """单选题"""
+    options: List[str] = Field(min_length=2)
+
+    @field_validator("options", mode="before")
+    @classmethod
+    def _normalize_options(cls, value: Any) -> Any:
+        return normalize_options(value)
+
+
+class MultipleChoiceQuestion(ChoiceQuestion):
+    """多选题：答案为选项字母时至少两个"""
+
+    @model_validator(mode="after")
+    def _at_least_two_answers(self) -> "MultipleChoiceQuestion":
+        if _LETTER_ANSWER.match(self.answer):
+            letters = list(dict.fromkeys(re.findall(r"[A-Za-z]", self.answer.upper())))
+            if len(letters) < 2:
+                raise ValueError("多选题的正确选项必须大于等于2个")
+            self.answer = ",".join(letters)
+        return self
+
+
+QUESTION_SCHEMAS: Dict[str, Type[GeneratedQuestion]] = {
+    "single_choice": ChoiceQuestion,
+    "multiple_choice": MultipleChoiceQuestion,
+    "true_false": GeneratedQuestion,
+    "completion": GeneratedQuestion,
+    "case_analysis": GeneratedQuestion,
+    "programming": GeneratedQuestion,
+}
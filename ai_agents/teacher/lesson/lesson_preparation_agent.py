@@ -1,9 +1,9 @@
 import os
-from docx import Document
-import PyPDF2
 from pptx import Presentation
 import openai
 import json
+from utils.document_parser import parse_docx, parse_pdf
+from utils.llm_gateway import Priority, get_gateway
 
 from .agent_tools import (
     parse_document,
@@ -13,26 +13,13 @@ from .agent_tools import (
     generate_ppt_outline,
 )
 
+# 重试由网关统一处理，SDK 自身不再重试
 client = openai.OpenAI(
     api_key=os.environ.get("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com/v1"
+    base_url=os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
+    max_retries=0
 )
 
-def parse_docx(file_path):
-    """解析 docx 文件，返回全部文本内容"""
-    doc = Document(file_path)
-    content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-    return content
-
-def parse_pdf(file_path):
-    """解析 pdf 文件，返回全部文本内容"""
-    content = ""
-    with open(file_path, "rb") as f:
-        pdf_reader = PyPDF2.PdfReader(f)
-        for page in pdf_reader.pages:
-            content += page.extract_text() or ""
-    return content
-
 def lesson_preparation_agent(file_path):
     # 1. 判断文件类型并解析
     if file_path.endswith('.docx'):
@@ -61,11 +48,16 @@ def lesson_preparation_agent(file_path):
     )
     
     # 3. 调用大模型
-    response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "user", "content": prompt}
-        ]
+    response = get_gateway().call_sync(
+        "deepseek",
+        "deepseek-chat",
+        lambda: client.chat.completions.create(
+            model="deepseek-chat",
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        ),
+        Priority.BATCH
     )
 
     # 4. 返回大模型输出
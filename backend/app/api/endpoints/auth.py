@@ -8,6 +8,7 @@ from backend.app.models.user import User
 from backend.app.core.security import get_password_hash, verify_password, create_access_token
 from backend.app.schemas.user import UserCreate
 from backend.app.schemas.user import User as UserSchema
+from backend.app.services.user_cache import invalidate_user
 
 from jose import JWTError, jwt
 
@@ -72,7 +73,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.username == request.username).first()
     if not user or not verify_password(request.password, user.hashed_password) or user.role != request.role:
         raise HTTPException(status_code=401, detail="用户名或密码或身份错误")
-    token = create_access_token(user.id, user.role)
+    token = create_access_token(user.id, user.role, user.username)
 
     # # 调试输出 Token
     # print("="*50)
@@ -253,6 +254,7 @@ async def update_user(
 
     db.commit()
     db.refresh(user)
+    invalidate_user(user_id)
     return user
 
 # DELETE /api/v1/auth/users/{user_id} 删除用户
@@ -274,4 +276,5 @@ async def delete_user(
 
     db.delete(user)
     db.commit()
+    invalidate_user(user_id)
     return {"message": "用户已删除"}
\ No newline at end of file
@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Path, Response, Header
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional, Dict
-from ...core.deps import get_db, get_current_user
-from ...schemas.exam import ExamCreate, Exam, ExamGenerateRequest, ExamUpdate
+from ...core.deps import get_db, get_async_db, get_current_user, get_token_claims
+from ...schemas.exam import ExamCreate, Exam, ExamGenerateRequest, ExamUpdate, ExamJobStatus
+from ...models.exam_job import ExamJob
+from ...services.exam_jobs import submit_job, cancel_job, job_status, job_result
+from ...services.exam_store import save_exam, save_exams
 from ...models.exam import Exam as ExamModel, Question as QuestionModel
 from ...models.user import User
+from ...schemas.user import TokenClaims
 from ai_agents.factory import AgentFactory
 import datetime
 import json
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -32,7 +39,8 @@ from docx.oxml.ns import qn
 import os
 
 # from backend.app.main import vector_store
-from ...core.deps import get_vector_store
+from ...services.course_index import get_course_vector_store
+import asyncio
 
 # 获取当前 exam.py 所在目录
 current_dir = os.path.dirname(__file__)
@@ -47,8 +55,7 @@ router = APIRouter()
 @router.post("/generate", response_model=ExamCreate)
 async def generate_exam(
     request: ExamGenerateRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """生成考试题目"""
     print("backend/app/api/endpoints/exam.py的generate_exam正在生成考试试卷")
@@ -58,14 +65,15 @@ async def generate_exam(
             detail="只有教师可以生成考试"
         )
     try:
-        # 1. 自动增量入库
+        # 1. 自动增量入库（课程有独立索引分片时只检索该课程的资料，首次使用时加载）
+        vector_store = await asyncio.to_thread(get_course_vector_store, request.course_id)
         if request.extra_context:
-            # 假设你有一个 add_text_to_vector_store 方法
-            from backend.app.main import vector_store
-            vector_store.add_texts([request.extra_context])
+            # 写入追加日志，其他 worker 同样可以检索到
+            await asyncio.to_thread(
+                vector_store.add_texts, [request.extra_context], [{"source": "extra_context"}]
+            )
         # 2. 传递 extra_context 给智能体
         agent = AgentFactory.create_agent("exam_generator")
-        vector_store = get_vector_store()
         questions_exam = await agent.generate_exam(
             course_id=request.course_id,
             knowledge_points=request.knowledge_points,
@@ -87,6 +95,71 @@ async def generate_exam(
             detail=f"生成考试失败: {str(e)}"
         )
 
+@router.post("/jobs", response_model=ExamJobStatus, status_code=202)
+def submit_exam_job(
+    request: ExamGenerateRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """提交异步组卷任务，立即返回任务 id；相同请求重复提交时返回已有任务（同步会话，FastAPI 在线程池中执行）"""
+    if current_user.role != "teacher":
+        raise HTTPException(
+            status_code=403,
+            detail="只有教师可以生成考试"
+        )
+    job, created = submit_job(db, current_user.id, request, idempotency_key)
+    if not created:
+        response.status_code = 200
+    return job_status(job)
+
+def _get_user_job(job_id: str, current_user: TokenClaims, db: Session) -> ExamJob:
+    job = db.get(ExamJob, job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+async def _get_user_job_async(job_id: str, current_user: TokenClaims, db: AsyncSession) -> ExamJob:
+    job = await db.get(ExamJob, job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=ExamJobStatus)
+async def get_exam_job(
+    job_id: str,
+    current_user: TokenClaims = Depends(get_token_claims),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """查询组卷任务状态和各题型进度"""
+    return job_status(await _get_user_job_async(job_id, current_user, db))
+
+@router.get("/jobs/{job_id}/result", response_model=ExamCreate)
+async def get_exam_job_result(
+    job_id: str,
+    current_user: TokenClaims = Depends(get_token_claims),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取已完成任务生成的试卷"""
+    job = await _get_user_job_async(job_id, current_user, db)
+    result = job_result(job)
+    if result is None:
+        raise HTTPException(status_code=409, detail=f"任务尚未完成，当前状态: {job.status}")
+    return result
+
+@router.post("/jobs/{job_id}/cancel", response_model=ExamJobStatus)
+def cancel_exam_job(
+    job_id: str,
+    current_user: TokenClaims = Depends(get_token_claims),
+    db: Session = Depends(get_db)
+):
+    """取消排队中或执行中的组卷任务"""
+    job = _get_user_job(job_id, current_user, db)
+    if job.status in ("pending", "running"):
+        job = cancel_job(db, job)
+    return job_status(job)
+
 def generate_word_from_exam_data(exam_data: dict, include_analysis: bool = True) -> BytesIO:
     document = Document()
 
@@ -205,63 +278,61 @@ async def generate_exam_word(exam_data: dict, include_analysis: bool = True):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Word生成失败: {str(e)}")
 
+async def _load_exam(db: AsyncSession, exam_id: int) -> Optional[ExamModel]:
+    """按 id 查询考试并预先加载题目（异步会话不支持懒加载）"""
+    result = await db.execute(
+        select(ExamModel).where(ExamModel.id == exam_id).options(selectinload(ExamModel.questions))
+    )
+    return result.scalar_one_or_none()
+
+@router.post("", response_model=Exam)
 async def create_exam(
     exam: ExamCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """保存考试"""
+    """保存考试（试卷和全部题目在一个事务中批量写入）"""
     if current_user.role != "teacher":
         raise HTTPException(
             status_code=403,
             detail="只有教师可以创建考试"
         )
     try:
-        db_exam = ExamModel(
-            title=exam.title,
-            description=exam.description,
-            course_id=exam.course_id,
-            duration=exam.duration,
-            total_score=exam.total_score,
-            created_by=current_user.id,
-            created_at=datetime.datetime.now(),
-            status="draft"
-        )
-        db.add(db_exam)
-        db.commit()
-        db.refresh(db_exam)
-        # 添加题目
-        for q in exam.questions:
-            db_question = QuestionModel(
-                type=q.type,
-                content=q.content,
-                options=json.dumps(q.options) if q.options else None,
-                answer=q.answer,
-                analysis=q.analysis,
-                score=q.score,
-                knowledge_point=q.knowledge_point,
-                difficulty=q.difficulty,
-                exam_id=db_exam.id
-            )
-            db.add(db_question)
-        db.commit()
-        db.refresh(db_exam)
-        return db_exam
+        return await save_exam(db, exam, current_user.id)
     except Exception as e:
-        db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"创建考试失败: {str(e)}"
         )
 
+@router.post("/batch", response_model=List[Exam])
+async def import_exams(
+    exams: List[ExamCreate],
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量导入考试，全部成功或全部失败"""
+    if current_user.role != "teacher":
+        raise HTTPException(
+            status_code=403,
+            detail="只有教师可以创建考试"
+        )
+    try:
+        return await save_exams(db, exams, current_user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"导入考试失败: {str(e)}"
+        )
+
 @router.get("/{exam_id}", response_model=Exam)
 async def get_exam(
     exam_id: int = Path(..., title="考试ID"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取考试详情"""
-    exam = db.query(ExamModel).filter(ExamModel.id == exam_id).first()
+    exam = await _load_exam(db, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="考试不存在")
     
@@ -275,10 +346,10 @@ async def update_exam(
     exam_id: int,
     exam_update: ExamUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新考试"""
-    db_exam = db.query(ExamModel).filter(ExamModel.id == exam_id).first()
+    db_exam = await _load_exam(db, exam_id)
     if not db_exam:
         raise HTTPException(status_code=404, detail="考试不存在")
     
@@ -289,11 +360,10 @@ async def update_exam(
         for key, value in exam_update.dict(exclude_unset=True).items():
             setattr(db_exam, key, value)
         
-        db.commit()
-        db.refresh(db_exam)
+        await db.commit()
         return db_exam
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"更新考试失败: {str(e)}"
@@ -303,10 +373,10 @@ async def update_exam(
 async def delete_exam(
     exam_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除考试"""
-    db_exam = db.query(ExamModel).filter(ExamModel.id == exam_id).first()
+    db_exam = await _load_exam(db, exam_id)
     if not db_exam:
         raise HTTPException(status_code=404, detail="考试不存在")
     
@@ -314,11 +384,11 @@ async def delete_exam(
         raise HTTPException(status_code=403, detail="只有创建者可以删除考试")
     
     try:
-        db.delete(db_exam)
-        db.commit()
+        await db.delete(db_exam)
+        await db.commit()
         return {"message": "考试已删除"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"删除考试失败: {str(e)}"
@@ -328,17 +398,17 @@ async def delete_exam(
 async def download_exam(
     exam_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """下载试卷（JSON格式，可扩展为Word/PDF）"""
-    exam = db.query(ExamModel).filter(ExamModel.id == exam_id).first()
+    exam = await _load_exam(db, exam_id)
     if not exam:
         raise HTTPException(status_code=404, detail="试卷不存在")
     # 权限校验
     if exam.created_by != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="无权下载此试卷")
     # 组装题目
-    questions = db.query(QuestionModel).filter(QuestionModel.exam_id == exam_id).all()
+    questions = exam.questions
     exam_dict = {
         "id": exam.id,
         "title": exam.title,
@@ -363,4 +433,4 @@ async def download_exam(
             } for q in questions
         ]
     }
-    return JSONResponse(content=exam_dict)
\ No newline at end of file
+    return JSONResponse(content=jsonable_encoder(exam_dict))
\ No newline at end of file
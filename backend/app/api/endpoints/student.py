@@ -1,17 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from backend.app.core.deps import get_db, get_vector_store
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.app.core.deps import get_async_db, get_vector_store
 from ai_agents.factory import AgentFactory
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import FAISS
+from utils.llm_gateway import Priority
 from utils.model_client import ChatGLMClient
 from backend.app.models.chat import ChatSession, ChatMessage
+from backend.app.core.config import settings
 from backend.app.core.deps import get_current_user
 from backend.app.db.base_class import Base
-from backend.app.db.session import engine
+from backend.app.db.session import get_async_sessionmaker
 from backend.app.models.user import User
+from backend.app.services.chat_history import list_messages
+from backend.app.services.conversation_memory import load_memory, schedule_summary_refresh
 
 router = APIRouter()
 
@@ -23,10 +31,42 @@ class QuestionRequest(BaseModel):
 class AnswerResponse(BaseModel):
     answer: str
 
+async def _get_user_session(db: AsyncSession, session_id: int, current_user: User) -> Optional[ChatSession]:
+    query = select(ChatSession).where(ChatSession.id == session_id, ChatSession.user_id == current_user.id)
+    return (await db.execute(query)).scalar_one_or_none()
+
+async def _load_history(
+    request: QuestionRequest, db: AsyncSession, current_user: User
+) -> Tuple[Optional[List[dict]], Optional[str], Optional[int]]:
+    """
+    如果没传history但有session_id，则自动查历史：会话的滚动摘要 + 其后的最近消息
+    返回 (history, summary, session_id)，session_id 为校验过归属的会话 id
+    """
+    history, summary, session_id = request.history, None, None
+    if request.session_id:
+        session = await _get_user_session(db, request.session_id, current_user)
+        if session:
+            session_id = session.id
+            if history is None:
+                summary, history = await load_memory(db, session)
+        elif history is None:
+            history = []
+    return history, summary, session_id
+
+def _refresh_summary_later(session_id: Optional[int]) -> None:
+    if session_id:
+        schedule_summary_refresh(session_id, ChatGLMClient(priority=Priority.BATCH))
+
+def _message_dict(m: ChatMessage) -> dict:
+    return {"id": m.id, "role": m.role, "content": m.content, "created_at": m.created_at}
+
+def _sse(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @router.post("/qa", response_model=AnswerResponse)
 async def student_qa(
     request: QuestionRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     vector_store=Depends(get_vector_store),
     current_user: User = Depends(get_current_user)
 ):
@@ -34,20 +74,7 @@ async def student_qa(
     学生问答接口，支持知识库检索和模型回答
     """
     try:
-        # 如果没传history但有session_id，则自动查历史
-        history = request.history
-        if history is None and request.session_id:
-            session = db.query(ChatSession).filter(
-                ChatSession.id == request.session_id,
-                ChatSession.user_id == current_user.id
-            ).first()
-            if session:
-                history = [
-                    {"role": m.role, "content": m.content}
-                    for m in session.messages[-10:]
-                ]
-            else:
-                history = []
+        history, summary, session_id = await _load_history(request, db, current_user)
         # 创建问答智能体
         agent = AgentFactory.create_agent("qa_agent")
         if not agent:
@@ -55,41 +82,162 @@ async def student_qa(
         answer = await agent.answer_question(
             question=request.question,
             vector_store=vector_store,
-            history=history or []
+            history=history or [],
+            summary=summary
         )
+        _refresh_summary_later(session_id)
         return {"answer": answer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"问答失败: {str(e)}")
 
+@router.post("/qa/stream")
+async def student_qa_stream(
+    request: QuestionRequest,
+    db: AsyncSession = Depends(get_async_db),
+    vector_store=Depends(get_vector_store),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    流式问答接口（SSE），模型每输出一段就推送一段：
+        data: {"delta": "..."}
+    结束时推送 {"done": true, "ttft_ms": 首字延迟, "tokens_per_sec": 生成速度, ...}，
+    出错时推送 {"error": "..."}。传了 session_id 时，完整回答会在流结束后写入该会话。
+    """
+    history, summary, session_id = await _load_history(request, db, current_user)
+    agent = AgentFactory.create_agent("qa_agent")
+    if not agent:
+        raise HTTPException(status_code=500, detail="问答失败: 创建问答智能体失败")
+
+    async def event_stream():
+        started = time.perf_counter()
+        first_token_at = None
+        parts = []
+        try:
+            async for delta in agent.stream_answer(
+                question=request.question,
+                vector_store=vector_store,
+                history=history or [],
+                summary=summary
+            ):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as e:
+            yield _sse({"error": f"问答失败: {str(e)}"})
+            return
+
+        finished = time.perf_counter()
+        answer = "".join(parts).strip()
+        usage = agent.client.last_usage or {}
+        tokens = usage.get("completion_tokens") or len(parts)
+        generation_time = finished - (first_token_at or finished)
+        metrics = {
+            "ttft_ms": round(((first_token_at or finished) - started) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1),
+            "completion_tokens": tokens,
+            "tokens_per_sec": round(tokens / generation_time, 2) if generation_time > 0 else None,
+        }
+
+        # 流结束后再落库；请求级的 db 会话此时可能已关闭，单独开一个
+        if session_id and answer:
+            async with get_async_sessionmaker()() as write_db:
+                write_db.add(ChatMessage(session_id=session_id, role="bot", content=answer))
+                await write_db.commit()
+            _refresh_summary_later(session_id)
+        yield _sse({"done": True, **metrics})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/sessions")
-async def get_sessions(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    sessions = db.query(ChatSession).filter(ChatSession.user_id == current_user.id).order_by(ChatSession.created_at.desc()).all()
+async def get_sessions(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """会话列表，消息条数和最后一条消息时间由一次聚合查询得到"""
+    stats = (
+        select(
+            ChatMessage.session_id,
+            func.count(ChatMessage.id).label("message_count"),
+            func.max(ChatMessage.created_at).label("last_message_at")
+        )
+        .group_by(ChatMessage.session_id)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(ChatSession, stats.c.message_count, stats.c.last_message_at)
+        .outerjoin(stats, stats.c.session_id == ChatSession.id)
+        .where(ChatSession.user_id == current_user.id)
+        .order_by(ChatSession.created_at.desc())
+    )).all()
     return [
-        {"id": s.id, "title": s.title, "created_at": s.created_at}
-        for s in sessions
+        {
+            "id": s.id,
+            "title": s.title,
+            "created_at": s.created_at,
+            "message_count": message_count or 0,
+            "last_message_at": last_message_at
+        }
+        for s, message_count, last_message_at in rows
     ]
 
+def _page_size(limit: Optional[int]) -> int:
+    return min(limit or settings.CHAT_MESSAGES_PAGE_SIZE, settings.CHAT_MESSAGES_MAX_PAGE_SIZE)
+
+async def _message_page(db: AsyncSession, session_id: int, limit: Optional[int], before: Optional[str]):
+    try:
+        return await list_messages(db, session_id, _page_size(limit), before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/sessions/{session_id}")
-async def get_session(session_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id).first()
+async def get_session(
+    session_id: int,
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    会话详情：不传 limit 时返回全部消息（兼容尚未分页加载的前端）；
+    传 limit 时只返回最近一页，更早的消息用 next_cursor 调用 /sessions/{id}/messages 获取
+    """
+    session = await _get_user_session(db, session_id, current_user)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
+    if limit is None:
+        messages, next_cursor = await list_messages(db, session.id, None)
+    else:
+        messages, next_cursor = await _message_page(db, session.id, limit, None)
     return {
         "id": session.id,
         "title": session.title,
         "created_at": session.created_at,
-        "messages": [
-            {"role": m.role, "content": m.content, "created_at": m.created_at}
-            for m in session.messages
-        ]
+        "messages": [_message_dict(m) for m in messages],
+        "next_cursor": next_cursor
     }
 
+@router.get("/sessions/{session_id}/messages")
+async def get_session_messages(
+    session_id: int,
+    before: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """按 (created_at, id) 游标向前翻页，每页按时间正序返回"""
+    session = await _get_user_session(db, session_id, current_user)
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    messages, next_cursor = await _message_page(db, session.id, limit, before)
+    return {"messages": [_message_dict(m) for m in messages], "next_cursor": next_cursor}
+
 @router.post("/sessions")
-async def create_session(title: str = "新会话", current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_session(title: str = "新会话", current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     session = ChatSession(user_id=current_user.id, title=title)
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    await db.commit()
+    await db.refresh(session)
     return {"id": session.id, "title": session.title, "created_at": session.created_at}
 
 class MessageRequest(BaseModel):
@@ -101,19 +249,21 @@ async def add_message(
     session_id: int,
     message: MessageRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     msg = ChatMessage(session_id=session_id, role=message.role, content=message.content)
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
+    await db.refresh(msg)
     return {"id": msg.id, "role": msg.role, "content": msg.content, "created_at": msg.created_at}
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id).first()
+async def delete_session(session_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    session = await _get_user_session(db, session_id, current_user)
     if not session:
         raise HTTPException(status_code=404, detail="会话不存在")
-    db.delete(session)
-    db.commit()
+    # 直接按 session_id 删除消息，不把整段历史加载进内存再逐条删除
+    await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session.id))
+    await db.execute(delete(ChatSession).where(ChatSession.id == session.id))
+    await db.commit()
     return {"msg": "会话已删除"}
\ No newline at end of file
@@ -1,10 +1,12 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from jose import JWTError
-from ..db.session import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.session import SessionLocal, get_async_sessionmaker
 from ..core.security import decode_access_token
 from ..models.user import User
+from ..schemas.user import TokenClaims, User as UserSchema
+from backend.app.services.user_cache import get_user_cache
 
 def get_db() -> Generator:
     db = SessionLocal()
@@ -13,20 +15,51 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """异步会话，async 接口中查询数据库不会阻塞事件循环"""
+    async with get_async_sessionmaker()() as db:
+        yield db
+
 async def get_current_user(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     token: dict = Depends(decode_access_token)
-) -> User:
-    print("Received token:", token)
+) -> UserSchema:
+    """
+    当前登录用户。先查进程内的用户缓存，未命中才查询数据库；
+    返回的是用户信息快照（schemas.user.User），只用于读取 id、role 等字段
+    """
+    try:
+        user_id = int(token["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的认证凭据"
+        )
+    cache = get_user_cache()
+    if cache is not None:
+        user = cache.get(user_id)
+        if user is not None:
+            return user
+    db_user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+    if not db_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="用户不存在"
+        )
+    user = UserSchema.model_validate(db_user)
+    if cache is not None:
+        cache.put(user)
+    return user
+
+def get_token_claims(token: dict = Depends(decode_access_token)) -> TokenClaims:
+    """
+    只解析 JWT 中的 sub 和 role，不访问数据库和用户缓存。
+    用于只需要校验身份/归属的高频接口（如轮询组卷任务进度）；
+    被删除用户的令牌在过期前仍然有效，涉及用户资料或管理操作的接口请使用 get_current_user
+    """
     try:
-        user = db.query(User).filter(User.id == token["sub"]).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="用户不存在"
-            )
-        return user
-    except JWTError:
+        return TokenClaims(id=int(token["sub"]), role=token["role"], username=token.get("username"))
+    except (KeyError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="无效的认证凭据"
@@ -34,5 +67,5 @@ async def get_current_user(
 
 # deps.py
 def get_vector_store():
-    from backend.app.main import vector_store
-    return vector_store
+    from backend.app.services.vector_store import get_vector_store_service
+    return get_vector_store_service()
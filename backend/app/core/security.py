@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Any, Union
+from typing import Any, Optional, Union
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -9,9 +9,12 @@ from ..core.config import settings
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def create_access_token(subject: Union[str, Any], role: str) -> str:
+def create_access_token(subject: Union[str, Any], role: str, username: Optional[str] = None) -> str:
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {"exp": expire, "sub": str(subject), "role": role}
+    if username:
+        # Django 端本地验签时直接从令牌读取用户名，无需回调 /auth/validate
+        to_encode["username"] = username
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
 
 def decode_access_token(token: str = Depends(oauth2_scheme)) -> dict:
@@ -9,13 +9,179 @@
 # )
 
 # SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+import threading
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from backend.app.core.config import settings
 from sqlalchemy.ext.declarative import declarative_base
 
-engine = create_engine(settings.DATABASE_URL)
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """每个新连接建立时设置：WAL 允许读写并发，busy_timeout 让写锁冲突时等待而不是立即报 database is locked"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+def build_engine(url: str) -> Engine:
+    """
+    按数据库类型创建引擎
+        - SQLite：允许跨线程使用连接（FastAPI 在线程池中执行同步依赖），连接建立时设置 WAL 等 PRAGMA；
+          内存数据库使用 StaticPool，所有会话共享同一个连接
+        - 其他（PostgreSQL 等）：连接池大小、溢出、回收时间和 pre-ping 均可配置
+    """
+    options = {"echo": settings.DB_ECHO}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(url).database in (None, "", ":memory:"):
+            options["poolclass"] = StaticPool
+        else:
+            options["pool_size"] = settings.DB_POOL_SIZE
+            options["max_overflow"] = settings.DB_MAX_OVERFLOW
+            options["pool_timeout"] = settings.DB_POOL_TIMEOUT
+        engine = create_engine(url, **options)
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return create_engine(url, **options)
+
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url: str = None) -> Engine:
+    """同一个数据库 URL 在进程内只创建一个引擎（一个连接池）"""
+    url = url or settings.DATABASE_URL
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = _engines[url] = build_engine(url)
+        return engine
+
+
+def engine_stats(engine: Engine = None) -> dict:
+    """连接池状态，供 /health 使用"""
+    engine = engine or get_engine()
+    pool = engine.pool
+    stats = {
+        "dialect": engine.dialect.name,
+        "pool": type(pool).__name__,
+    }
+    # QueuePool 才有以下统计
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    if engine.dialect.name == "sqlite":
+        stats["journal_mode"] = settings.SQLITE_JOURNAL_MODE
+        stats["busy_timeout_ms"] = settings.SQLITE_BUSY_TIMEOUT_MS
+        stats["synchronous"] = settings.SQLITE_SYNCHRONOUS
+    else:
+        stats["max_overflow"] = settings.DB_MAX_OVERFLOW
+        stats["pool_recycle"] = settings.DB_POOL_RECYCLE
+    return stats
+
+
+# 同步驱动 -> 对应的异步驱动
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_database_url(url: str = None) -> str:
+    """未单独配置 ASYNC_DATABASE_URL 时，由 DATABASE_URL 换成异步驱动得到"""
+    if settings.ASYNC_DATABASE_URL and url is None:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(url or settings.DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url.render_as_string(hide_password=False)
+
+
+def build_async_engine(url: str) -> AsyncEngine:
+    """与 build_engine 相同的连接池和 PRAGMA 设置，使用 aiosqlite / asyncpg"""
+    options = {"echo": settings.DB_ECHO}
+    if _is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(url).database in (None, "", ":memory:"):
+            options["poolclass"] = StaticPool
+        else:
+            # aiosqlite 默认不复用连接（NullPool），显式使用连接池，避免每次请求都重新打开文件、执行 PRAGMA
+            options["poolclass"] = AsyncAdaptedQueuePool
+            options["pool_size"] = settings.DB_POOL_SIZE
+            options["max_overflow"] = settings.DB_MAX_OVERFLOW
+            options["pool_timeout"] = settings.DB_POOL_TIMEOUT
+        async_engine = create_async_engine(url, **options)
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return async_engine
+
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return create_async_engine(url, **options)
+
+
+_async_engine: Optional[AsyncEngine] = None
+_async_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def get_async_engine() -> AsyncEngine:
+    """异步引擎在首次使用时创建，未安装异步驱动时不影响同步代码路径"""
+    global _async_engine
+    if _async_engine is None:
+        with _engines_lock:
+            if _async_engine is None:
+                _async_engine = build_async_engine(async_database_url())
+    return _async_engine
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        # 提交后不过期对象，避免在 async 代码中访问属性时触发隐式 IO
+        _async_sessionmaker = async_sessionmaker(
+            get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _async_sessionmaker
+
+
+def async_engine_stats() -> Optional[dict]:
+    return engine_stats(_async_engine.sync_engine) if _async_engine is not None else None
+
+
+async def dispose_async_engine() -> None:
+    """应用关闭时释放异步连接池"""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_sessionmaker = None
+
+
+engine = get_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -28,4 +194,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
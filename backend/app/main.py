@@ -6,37 +6,22 @@ from fastapi.middleware.cors import CORSMiddleware
 # from app.models.base import Base
 from backend.app.core.config import settings
 from backend.app.api.endpoints import exam, auth
-from backend.app.db.session import engine
+from backend.app.db.session import async_engine_stats, dispose_async_engine, engine, engine_stats
 from backend.app.models.base import Base
+from backend.app.services.embedding_cache import get_embedding_cache
+from backend.app.services.semantic_cache import get_semantic_cache
+from backend.app.services.retrieval_cache import get_retrieval_cache
+from backend.app.services.course_index import get_course_index_registry
+from backend.app.services.user_cache import get_user_cache
+from backend.app.services.exam_jobs import start_worker, stop_worker
+from utils.model_client import ChatGLMClient, close_http_clients
+from utils import structured_output
 import math
 
-from langchain.embeddings.base import Embeddings
-from zhipuai import ZhipuAI
-
 import nltk
 nltk.data.path.append('/home/laurentzhu/nltk_data')
 
 
-class ZhipuAIEmbeddings(Embeddings):
-    def __init__(self, api_key: str, model: str = "embedding-3"):
-        self.client = ZhipuAI(api_key=api_key)
-        self.model = model
-
-    def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        all_embeddings = []
-        batch_size = 64
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            response = self.client.embeddings.create(model=self.model, input=batch)
-            embeddings = [item.embedding for item in response.data]  # 这里改了
-            all_embeddings.extend(embeddings)
-        return all_embeddings
-
-    def embed_query(self, text: str) -> list[float]:
-        response = self.client.embeddings.create(model=self.model, input=[text])
-        return response.data[0].embedding
-
-
 
 
 app = FastAPI(
@@ -84,47 +69,39 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
-
-from langchain_community.document_loaders import UnstructuredWordDocumentLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import os
-
-def load_knowledge_base(directory: str):
-    # print(f"扫描目录: {os.path.abspath(directory)}")  # 添加这行
-    # print(f"目录内容: {os.listdir(directory)}")      # 添加这行
-    """加载知识库中的 .docx 文件"""
-    documents = []
-    for filename in os.listdir(directory):
-        # print(f"正在处理文件: {filename}")
-        if filename.endswith(".docx"):
-            # print(f"加载 .docx 文件: {filename}") 
-            loader = UnstructuredWordDocumentLoader(os.path.join(directory, filename))
-            doc = loader.load()
-            documents.extend(doc)
-    # 分割文档内容
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    split_docs = text_splitter.split_documents(documents)
-    print(f"共加载 {len(documents)} 个文档块")
-
-    return split_docs
-
-from langchain_community.vectorstores import FAISS
-
-def build_vector_store(documents):
-    """构建向量存储"""
-    # embeddings = embed_documents_with_zhipuai(documents)
-    embeddings = ZhipuAIEmbeddings(api_key=os.getenv("ZHIPU_API_KEY"))
-    vector_store = FAISS.from_texts([doc.page_content for doc in documents], embeddings)
-    return vector_store
+    semantic_cache = get_semantic_cache()
+    retrieval_cache = get_retrieval_cache()
+    user_cache = get_user_cache()
+    return {
+        "status": "ok",
+        "embedding_cache": get_embedding_cache().stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "retrieval_cache": retrieval_cache.stats() if retrieval_cache else None,
+        "user_cache": user_cache.stats() if user_cache else None,
+        "database": engine_stats(engine),
+        "async_database": async_engine_stats(),
+        "vector_store": vector_store.stats(),
+        "course_indexes": get_course_index_registry().stats(),
+        "llm": ChatGLMClient.stats(),
+        "structured_output": structured_output.stats()
+    }
+
+@app.on_event("startup")
+async def start_exam_job_worker():
+    if settings.EXAM_JOB_WORKER_ENABLED:
+        start_worker()
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    await stop_worker()
+    await close_http_clients()
+    await dispose_async_engine()
+
+from backend.app.services.vector_store import get_vector_store_service
 
 def initialize_knowledge_base():
-    """初始化知识库"""
-    # print("=== 初始化知识库（调试）===")
-    knowledge_directory = "./knowledge/mooc"  # 知识库目录
-    documents = load_knowledge_base(knowledge_directory)
-    vector_store = build_vector_store(documents)
-    return vector_store
+    """初始化知识库：增量同步磁盘索引后加载，进程内共享同一个向量服务"""
+    return get_vector_store_service()
 
 vector_store = initialize_knowledge_base()
 
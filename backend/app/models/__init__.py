@@ -1,4 +1,5 @@
 from .user import User
 from .course import Course
 from .exam import Exam, Question
-from .chat import ChatSession, ChatMessage
\ No newline at end of file
+from .chat import ChatSession, ChatMessage
+from .exam_job import ExamJob
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship, Mapped
 from datetime import datetime
 from backend.app.db.base_class import Base
@@ -9,6 +9,8 @@ class ChatSession(Base):
     user_id: Mapped[int] = Column(Integer, ForeignKey("users.id"))
     title: Mapped[str] = Column(String(100), default="新会话")
     created_at: Mapped[datetime] = Column(DateTime, default=datetime.utcnow)
+    summary: Mapped[str] = Column(Text, nullable=True)  # 较早对话的滚动摘要
+    summary_until_id: Mapped[int] = Column(Integer, nullable=True)  # 已折叠进摘要的最后一条消息 id
     messages: Mapped[list["ChatMessage"]] = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
 
 class ChatMessage(Base):
@@ -19,3 +21,8 @@ class ChatMessage(Base):
     content: Mapped[str] = Column(Text)
     created_at: Mapped[datetime] = Column(DateTime, default=datetime.utcnow)
     session: Mapped["ChatSession"] = relationship("ChatSession", back_populates="messages")
+
+    __table_args__ = (
+        # 按会话取最近消息、游标翻页都走这个索引
+        Index("ix_chat_messages_session_id_created_at", "session_id", "created_at"),
+    )
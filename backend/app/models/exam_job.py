@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy.orm import Mapped
+from datetime import datetime
+from backend.app.db.base_class import Base
+
+class ExamJob(Base):
+    """异步组卷任务，状态持久化在数据库中，多个 worker 进程共享"""
+    __tablename__ = "exam_jobs"
+
+    id: Mapped[str] = Column(String(36), primary_key=True)
+    user_id: Mapped[int] = Column(Integer, ForeignKey("users.id"), index=True)
+    idempotency_key: Mapped[str] = Column(String(64), index=True)
+    status: Mapped[str] = Column(String(20), default="pending", index=True)  # pending/running/succeeded/failed/cancelled
+    request: Mapped[str] = Column(Text, nullable=False)  # ExamGenerateRequest 的 JSON
+    progress: Mapped[str] = Column(Text, nullable=True)  # 各题型已完成/总题数的 JSON
+    result: Mapped[str] = Column(Text, nullable=True)  # ExamCreate 的 JSON
+    error: Mapped[str] = Column(Text, nullable=True)
+    cancel_requested: Mapped[bool] = Column(Boolean, default=False)
+    attempts: Mapped[int] = Column(Integer, default=0)
+    worker_id: Mapped[str] = Column(String(64), nullable=True)
+    created_at: Mapped[datetime] = Column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[datetime] = Column(DateTime, nullable=True)
+    finished_at: Mapped[datetime] = Column(DateTime, nullable=True)
+    heartbeat_at: Mapped[datetime] = Column(DateTime, nullable=True)
@@ -68,6 +68,17 @@ class ExamGenerateRequest(BaseModel):
     exam_title: Optional[str] = None
     extra_context: Optional[str] = None
 
+class ExamJobStatus(BaseModel):
+    job_id: str
+    status: str  # pending/running/succeeded/failed/cancelled
+    progress: Dict[str, Dict[str, int]]  # {题型: {"done": 已完成, "total": 总题数}}
+    completed: int
+    total: int
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class ExamUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
@@ -15,4 +15,10 @@ class User(UserBase):
     created_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class TokenClaims(BaseModel):
+    """只来自 JWT 的身份信息，不查数据库"""
+    id: int
+    role: str
+    username: Optional[str] = None
@@ -0,0 +1,163 @@
+"""
+知识库近似最近邻（ANN）索引
+
+index.faiss 始终是精确的 Flat 索引，增量同步（删除/追加分块）在它上面进行；
+VECTOR_INDEX_TYPE 不为 flat 时，每次同步后再由它派生一份 ANN 索引供检索使用，
+两者的向量顺序一致，共用同一个 index.pkl（docstore 与位置 -> id 映射）。
+
+    类型        每个向量的存储                  说明
+    flat        4 * d 字节                      精确检索，耗时与分块数成正比
+    ivf_flat    4 * d 字节                      倒排分桶，只搜索 nprobe 个桶
+    ivf_pq      pq_m * pq_nbits / 8 字节        乘积量化压缩，d=2048、pq_m=64 时每个向量 64 字节（Flat 为 8KB）
+    hnsw        4 * d + 约 8 * hnsw_m 字节      图索引，延迟最低，内存比 Flat 略高
+
+IVF 类索引在抽样的向量上训练（VECTOR_INDEX_TRAIN_SAMPLE），nlist 默认取 4 * sqrt(分块数)；
+检索时的 nprobe / efSearch 只影响查询，修改后不需要重建索引。
+ivf_pq 的距离是量化后的近似值，召回偏低；VECTOR_INDEX_PQ_REFINE > 0 时先取 k * refine 个候选，
+再用 index.faiss 中的原始向量计算精确距离重新排序，返回的距离与追加段的精确 L2 距离可比。
+重排需要把 index.faiss 整份读入进程内存，常驻内存是 PQ 编码加上 Flat 向量；只在意内存时关闭重排。
+
+加载方式（faiss 1.7.x）：IO_FLAG_MMAP 只对 IVF 索引的倒排表生效，ivf_flat / ivf_pq 的倒排表以 mmap
+只读方式打开，多个 worker 共用页缓存；Flat 和 HNSW 索引总是完整读入每个进程的堆内存，
+多 worker 部署时各自持有一份。
+分块数少于 VECTOR_INDEX_MIN_CHUNKS 时精确检索已经足够快，不派生 ANN 索引。
+"""
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from backend.app.core.config import settings
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+ADD_BATCH_SIZE = 65536
+
+
+def ann_params(index_type: Optional[str] = None) -> dict:
+    """影响索引结构的参数，写入 manifest；变化时需要重新派生 ANN 索引"""
+    index_type = index_type or settings.VECTOR_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}，可选 {', '.join(INDEX_TYPES)}")
+    if index_type == "flat":
+        return {"type": "flat"}
+    if index_type == "hnsw":
+        return {
+            "type": "hnsw",
+            "hnsw_m": settings.VECTOR_INDEX_HNSW_M,
+            "ef_construction": settings.VECTOR_INDEX_EF_CONSTRUCTION,
+        }
+    params = {"type": index_type, "nlist": settings.VECTOR_INDEX_NLIST}
+    if index_type == "ivf_pq":
+        params.update(pq_m=settings.VECTOR_INDEX_PQ_M, pq_nbits=settings.VECTOR_INDEX_PQ_NBITS)
+    return params
+
+
+def auto_nlist(ntotal: int) -> int:
+    """常用经验值 4 * sqrt(n)，同时保证每个桶至少有约 39 个训练样本"""
+    return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+
+def build_ann_index(flat: faiss.Index, params: dict, train_sample: Optional[int] = None) -> faiss.Index:
+    """由精确索引派生 ANN 索引，按原顺序加入全部向量"""
+    d, ntotal = flat.d, flat.ntotal
+    index_type = params["type"]
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = params.get("nlist") or auto_nlist(ntotal)
+        quantizer = faiss.IndexFlatL2(d)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist)
+        else:
+            if d % params["pq_m"]:
+                raise ValueError(f"向量维度 {d} 不能被 VECTOR_INDEX_PQ_M={params['pq_m']} 整除")
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, params["pq_m"], params["pq_nbits"])
+        sample = min(ntotal, train_sample or settings.VECTOR_INDEX_TRAIN_SAMPLE)
+        ids = np.sort(np.random.default_rng(0).choice(ntotal, sample, replace=False))
+        index.train(flat.reconstruct_batch(ids))
+    else:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+
+    for start in range(0, ntotal, ADD_BATCH_SIZE):
+        index.add(flat.reconstruct_n(start, min(ADD_BATCH_SIZE, ntotal - start)))
+    return index
+
+
+def apply_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """设置查询参数：IVF 的 nprobe、HNSW 的 efSearch，对 Flat 索引无影响"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or settings.VECTOR_INDEX_NPROBE, ivf.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or settings.VECTOR_INDEX_EF_SEARCH
+
+
+def read_flags(index_type: Optional[str]) -> int:
+    """IVF 索引的倒排表可以 mmap；其他类型传入 IO_FLAG_MMAP 也会完整读入内存，按普通方式读取"""
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return 0
+
+
+def needs_refine(index: faiss.Index, k_factor: Optional[int] = None) -> bool:
+    """ivf_pq 且 k_factor 不为 0 时需要精确向量重排"""
+    k_factor = settings.VECTOR_INDEX_PQ_REFINE if k_factor is None else k_factor
+    ivf = faiss.try_extract_index_ivf(index)
+    return bool(k_factor) and ivf is not None and isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ)
+
+
+def with_refine(index: faiss.Index, flat: faiss.Index, k_factor: Optional[int] = None) -> faiss.Index:
+    """ivf_pq 的候选用精确向量重新排序；其他类型或 k_factor 为 0 时原样返回"""
+    k_factor = settings.VECTOR_INDEX_PQ_REFINE if k_factor is None else k_factor
+    if not needs_refine(index, k_factor):
+        return index
+    refined = faiss.IndexRefine(index, flat)
+    refined.k_factor = k_factor
+    # 保持底层索引的 Python 引用，避免被提前回收
+    refined.referenced_objects = [index, flat]
+    return refined
+
+
+def search_params(index: faiss.Index) -> dict:
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = {"nlist": ivf.nlist, "nprobe": ivf.nprobe}
+        if isinstance(index, faiss.IndexRefine):
+            params["refine_k_factor"] = index.k_factor
+        return params
+    if isinstance(index, faiss.IndexHNSW):
+        return {"ef_search": index.hnsw.efSearch}
+    return {}
+
+
+def write_ann_index(flat: faiss.Index, index_dir: str, index_name: str) -> dict:
+    """
+    按当前配置派生并写入 ANN 索引，返回写入 manifest 的描述：
+        {"params": 索引参数, "file": ANN 索引文件名（未派生时为 None）, "ntotal": 向量数}
+    """
+    params = ann_params()
+    entry = {"params": params, "file": None, "ntotal": flat.ntotal}
+    # 清理其他类型留下的 ANN 索引文件（已 mmap 的进程不受影响）
+    for index_type in INDEX_TYPES[1:]:
+        if index_type != params["type"]:
+            stale = os.path.join(index_dir, f"{index_name}.{index_type}.faiss")
+            if os.path.exists(stale):
+                os.remove(stale)
+    if params["type"] == "flat":
+        return entry
+    if flat.ntotal < settings.VECTOR_INDEX_MIN_CHUNKS:
+        print(f"分块数 {flat.ntotal} 少于 VECTOR_INDEX_MIN_CHUNKS，继续使用精确索引")
+        return entry
+
+    index = build_ann_index(flat, params)
+    filename = f"{index_name}.{params['type']}.faiss"
+    path = os.path.join(index_dir, filename)
+    # 先写临时文件再替换，已 mmap 旧文件的进程不受影响
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    entry["file"] = filename
+    print(f"已派生 {params['type']} 索引: {filename}，共 {flat.ntotal} 个向量")
+    return entry
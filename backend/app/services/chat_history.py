@@ -0,0 +1,58 @@
+"""
+会话消息查询
+
+消息按 (created_at, id) 排序，id 用于区分同一时刻写入的消息。
+所有查询都由数据库完成过滤和 LIMIT，配合 chat_messages(session_id, created_at) 复合索引，
+耗时只与取回的条数有关，不随会话消息总数增长。
+
+分页采用 keyset（游标）方式：游标编码上一页最早一条消息的 (created_at, id)，
+下一页取严格早于它的消息，不使用 OFFSET，翻页过程中有新消息写入也不会重复或遗漏。
+"""
+import base64
+import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.models.chat import ChatMessage
+
+
+def encode_cursor(message: ChatMessage) -> str:
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """游标格式错误时抛出 ValueError"""
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(message_id)
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+
+async def list_messages(
+    db: AsyncSession,
+    session_id: int,
+    limit: Optional[int],
+    before: Optional[str] = None
+) -> Tuple[List[ChatMessage], Optional[str]]:
+    """
+    取早于游标的最近 limit 条消息（不传游标则从最新一条开始），按时间正序返回
+    第二个返回值是再往前翻一页的游标，没有更早的消息时为 None；limit 为 None 时返回全部消息
+    """
+    query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if before:
+        query = query.where(tuple_(ChatMessage.created_at, ChatMessage.id) < decode_cursor(before))
+    if limit is None:
+        rows = (await db.execute(query.order_by(ChatMessage.created_at, ChatMessage.id))).scalars().all()
+        return list(rows), None
+    # 多取一条判断是否还有更早的消息
+    rows = (await db.execute(
+        query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1)
+    )).scalars().all()
+    has_more = len(rows) > limit
+    messages = list(reversed(rows[:limit]))
+    return messages, (encode_cursor(messages[0]) if has_more else None)
+
@@ -0,0 +1,207 @@
+"""
+问答对话记忆：按 token 预算拼装历史和检索内容，较早的对话折叠为滚动摘要
+
+每轮问答的提示词由以下部分组成，各部分都有上限，提示词大小不随对话轮数和单轮长度增长：
+    - 滚动摘要：不超过 QA_SUMMARY_MAX_TOKENS
+    - 最近对话：从最新一轮往前取，直到 QA_HISTORY_TOKEN_BUDGET 用完，单轮超过 QA_TURN_MAX_TOKENS 时截断
+    - 检索内容：按相关度顺序放入，直到总预算 QA_PROMPT_TOKEN_BUDGET 用完
+
+摘要保存在 chat_sessions.summary，summary_until_id 记录已折叠进摘要的最后一条消息。
+会话中尚未折叠的消息超过历史预算（或条数上限）时，问答结束后在后台把最早的一批消息
+连同旧摘要交给模型生成新摘要；写回时校验 summary_until_id 未被其他请求改动，避免并发覆盖。
+
+token 数为估算值：没有可用的 GLM 分词器，按中日韩字符每字 1 个、其他字符每 4 个 1 个计算，
+对中文略偏保守，用于预算控制足够。
+"""
+import asyncio
+import math
+import re
+from typing import List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.core.config import settings
+from backend.app.db.session import get_async_sessionmaker
+from backend.app.models.chat import ChatMessage, ChatSession
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+SUMMARY_SYSTEM_PROMPT = "你是一个对话摘要助手，负责把学生与学习助手的对话压缩成简洁的摘要。"
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """保留开头不超过 max_tokens 的部分，截断时以省略号结尾"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    cost = 0.0
+    for i, ch in enumerate(text):
+        cost += 1 if _CJK.match(ch) else 0.25
+        if cost > max_tokens - 1:
+            return text[:i] + "…"
+    return text
+
+
+def format_turn(turn: dict) -> str:
+    speaker = "学生" if turn["role"] == "user" else "助手"
+    return f"{speaker}：{turn['content']}\n"
+
+
+class ConversationMemory:
+    """在 token 预算内挑选摘要、历史对话和检索内容"""
+
+    def __init__(
+        self,
+        prompt_budget: int = None,
+        history_budget: int = None,
+        summary_max_tokens: int = None,
+        turn_max_tokens: int = None
+    ):
+        self.prompt_budget = prompt_budget or settings.QA_PROMPT_TOKEN_BUDGET
+        self.history_budget = history_budget or settings.QA_HISTORY_TOKEN_BUDGET
+        self.summary_max_tokens = summary_max_tokens or settings.QA_SUMMARY_MAX_TOKENS
+        self.turn_max_tokens = turn_max_tokens or settings.QA_TURN_MAX_TOKENS
+
+    def fit_history(self, history: Optional[Sequence[dict]], summary: Optional[str] = None) -> str:
+        """摘要 + 从最新一轮往前放入的历史对话，按时间正序拼成文本"""
+        budget = self.history_budget
+        lines: List[str] = []
+        for turn in reversed(list(history or [])):
+            line = format_turn({**turn, "content": truncate_tokens(turn["content"], self.turn_max_tokens)})
+            cost = count_tokens(line)
+            if cost > budget:
+                break
+            lines.append(line)
+            budget -= cost
+        lines.reverse()
+        if summary:
+            lines.insert(0, f"（更早的对话摘要）{truncate_tokens(summary, self.summary_max_tokens)}\n")
+        return "".join(lines)
+
+    def fit_context(self, documents: Sequence[str], used_tokens: int) -> str:
+        """按相关度顺序放入检索内容，超出剩余预算的文档截断后停止"""
+        budget = self.prompt_budget - used_tokens
+        parts: List[str] = []
+        for doc in documents:
+            if budget <= 0:
+                break
+            cost = count_tokens(doc)
+            if cost > budget:
+                parts.append(truncate_tokens(doc, budget))
+                break
+            parts.append(doc)
+            budget -= cost
+        return "\n".join(parts)
+
+
+async def load_memory(db: AsyncSession, session: ChatSession) -> Tuple[Optional[str], List[dict]]:
+    """会话的滚动摘要和尚未折叠进摘要的最近消息（按时间正序）"""
+    query = select(ChatMessage).where(ChatMessage.session_id == session.id)
+    if session.summary_until_id:
+        query = query.where(ChatMessage.id > session.summary_until_id)
+    rows = (await db.execute(
+        query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(settings.CHAT_HISTORY_MESSAGES)
+    )).scalars().all()
+    return session.summary, [{"role": m.role, "content": m.content} for m in reversed(rows)]
+
+
+def _select_messages_to_fold(messages: Sequence[ChatMessage]) -> List[ChatMessage]:
+    """
+    未折叠的消息超过历史预算或条数上限时，从最早的开始折叠，直到剩余部分回到预算的一半以内；
+    一次折叠的内容不超过历史预算，摘要请求本身的大小也有上限
+    """
+    tokens = [count_tokens(m.content) for m in messages]
+    remaining = sum(tokens)
+    count = len(messages)
+    if remaining <= settings.QA_HISTORY_TOKEN_BUDGET and count <= settings.CHAT_HISTORY_MESSAGES:
+        return []
+    folded, folded_tokens = [], 0
+    for message, cost in zip(messages, tokens):
+        if remaining <= settings.QA_HISTORY_TOKEN_BUDGET // 2 and count <= settings.CHAT_HISTORY_MESSAGES // 2:
+            break
+        if folded and folded_tokens + min(cost, settings.QA_TURN_MAX_TOKENS) > settings.QA_HISTORY_TOKEN_BUDGET:
+            break
+        folded.append(message)
+        folded_tokens += min(cost, settings.QA_TURN_MAX_TOKENS)
+        remaining -= cost
+        count -= 1
+    return folded
+
+
+async def summarize(client, summary: Optional[str], turns: Sequence[dict]) -> str:
+    conversation = "".join(
+        format_turn({**t, "content": truncate_tokens(t["content"], settings.QA_TURN_MAX_TOKENS)}) for t in turns
+    )
+    prompt = f"""
+请把【已有摘要】和【新增对话】合并为一份新的对话摘要，保留学生的学习目标、已讨论的知识点、结论和尚未解决的问题，
+不超过{settings.QA_SUMMARY_MAX_TOKENS}字，直接输出摘要内容。
+
+【已有摘要】：
+{summary or "无"}
+
+【新增对话】：
+{conversation}
+"""
+    response = await client.generate_text(prompt, system_prompt=SUMMARY_SYSTEM_PROMPT)
+    return truncate_tokens(response.strip(), settings.QA_SUMMARY_MAX_TOKENS)
+
+
+async def refresh_summary(db: AsyncSession, session_id: int, client) -> bool:
+    """需要时把最早的一批未折叠消息并入摘要，返回是否更新了摘要"""
+    session = await db.get(ChatSession, session_id)
+    if session is None:
+        return False
+    watermark = session.summary_until_id
+    query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if watermark:
+        query = query.where(ChatMessage.id > watermark)
+    # 历史很长的旧会话分多轮逐步折叠，每次只读有限条数
+    messages = (await db.execute(
+        query.order_by(ChatMessage.created_at, ChatMessage.id).limit(settings.CHAT_HISTORY_MESSAGES * 4)
+    )).scalars().all()
+    folded = _select_messages_to_fold(messages)
+    if not folded:
+        return False
+
+    new_summary = await summarize(
+        client, session.summary, [{"role": m.role, "content": m.content} for m in folded]
+    )
+    result = await db.execute(
+        update(ChatSession)
+        .where(
+            ChatSession.id == session_id,
+            ChatSession.summary_until_id.is_(None) if watermark is None else ChatSession.summary_until_id == watermark
+        )
+        .values(summary=new_summary, summary_until_id=folded[-1].id)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+# 后台任务需要保持引用，否则可能在完成前被回收
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def schedule_summary_refresh(session_id: int, client) -> None:
+    """问答结束后在后台更新摘要，不占用本次请求的响应时间"""
+    if not settings.CHAT_SUMMARY_ENABLED:
+        return
+
+    async def run():
+        try:
+            async with get_async_sessionmaker()() as db:
+                if await refresh_summary(db, session_id, client):
+                    print(f"会话 {session_id} 的对话摘要已更新")
+        except Exception as e:
+            print(f"会话 {session_id} 的对话摘要更新失败: {str(e)}")
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
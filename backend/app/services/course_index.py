@@ -0,0 +1,189 @@
+"""
+按课程分片的知识库索引
+
+共享知识库（KNOWLEDGE_BASE_DIR）包含所有课程的资料，每次检索都要在全部分块中查找，
+整份索引也必须常驻内存。课程自己的资料放在 COURSE_KNOWLEDGE_DIR/<课程id>/ 下，
+构建为独立的分片（COURSE_VECTOR_STORE_DIR/<课程id>/），组卷时只检索该课程的分片：
+
+    python -m backend.app.services.knowledge_base --course 3
+
+没有分片的课程继续使用共享知识库；教师组卷时补充的 extra_context 写入本次检索所用的向量库，
+即课程有分片时只进入该课程的追加段，不会出现在其他课程的检索结果中。
+
+分片在首次使用时加载（读入已构建的索引、回放追加日志），加载过程不做向量化：
+课程有资料但还没有构建索引时，本次请求使用共享知识库，同时在后台线程增量构建分片
+（COURSE_INDEX_BACKGROUND_BUILD 关闭时只能用上面的命令构建）；已加载分片的资料有变化时同样在后台同步，
+构建完成后分片在下一次检索时自动重新加载。
+常驻的分片按最近使用顺序（LRU）管理，
+分片数超过 COURSE_INDEX_CACHE_MAX_SHARDS 或估算内存超过 COURSE_INDEX_CACHE_MAX_MB 时淘汰最久未用的分片。
+被淘汰的分片只是释放引用，正在使用它的请求不受影响，下次访问时重新加载。
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from backend.app.core.config import settings
+from backend.app.services.knowledge_base import (
+    MANIFEST_NAME,
+    get_embeddings,
+    has_source_files,
+    index_is_current,
+    load_or_build_vector_store,
+)
+from backend.app.services.vector_store import APPEND_LOG_NAME, VectorStoreService, get_vector_store_service
+
+
+def course_source_dir(course_id: int) -> str:
+    return os.path.join(settings.COURSE_KNOWLEDGE_DIR, str(course_id))
+
+
+def course_index_dir(course_id: int) -> str:
+    return os.path.join(settings.COURSE_VECTOR_STORE_DIR, str(course_id))
+
+
+def has_course_shard(course_id: int) -> bool:
+    """课程已经有构建好的索引或追加内容，可以直接加载"""
+    index_dir = course_index_dir(course_id)
+    return (
+        os.path.exists(os.path.join(index_dir, MANIFEST_NAME))
+        or os.path.exists(os.path.join(index_dir, APPEND_LOG_NAME))
+    )
+
+
+class CourseIndexRegistry:
+    """课程分片的懒加载 LRU 缓存"""
+
+    def __init__(self, max_shards: int = 32, max_bytes: int = 2048 * 2 ** 20):
+        self.max_shards = max_shards
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._shards: "OrderedDict[int, VectorStoreService]" = OrderedDict()
+        # 同一课程的并发首次访问只加载一次，不同课程的加载互不阻塞
+        self._load_locks: Dict[int, threading.Lock] = {}
+        self._building: Set[int] = set()
+        self._embeddings = None
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _resident_bytes(self) -> int:
+        return sum(shard.resident_bytes() for shard in self._shards.values())
+
+    def _evict(self) -> None:
+        # 至少保留最近使用的一个分片，单个分片超过上限时也能正常检索
+        while len(self._shards) > 1 and (
+            len(self._shards) > self.max_shards or self._resident_bytes() > self.max_bytes
+        ):
+            course_id, _ = self._shards.popitem(last=False)
+            self.evictions += 1
+            print(f"课程 {course_id} 的索引分片已从内存淘汰")
+
+    def _get_embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def _open(self, course_id: int) -> VectorStoreService:
+        return VectorStoreService(
+            course_index_dir(course_id),
+            course_source_dir(course_id),
+            embeddings=self._get_embeddings(),
+            name=f"course:{course_id}",
+        ).open(build=False)
+
+    def build_in_background(self, course_id: int) -> None:
+        """在后台线程增量构建课程分片，同一课程同时只有一个构建线程"""
+        if not settings.COURSE_INDEX_BACKGROUND_BUILD or not has_source_files(course_source_dir(course_id)):
+            return
+        with self._lock:
+            if course_id in self._building:
+                return
+            self._building.add(course_id)
+        threading.Thread(
+            target=self._build, args=(course_id,), name=f"course-index-{course_id}", daemon=True
+        ).start()
+
+    def _build(self, course_id: int) -> None:
+        source_dir, index_dir = course_source_dir(course_id), course_index_dir(course_id)
+        try:
+            embeddings = self._get_embeddings()
+            embedding_model = getattr(embeddings, "model", embeddings.__class__.__name__)
+            if not index_is_current(source_dir, index_dir, embedding_model):
+                print(f"开始后台构建课程 {course_id} 的索引分片")
+                load_or_build_vector_store(source_dir, index_dir, embeddings)
+                print(f"课程 {course_id} 的索引分片构建完成")
+        except Exception as e:
+            print(f"课程 {course_id} 的索引分片构建失败: {e}")
+        finally:
+            with self._lock:
+                self._building.discard(course_id)
+
+    def get(self, course_id: int) -> Optional[VectorStoreService]:
+        """返回课程分片，必要时加载；分片尚未构建时返回 None（有资料时在后台开始构建）"""
+        with self._lock:
+            shard = self._shards.get(course_id)
+            if shard is not None:
+                self._shards.move_to_end(course_id)
+                self.hits += 1
+                return shard
+            load_lock = self._load_locks.setdefault(course_id, threading.Lock())
+
+        if not has_course_shard(course_id):
+            self.build_in_background(course_id)
+            return None
+        loaded = False
+        with load_lock:
+            with self._lock:
+                shard = self._shards.get(course_id)
+            if shard is None:
+                shard = self._open(course_id)
+                loaded = True
+                with self._lock:
+                    self._shards[course_id] = shard
+                    self.loads += 1
+                    self._evict()
+        if loaded:
+            # 资料在上次构建后有变化时后台同步
+            self.build_in_background(course_id)
+        return shard
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident_shards": list(self._shards),
+                "resident_mb": round(self._resident_bytes() / 2 ** 20, 1),
+                "max_shards": self.max_shards,
+                "max_mb": round(self.max_bytes / 2 ** 20, 1),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "building": sorted(self._building),
+            }
+
+
+_registry: Optional[CourseIndexRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_course_index_registry() -> CourseIndexRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CourseIndexRegistry(
+                    max_shards=settings.COURSE_INDEX_CACHE_MAX_SHARDS,
+                    max_bytes=settings.COURSE_INDEX_CACHE_MAX_MB * 2 ** 20,
+                )
+    return _registry
+
+
+def get_course_vector_store(course_id: Optional[int]) -> VectorStoreService:
+    """课程有分片时返回课程分片，否则返回共享知识库"""
+    if course_id is not None:
+        shard = get_course_index_registry().get(course_id)
+        if shard is not None:
+            return shard
+    return get_vector_store_service()
@@ -0,0 +1,219 @@
+"""
+向量缓存：按 (模型, 归一化文本哈希) 缓存 embedding 结果
+
+两级缓存：
+    - 进程内 LRU（默认 2048 条），命中时不产生任何 IO
+    - SQLite 持久层（WAL 模式），多个 worker 进程共享，重启后仍然有效
+持久层条数超过上限时按淘汰策略（lru / fifo）批量删除最旧的记录。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from backend.app.core.config import settings
+
+EVICTION_POLICIES = ("lru", "fifo")
+
+
+def normalize_text(text: str) -> str:
+    """全角/半角统一，合并连续空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_size: int = 2048,
+        max_entries: int = 200000,
+        eviction: str = "lru"
+    ):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"未知的缓存淘汰策略: {eviction}，可选: {EVICTION_POLICIES}")
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.eviction = eviction
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._writes_since_evict = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---------- SQLite 持久层 ----------
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """按进程懒加载连接，fork 出的 worker 会重新打开自己的连接"""
+        if not self.path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings (last_access)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_embeddings_created_at ON embeddings (created_at)"
+            )
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _disk_get(self, keys: List[str]) -> Dict[str, List[float]]:
+        conn = self._connection()
+        if conn is None or not keys:
+            return {}
+        found = {}
+        # SQLite 默认最多 999 个绑定参数
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        if found and self.eviction == "lru":
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(now, key) for key in found]
+            )
+            conn.commit()
+        return found
+
+    def _disk_put(self, items: Dict[str, List[float]]) -> None:
+        conn = self._connection()
+        if conn is None or not items:
+            return
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_access) VALUES (?, ?, ?, ?)",
+            [(key, array("f", vector).tobytes(), now, now) for key, vector in items.items()]
+        )
+        conn.commit()
+        self._writes_since_evict += len(items)
+        # 不必每次写入都统计总数，累计写入一定量后再检查
+        if self._writes_since_evict >= max(1, self.max_entries // 100):
+            self._writes_since_evict = 0
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if total <= self.max_entries:
+            return
+        # 一次多删 10%，避免在上限附近反复触发
+        overflow = total - int(self.max_entries * 0.9)
+        order_column = "last_access" if self.eviction == "lru" else "created_at"
+        conn.execute(
+            f"DELETE FROM embeddings WHERE key IN ("
+            f"SELECT key FROM embeddings ORDER BY {order_column} ASC LIMIT ?)",
+            (overflow,)
+        )
+        conn.commit()
+
+    # ---------- 对外接口 ----------
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """批量查询，未命中的位置返回 None"""
+        keys = [cache_key(model, text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                found = self._disk_get(list(missing))
+                for key, positions in missing.items():
+                    vector = found.get(key)
+                    if vector is None:
+                        self.misses += len(positions)
+                        continue
+                    self.disk_hits += len(positions)
+                    self._remember(key, vector)
+                    for i in positions:
+                        results[i] = vector
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        items = {cache_key(model, text): vector for text, vector in zip(texts, vectors)}
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            self._disk_put(items)
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM embeddings")
+                conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_size": self.memory_size,
+            "max_entries": self.max_entries,
+            "eviction": self.eviction,
+        }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """进程内共享的向量缓存（持久层由各 worker 共用同一个 SQLite 文件）"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            path=settings.EMBEDDING_CACHE_PATH or None,
+            memory_size=settings.EMBEDDING_CACHE_MEMORY_SIZE,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            eviction=settings.EMBEDDING_CACHE_EVICTION,
+        )
+    return _embedding_cache
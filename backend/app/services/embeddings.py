@@ -0,0 +1,52 @@
+from typing import Optional
+
+from langchain.embeddings.base import Embeddings
+from zhipuai import ZhipuAI
+
+from backend.app.services.embedding_cache import EmbeddingCache, normalize_text
+
+
+class ZhipuAIEmbeddings(Embeddings):
+    def __init__(self, api_key: str, model: str = "embedding-3", cache: Optional[EmbeddingCache] = None):
+        self.client = ZhipuAI(api_key=api_key)
+        self.model = model
+        self.cache = cache
+
+    def _embed_remote(self, texts: list[str]) -> list[list[float]]:
+        all_embeddings = []
+        batch_size = 64
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i + batch_size]
+            response = self.client.embeddings.create(model=self.model, input=batch)
+            embeddings = [item.embedding for item in response.data]  # 这里改了
+            all_embeddings.extend(embeddings)
+        return all_embeddings
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.cache is None:
+            return self._embed_remote(texts)
+        # 只对缓存未命中的文本调用远程接口，重复文本只请求一次
+        results = self.cache.get_many(self.model, texts)
+        pending = {}
+        for text, vector in zip(texts, results):
+            if vector is None:
+                pending.setdefault(normalize_text(text), text)
+        if pending:
+            fetched = dict(zip(pending, self._embed_remote(list(pending.values()))))
+            self.cache.put_many(self.model, list(pending.values()), list(fetched.values()))
+            results = [
+                vector if vector is not None else fetched[normalize_text(text)]
+                for text, vector in zip(texts, results)
+            ]
+        return results
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.cache is not None:
+            vector = self.cache.get_many(self.model, [text])[0]
+            if vector is not None:
+                return vector
+        response = self.client.embeddings.create(model=self.model, input=[text])
+        vector = response.data[0].embedding
+        if self.cache is not None:
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
@@ -0,0 +1,347 @@
+"""
+异步组卷任务
+
+提交后立即返回任务 id，由后台 worker 领取并执行 generate_exam，前端轮询状态和进度。
+任务状态全部保存在数据库 exam_jobs 表中：
+    - 领取任务使用条件 UPDATE（status='pending' 才能改为 running），多个进程不会重复执行
+    - 执行中每隔 EXAM_JOB_POLL_INTERVAL 秒写入心跳和各题型进度，同时检查是否被取消
+    - 数据库读写都是同步调用，统一放到线程池执行，不阻塞事件循环上的问答和 SSE 请求
+    - 心跳超过 EXAM_JOB_STALE_SECONDS 未更新的任务视为执行进程已退出，重新排队
+默认在 Web 进程内启动 worker；也可以关闭 EXAM_JOB_WORKER_ENABLED，单独运行：
+    python -m backend.app.services.exam_jobs
+"""
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ai_agents.factory import AgentFactory
+from ai_agents.teacher.exam_generation.exam_generator import SECTION_NAMES
+from backend.app.core.config import settings
+from backend.app.db.session import SessionLocal
+from backend.app.models.exam_job import ExamJob
+from backend.app.schemas.exam import ExamCreate, ExamGenerateRequest
+
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def initial_progress(request: ExamGenerateRequest) -> Dict[str, Dict[str, int]]:
+    """按题型记录 已完成/总题数"""
+    return {
+        q_type: {"done": 0, "total": int(count)}
+        for q_type, count in request.question_types.items()
+        if q_type in SECTION_NAMES and int(count) > 0
+    }
+
+
+def make_idempotency_key(user_id: int, request: ExamGenerateRequest, key: Optional[str] = None) -> str:
+    raw = key or json.dumps(request.model_dump(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{user_id}:{raw}".encode("utf-8")).hexdigest()
+
+
+def submit_job(
+    db: Session,
+    user_id: int,
+    request: ExamGenerateRequest,
+    idempotency_key: Optional[str] = None
+) -> Tuple[ExamJob, bool]:
+    """
+    提交组卷任务，返回 (任务, 是否新建)
+
+    相同请求在排队或执行中时直接返回已有任务，避免重复点击、代理超时后重试产生多份试卷。
+    显式传入 Idempotency-Key 时，已成功的任务也会复用。
+    """
+    digest = make_idempotency_key(user_id, request, idempotency_key)
+    reusable = ACTIVE_STATUSES + ("succeeded",) if idempotency_key else ACTIVE_STATUSES
+    existing = (
+        db.query(ExamJob)
+        .filter(
+            ExamJob.user_id == user_id,
+            ExamJob.idempotency_key == digest,
+            ExamJob.status.in_(reusable)
+        )
+        .order_by(ExamJob.created_at.desc())
+        .first()
+    )
+    if existing:
+        return existing, False
+
+    job = ExamJob(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        idempotency_key=digest,
+        status="pending",
+        request=request.model_dump_json(),
+        progress=json.dumps(initial_progress(request)),
+        cancel_requested=False,
+        attempts=0,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job, True
+
+
+def cancel_job(db: Session, job: ExamJob) -> ExamJob:
+    """排队中的任务直接取消；执行中的任务打上取消标记，由 worker 在下一次心跳时中止"""
+    now = datetime.utcnow()
+    db.execute(
+        update(ExamJob)
+        .where(ExamJob.id == job.id, ExamJob.status == "pending")
+        .values(status="cancelled", cancel_requested=True, finished_at=now)
+    )
+    db.execute(
+        update(ExamJob)
+        .where(ExamJob.id == job.id, ExamJob.status == "running")
+        .values(cancel_requested=True)
+    )
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def job_status(job: ExamJob) -> dict:
+    progress = json.loads(job.progress) if job.progress else {}
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "progress": progress,
+        "completed": sum(item["done"] for item in progress.values()),
+        "total": sum(item["total"] for item in progress.values()),
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def job_result(job: ExamJob) -> Optional[ExamCreate]:
+    if job.status != "succeeded" or not job.result:
+        return None
+    return ExamCreate.model_validate_json(job.result)
+
+
+class ExamJobWorker:
+    def __init__(self, concurrency: Optional[int] = None, poll_interval: Optional[float] = None):
+        self.concurrency = concurrency or settings.EXAM_JOB_CONCURRENCY
+        self.poll_interval = poll_interval or settings.EXAM_JOB_POLL_INTERVAL
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, asyncio.Task] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._loop_task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """停止领取新任务，正在执行的任务放回队列由其他 worker 接手"""
+        tasks = list(self._running.values())
+        if self._loop_task is not None:
+            tasks.append(self._loop_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run(self) -> None:
+        print(f"组卷任务 worker 已启动: {self.worker_id}")
+        while True:
+            try:
+                await asyncio.to_thread(self._requeue_stale)
+                while len(self._running) < self.concurrency:
+                    job_id = await asyncio.to_thread(self._claim)
+                    if job_id is None:
+                        break
+                    self._running[job_id] = asyncio.create_task(self._execute(job_id))
+            except Exception as e:
+                print(f"组卷任务调度异常: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    # ---------- 数据库状态变更 ----------
+
+    def _claim(self) -> Optional[str]:
+        with SessionLocal() as db:
+            candidates = (
+                db.query(ExamJob.id)
+                .filter(ExamJob.status == "pending")
+                .order_by(ExamJob.created_at)
+                .limit(5)
+                .all()
+            )
+            for (job_id,) in candidates:
+                now = datetime.utcnow()
+                claimed = db.execute(
+                    update(ExamJob)
+                    .where(ExamJob.id == job_id, ExamJob.status == "pending")
+                    .values(
+                        status="running",
+                        worker_id=self.worker_id,
+                        started_at=now,
+                        heartbeat_at=now,
+                        attempts=ExamJob.attempts + 1
+                    )
+                ).rowcount
+                db.commit()
+                if claimed:
+                    return job_id
+        return None
+
+    def _requeue_stale(self) -> None:
+        deadline = datetime.utcnow() - timedelta(seconds=settings.EXAM_JOB_STALE_SECONDS)
+        with SessionLocal() as db:
+            stale = (ExamJob.status == "running", ExamJob.heartbeat_at < deadline)
+            db.execute(
+                update(ExamJob)
+                .where(*stale, ExamJob.attempts >= settings.EXAM_JOB_MAX_ATTEMPTS)
+                .values(status="failed", error="执行进程中断，已达到最大重试次数", finished_at=datetime.utcnow())
+            )
+            db.execute(
+                update(ExamJob)
+                .where(*stale)
+                .values(status="pending", worker_id=None)
+            )
+            db.commit()
+
+    def _load(self, job_id: str) -> Tuple[int, ExamGenerateRequest]:
+        with SessionLocal() as db:
+            job = db.get(ExamJob, job_id)
+            return job.user_id, ExamGenerateRequest.model_validate_json(job.request)
+
+    def _heartbeat(self, job_id: str, progress: dict) -> bool:
+        """写入心跳和进度，返回任务是否被请求取消"""
+        with SessionLocal() as db:
+            db.execute(
+                update(ExamJob)
+                .where(ExamJob.id == job_id, ExamJob.worker_id == self.worker_id)
+                .values(heartbeat_at=datetime.utcnow(), progress=json.dumps(progress))
+            )
+            db.commit()
+            return bool(db.query(ExamJob.cancel_requested).filter(ExamJob.id == job_id).scalar())
+
+    def _finish(self, job_id: str, status: str, progress: dict, **values) -> None:
+        with SessionLocal() as db:
+            db.execute(
+                update(ExamJob)
+                .where(ExamJob.id == job_id, ExamJob.worker_id == self.worker_id, ExamJob.status == "running")
+                .values(status=status, progress=json.dumps(progress), finished_at=datetime.utcnow(), **values)
+            )
+            db.commit()
+
+    def _release(self, job_id: str) -> None:
+        with SessionLocal() as db:
+            db.execute(
+                update(ExamJob)
+                .where(ExamJob.id == job_id, ExamJob.worker_id == self.worker_id, ExamJob.status == "running")
+                .values(status="pending", worker_id=None)
+            )
+            db.commit()
+
+    # ---------- 执行 ----------
+
+    async def _execute(self, job_id: str) -> None:
+        generation: Optional[asyncio.Task] = None
+        progress: Dict[str, Dict[str, int]] = {}
+        cancelled = False
+
+        def on_progress(q_type: str) -> None:
+            if q_type in progress:
+                progress[q_type]["done"] += 1
+
+        def snapshot() -> dict:
+            # 进度在事件循环中更新，交给线程写库前先复制一份
+            return {q_type: dict(item) for q_type, item in progress.items()}
+
+        try:
+            user_id, request = await asyncio.to_thread(self._load, job_id)
+            # 重新执行时进度从零开始
+            progress.update(initial_progress(request))
+            generation = asyncio.create_task(self._generate(user_id, request, on_progress))
+            while not generation.done():
+                await asyncio.wait({generation}, timeout=self.poll_interval)
+                if generation.done():
+                    break
+                if await asyncio.to_thread(self._heartbeat, job_id, snapshot()):
+                    cancelled = True
+                    generation.cancel()
+            exam = generation.result()
+            await asyncio.to_thread(self._finish, job_id, "succeeded", snapshot(), result=exam.model_dump_json())
+            print(f"组卷任务 {job_id} 完成")
+        except asyncio.CancelledError:
+            if not cancelled:
+                # worker 自身被停止：中止生成并把任务放回队列
+                if generation is not None:
+                    generation.cancel()
+                await asyncio.to_thread(self._release, job_id)
+                raise
+            await asyncio.to_thread(self._finish, job_id, "cancelled", snapshot())
+            print(f"组卷任务 {job_id} 已取消")
+        except Exception as e:
+            print(f"组卷任务 {job_id} 失败: {e}")
+            if generation is not None:
+                generation.cancel()
+            await asyncio.to_thread(self._finish, job_id, "failed", snapshot(), error=str(e))
+        finally:
+            # 任何非正常结束（心跳、写库失败等）都不能留下无人管理的生成任务
+            if generation is not None and not generation.done():
+                generation.cancel()
+            self._running.pop(job_id, None)
+
+    async def _generate(self, user_id: int, request: ExamGenerateRequest, on_progress) -> ExamCreate:
+        from backend.app.services.course_index import get_course_vector_store
+
+        vector_store = await asyncio.to_thread(get_course_vector_store, request.course_id)
+        if request.extra_context:
+            await asyncio.to_thread(
+                vector_store.add_texts, [request.extra_context], [{"source": "extra_context"}]
+            )
+        agent = AgentFactory.create_agent("exam_generator")
+        return await agent.generate_exam(
+            course_id=request.course_id,
+            knowledge_points=request.knowledge_points,
+            question_config=request.question_types,
+            question_scores=request.question_scores,
+            difficulty=request.difficulty,
+            duration=120,
+            created_by=user_id,
+            vector_store=vector_store,
+            exam_title=request.exam_title,
+            extra_context=request.extra_context,
+            on_progress=on_progress
+        )
+
+
+_worker: Optional[ExamJobWorker] = None
+
+
+def start_worker() -> ExamJobWorker:
+    global _worker
+    if _worker is None:
+        _worker = ExamJobWorker()
+        _worker.start()
+    return _worker
+
+
+async def stop_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
+
+
+async def _run_forever() -> None:
+    await ExamJobWorker().run()
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    asyncio.run(_run_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+试卷批量入库
+
+一份试卷（或批量导入的多份试卷）在同一个事务中写入：
+    1. 一条多行 INSERT ... RETURNING 写入全部试卷行，取回 id
+    2. 一条多行 INSERT ... RETURNING 写入全部题目，取回 id；options 在构造参数时一次性序列化
+    3. 提交一次
+返回值直接由写入的数据和取回的 id 组装，不再逐条 refresh，往返次数与题目数量无关
+（SQLAlchemy 按驱动参数上限自动分批，超大批量时每千行左右多一条语句）。
+
+RETURNING 的行序不保证与参数顺序一致，而要求按参数排序时 SQLAlchemy 在 SQLite 上会退化为逐行插入；
+单条多行 INSERT 中自增主键按行顺序分配（SQLite rowid、PostgreSQL 序列均如此），因此取回后按 id 升序对应。
+使用表级（Core）insert 而不是 ORM 批量插入：后者按“非空字段集合”给行分组，
+选择题（有 options）与其他题型交替出现时会被拆成逐行语句。
+"""
+import datetime
+import json
+from typing import List, Sequence
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.models.exam import Exam as ExamModel, Question as QuestionModel
+from backend.app.schemas.exam import ExamCreate
+
+
+def _exam_row(exam: ExamCreate, created_by: int, created_at: datetime.datetime) -> dict:
+    return {
+        "title": exam.title,
+        "description": getattr(exam, "description", None),
+        "course_id": exam.course_id,
+        "duration": exam.duration,
+        "total_score": exam.total_score,
+        "created_by": created_by,
+        "created_at": created_at,
+        "status": "draft",
+    }
+
+
+def _question_row(question, exam_id: int) -> dict:
+    return {
+        "exam_id": exam_id,
+        "type": question.type,
+        "content": question.content,
+        "options": json.dumps(question.options) if question.options else None,
+        "answer": question.answer,
+        "analysis": question.analysis,
+        "score": question.score,
+        "knowledge_point": question.knowledge_point,
+        "difficulty": question.difficulty,
+    }
+
+
+async def save_exams(db: AsyncSession, exams: Sequence[ExamCreate], created_by: int) -> List[dict]:
+    """批量保存试卷和题目，返回与 schemas.exam.Exam 结构一致的字典列表"""
+    if not exams:
+        return []
+    created_at = datetime.datetime.now()
+    exam_rows = [_exam_row(exam, created_by, created_at) for exam in exams]
+    try:
+        exam_ids = sorted((await db.execute(
+            insert(ExamModel.__table__).returning(ExamModel.__table__.c.id),
+            exam_rows
+        )).scalars().all())
+
+        question_rows = [
+            _question_row(question, exam_id)
+            for exam, exam_id in zip(exams, exam_ids)
+            for question in exam.questions
+        ]
+        question_ids = []
+        if question_rows:
+            question_ids = sorted((await db.execute(
+                insert(QuestionModel.__table__).returning(QuestionModel.__table__.c.id),
+                question_rows
+            )).scalars().all())
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    saved = []
+    ids = iter(question_ids)
+    rows = iter(question_rows)
+    for exam, exam_id, exam_row in zip(exams, exam_ids, exam_rows):
+        questions = []
+        for question in exam.questions:
+            row = next(rows)
+            questions.append({**row, "id": next(ids), "options": question.options})
+        saved.append({**exam_row, "id": exam_id, "questions": questions})
+    return saved
+
+
+async def save_exam(db: AsyncSession, exam: ExamCreate, created_by: int) -> dict:
+    return (await save_exams(db, [exam], created_by))[0]
@@ -0,0 +1,201 @@
+"""
+混合检索：BM25 关键词召回 + 向量召回，倒数排名融合（RRF），可选本地 cross-encoder 重排
+
+向量检索对“TensorFlow Lite”“树莓派GPIO”这类专有名词不敏感，只靠加大 k 找回会让提示词变长。
+这里在进程内为知识库分块建倒排索引做 BM25 召回，与向量召回的结果按排名融合：
+    score(d) = Σ 1 / (rrf_k + rank_i(d))
+两路各取 HYBRID_CANDIDATES 个候选，融合后只把前 k 个放进提示词，k 可以保持很小。
+
+分词：安装了 jieba 时使用搜索引擎模式分词，否则对中文连续片段取单字和相邻二字，
+英文/数字按单词切分并转小写。两种方式都会保留英文单词，专有名词能精确命中。
+
+重排：配置 RERANK_MODEL（如 BAAI/bge-reranker-base）且安装了 sentence-transformers 时，
+用 cross-encoder 对融合后的前 RERANK_CANDIDATES 个结果按批打分；超过 RERANK_TIME_BUDGET_MS
+后停止打分，已打分的部分按分数排序，其余保持融合顺序，重排不会让检索耗时失控。
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from backend.app.core.config import settings
+
+try:
+    import jieba  # 可选：更准确的中文分词
+    JIEBA_AVAILABLE = True
+except ImportError:
+    JIEBA_AVAILABLE = False
+
+try:
+    from sentence_transformers import CrossEncoder  # 可选：本地重排模型
+    CROSS_ENCODER_AVAILABLE = True
+except ImportError:
+    CROSS_ENCODER_AVAILABLE = False
+
+_CJK_RUN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[A-Za-z0-9]+(?:[._+#-][A-Za-z0-9]+)*")
+
+
+def _ngram_tokens(text: str) -> List[str]:
+    tokens = [word.lower() for word in _WORD.findall(text)]
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _jieba_tokens(text: str) -> List[str]:
+    tokens = [word.lower() for word in _WORD.findall(text)]
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(token for token in jieba.lcut_for_search(run) if token.strip())
+    return tokens
+
+
+def tokenize(text: str) -> List[str]:
+    mode = settings.HYBRID_TOKENIZER
+    if mode == "jieba" or (mode == "auto" and JIEBA_AVAILABLE):
+        return _jieba_tokens(text)
+    return _ngram_tokens(text)
+
+
+class BM25Index:
+    """
+    进程内 BM25 倒排索引，支持增量追加
+    k1、b 取常用默认值；idf 采用 Lucene 的平滑形式，保证非负
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._doc_lengths: List[int] = []
+        self._docs: List[Document] = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add_documents(self, documents: Iterable[Document]) -> None:
+        for doc in documents:
+            tokens = tokenize(doc.page_content)
+            doc_index = len(self._docs)
+            for term, tf in Counter(tokens).items():
+                self._postings[term].append((doc_index, tf))
+            self._docs.append(doc)
+            self._doc_lengths.append(len(tokens))
+            self._total_length += len(tokens)
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        if not self._docs:
+            return []
+        n = len(self._docs)
+        avgdl = self._total_length / n or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_index] / avgdl)
+                scores[doc_index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self._docs[doc_index], score) for doc_index, score in top]
+
+
+def doc_key(doc: Document) -> Hashable:
+    """融合时识别同一分块：两路返回的是不同的 Document 对象，按内容判断"""
+    return doc.page_content
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Document]], rrf_k: int = None
+) -> List[Tuple[Document, float]]:
+    rrf_k = rrf_k or settings.HYBRID_RRF_K
+    scores: Dict[Hashable, float] = defaultdict(float)
+    docs: Dict[Hashable, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] += 1.0 / (rrf_k + rank)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda pair: pair[1], reverse=True)
+
+
+class Reranker:
+    """本地 cross-encoder 重排，模型在首次使用时加载"""
+
+    def __init__(self, model_name: str, time_budget_ms: float = None, batch_size: int = None):
+        self.model_name = model_name
+        self.time_budget = (time_budget_ms or settings.RERANK_TIME_BUDGET_MS) / 1000
+        self.batch_size = batch_size or settings.RERANK_BATCH_SIZE
+        self._model = None
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.budget_exceeded = 0
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def rerank(self, query: str, docs: List[Document]) -> List[Document]:
+        model = self._get_model()
+        self.calls += 1
+        deadline = time.perf_counter() + self.time_budget
+        scored: List[Tuple[float, int]] = []
+        for start in range(0, len(docs), self.batch_size):
+            if time.perf_counter() >= deadline:
+                self.budget_exceeded += 1
+                break
+            batch = docs[start:start + self.batch_size]
+            scores = model.predict([(query, doc.page_content) for doc in batch])
+            scored.extend((float(score), start + i) for i, score in enumerate(scores))
+        order = [i for _, i in sorted(scored, key=lambda pair: pair[0], reverse=True)]
+        return [docs[i] for i in order] + docs[len(scored):]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "budget_exceeded": self.budget_exceeded,
+            "time_budget_ms": self.time_budget * 1000,
+        }
+
+
+_reranker: Optional[Reranker] = None
+
+
+def get_reranker() -> Optional[Reranker]:
+    """未配置 RERANK_MODEL 或未安装 sentence-transformers 时返回 None（不重排）"""
+    global _reranker
+    if not settings.RERANK_MODEL or not CROSS_ENCODER_AVAILABLE:
+        return None
+    if _reranker is None:
+        _reranker = Reranker(settings.RERANK_MODEL)
+    return _reranker
+
+
+def hybrid_rank(
+    query: str,
+    vector_docs: Sequence[Document],
+    keyword_docs: Sequence[Document],
+    k: int
+) -> List[Document]:
+    """融合两路召回结果，可选重排后取前 k 个"""
+    fused = [doc for doc, _ in reciprocal_rank_fusion([vector_docs, keyword_docs])]
+    reranker = get_reranker()
+    if reranker is not None and len(fused) > 1:
+        candidates = fused[:max(k, settings.RERANK_CANDIDATES)]
+        try:
+            fused = reranker.rerank(query, candidates) + fused[len(candidates):]
+        except Exception as e:
+            print(f"重排失败，使用融合结果: {str(e)}")
+    return fused[:k]
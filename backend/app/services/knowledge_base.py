@@ -0,0 +1,429 @@
+"""
+知识库向量索引的持久化与增量构建
+
+索引目录结构（默认 settings.VECTOR_STORE_PATH）：
+    index.faiss      FAISS 索引
+    index.pkl        docstore 及 index -> docstore id 映射
+    index.<类型>.faiss  由 index.faiss 派生的 ANN 索引（VECTOR_INDEX_TYPE 不为 flat 时，见 ann_index）
+    manifest.json    每个源文件的内容哈希、对应的分块 id，以及分块参数、向量模型和 ANN 索引参数
+    .lock            构建/加载索引时的进程间文件锁
+
+启动时优先加载磁盘上的索引，只对新增、变更、删除的源文件重新分块和向量化。
+需要重新处理的文件走流水线：进程池并行解析 -> 逐文件分块 -> 按批向量化写入索引，
+各阶段之间是生成器，在途文件数和待向量化分块数都有上限，内存占用与语料总量无关。
+索引文件通过临时目录 + os.replace 整体替换，正在以 mmap 方式读取旧索引的 worker 不受影响。
+离线构建：
+    python -m backend.app.services.knowledge_base [--rebuild]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.app.core.config import settings
+from backend.app.services.ann_index import ann_params, write_ann_index
+from backend.app.services.embedding_cache import get_embedding_cache
+from backend.app.services.embeddings import ZhipuAIEmbeddings
+from utils.document_parser import parse_pdf
+
+INDEX_NAME = "index"
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+MANIFEST_VERSION = 1
+SUPPORTED_EXTENSIONS = (".docx", ".pdf")
+
+
+class VersionedFAISS(FAISS):
+    """每次写入（新增/删除/合并）后递增 version，依赖知识库内容的缓存据此判断是否失效"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def add_texts(self, *args, **kwargs) -> List[str]:
+        ids = super().add_texts(*args, **kwargs)
+        self.version += 1
+        return ids
+
+    def add_embeddings(self, *args, **kwargs) -> List[str]:
+        ids = super().add_embeddings(*args, **kwargs)
+        self.version += 1
+        return ids
+
+    def delete(self, *args, **kwargs) -> Optional[bool]:
+        result = super().delete(*args, **kwargs)
+        self.version += 1
+        return result
+
+    def merge_from(self, target: FAISS) -> None:
+        super().merge_from(target)
+        self.version += 1
+
+
+def get_embeddings() -> ZhipuAIEmbeddings:
+    """创建知识库使用的向量模型（带向量缓存）"""
+    return ZhipuAIEmbeddings(
+        api_key=os.getenv("ZHIPU_API_KEY"),
+        model=settings.EMBEDDING_MODEL,
+        cache=get_embedding_cache()
+    )
+
+
+def splitter_params() -> dict:
+    """当前的分块参数，写入 manifest 用于判断索引是否需要整体重建"""
+    return {
+        "splitter": "RecursiveCharacterTextSplitter",
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+    }
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容哈希"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_source_files(directory: str) -> Dict[str, str]:
+    """扫描知识库目录，返回 {文件名: 内容哈希}"""
+    files = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(SUPPORTED_EXTENSIONS):
+            files[filename] = file_sha256(os.path.join(directory, filename))
+    return files
+
+
+def has_source_files(directory: str) -> bool:
+    """目录存在且包含支持的文件（不计算哈希）"""
+    return os.path.isdir(directory) and any(name.endswith(SUPPORTED_EXTENSIONS) for name in os.listdir(directory))
+
+
+def parse_file(path: str) -> str:
+    """解析单个源文件为纯文本（在解析进程池中执行）"""
+    if path.endswith(".pdf"):
+        return parse_pdf(path)
+    documents = UnstructuredWordDocumentLoader(path).load()
+    return "\n\n".join(doc.page_content for doc in documents)
+
+
+def ingest_workers() -> int:
+    return settings.INGEST_WORKERS or os.cpu_count() or 1
+
+
+def iter_parsed_files(paths: List[str], workers: int) -> Iterator[Tuple[str, str]]:
+    """
+    解析阶段：按完成顺序产出 (路径, 文本)
+
+    最多 2 * workers 个文件在途，下游还没取走结果时不再提交新文件，
+    解析结果不会在内存中无限堆积。
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield path, parse_file(path)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers)
+    queue = iter(paths)
+    pending = {}
+
+    def submit_next():
+        path = next(queue, None)
+        if path is not None:
+            pending[pool.submit(parse_file, path)] = path
+
+    try:
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                yield path, future.result()
+                submit_next()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_chunks(
+    parsed: Iterable[Tuple[str, str]],
+    file_hashes: Dict[str, str],
+    on_file: Callable[[str, List[str]], None]
+) -> Iterator[Tuple[str, Document]]:
+    """分块阶段：逐个文件分块，产出 (docstore id, 分块)，每个文件分块完成后回调其 id 列表"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP
+    )
+    for path, text in parsed:
+        source = os.path.basename(path)
+        texts = text_splitter.split_text(text)
+        ids = chunk_ids(source, file_hashes[source], len(texts))
+        on_file(source, ids)
+        for doc_id, chunk in zip(ids, texts):
+            yield doc_id, Document(page_content=chunk, metadata={"source": source})
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest_files(
+    directory: str,
+    names: List[str],
+    file_hashes: Dict[str, str],
+    embeddings: Embeddings,
+    vector_store: Optional[VersionedFAISS] = None
+) -> Tuple[Optional[VersionedFAISS], Dict[str, List[str]]]:
+    """
+    向量化阶段：按批调用 embedding 接口并写入索引
+
+    Returns:
+        (向量库, {文件名: 分块 id 列表})
+    """
+    file_ids: Dict[str, List[str]] = {}
+    paths = [os.path.join(directory, name) for name in names]
+    parsed = iter_parsed_files(paths, ingest_workers())
+    chunks = iter_chunks(parsed, file_hashes, lambda name, ids: file_ids.__setitem__(name, ids))
+    for batch in iter_batches(chunks, settings.INGEST_EMBED_BATCH_SIZE):
+        ids = [doc_id for doc_id, _ in batch]
+        texts = [doc.page_content for _, doc in batch]
+        metadatas = [doc.metadata for _, doc in batch]
+        text_embeddings = list(zip(texts, embeddings.embed_documents(texts)))
+        if vector_store is None:
+            vector_store = VersionedFAISS.from_embeddings(
+                text_embeddings, embeddings, metadatas=metadatas, ids=ids
+            )
+        else:
+            vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vector_store, file_ids
+
+
+def chunk_ids(filename: str, sha256: str, count: int) -> List[str]:
+    """为文件的分块生成稳定的 docstore id"""
+    return [f"{filename}:{sha256[:16]}:{i}" for i in range(count)]
+
+
+def read_manifest(index_dir: str) -> Optional[dict]:
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取知识库 manifest 失败，将重新构建: {e}")
+        return None
+
+
+def write_manifest(index_dir: str, manifest: dict) -> None:
+    """先写临时文件再替换，避免进程中断留下半个 manifest"""
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def index_lock(index_dir: str):
+    """索引目录的进程间互斥锁，多个 worker 同时启动时只有一个执行构建"""
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, LOCK_NAME), "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_index(vector_store: FAISS, index_dir: str) -> None:
+    """先写入临时目录再逐个替换，已 mmap 旧文件的进程仍可继续读取"""
+    os.makedirs(index_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".build-", dir=index_dir)
+    try:
+        vector_store.save_local(tmp_dir, INDEX_NAME)
+        for ext in ("faiss", "pkl"):
+            filename = f"{INDEX_NAME}.{ext}"
+            os.replace(os.path.join(tmp_dir, filename), os.path.join(index_dir, filename))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _index_files_exist(index_dir: str) -> bool:
+    return all(
+        os.path.exists(os.path.join(index_dir, f"{INDEX_NAME}.{ext}"))
+        for ext in ("faiss", "pkl")
+    )
+
+
+def _manifest_compatible(manifest: Optional[dict], embedding_model: str) -> bool:
+    """分块参数或向量模型变化时，旧向量全部失效"""
+    return (
+        manifest is not None
+        and manifest.get("version") == MANIFEST_VERSION
+        and manifest.get("embedding_model") == embedding_model
+        and manifest.get("splitter") == splitter_params()
+    )
+
+
+def _ann_index_current(manifest: dict, index_dir: str) -> bool:
+    """ANN 索引参数与当前配置一致且文件存在（只改查询参数 nprobe/efSearch 不需要重建）"""
+    entry = manifest.get("ann_index") or {"params": {"type": "flat"}, "file": None}
+    if entry.get("params") != ann_params():
+        return False
+    return entry.get("file") is None or os.path.exists(os.path.join(index_dir, entry["file"]))
+
+
+def index_is_current(
+    directory: Optional[str] = None,
+    index_dir: Optional[str] = None,
+    embedding_model: Optional[str] = None
+) -> bool:
+    """磁盘上的索引是否与源文件目录一致（只比较哈希，不加载索引）"""
+    directory = directory or settings.KNOWLEDGE_BASE_DIR
+    index_dir = index_dir or settings.VECTOR_STORE_PATH
+    embedding_model = embedding_model or settings.EMBEDDING_MODEL
+    manifest = read_manifest(index_dir)
+    if not _manifest_compatible(manifest, embedding_model) or not _index_files_exist(index_dir):
+        return False
+    if not _ann_index_current(manifest, index_dir):
+        return False
+    indexed = {name: entry["sha256"] for name, entry in manifest.get("files", {}).items()}
+    return indexed == scan_source_files(directory)
+
+
+def load_or_build_vector_store(
+    directory: Optional[str] = None,
+    index_dir: Optional[str] = None,
+    embeddings: Optional[Embeddings] = None,
+    rebuild: bool = False
+) -> VersionedFAISS:
+    """
+    加载持久化的知识库索引，并与源文件目录做增量同步
+
+    Args:
+        directory: 知识库源文件目录，默认 settings.KNOWLEDGE_BASE_DIR
+        index_dir: 索引目录，默认 settings.VECTOR_STORE_PATH
+        embeddings: 向量模型，默认使用智谱 embedding
+        rebuild: 忽略已有索引，全部重新构建
+
+    Returns:
+        FAISS: 与源文件目录一致的向量库
+    """
+    directory = directory or settings.KNOWLEDGE_BASE_DIR
+    index_dir = index_dir or settings.VECTOR_STORE_PATH
+    embeddings = embeddings or get_embeddings()
+    with index_lock(index_dir):
+        return _sync_vector_store(directory, index_dir, embeddings, rebuild)
+
+
+def _sync_vector_store(directory: str, index_dir: str, embeddings: Embeddings, rebuild: bool) -> VersionedFAISS:
+    embedding_model = getattr(embeddings, "model", embeddings.__class__.__name__)
+
+    current_files = scan_source_files(directory)
+    manifest = read_manifest(index_dir)
+
+    vector_store = None
+    indexed_files: Dict[str, dict] = {}
+    if not rebuild and _manifest_compatible(manifest, embedding_model) and _index_files_exist(index_dir):
+        vector_store = VersionedFAISS.load_local(
+            index_dir, embeddings, INDEX_NAME, allow_dangerous_deserialization=True
+        )
+        indexed_files = manifest.get("files", {})
+    elif manifest is not None and not rebuild:
+        print("已有知识库索引不可用（分块参数或向量模型已变化），重新构建")
+
+    removed = [name for name in indexed_files if name not in current_files]
+    changed = [
+        name for name, sha256 in current_files.items()
+        if name in indexed_files and indexed_files[name]["sha256"] != sha256
+    ]
+    added = [name for name in current_files if name not in indexed_files]
+
+    # 删除已移除或已变更文件的旧分块
+    stale_ids = [doc_id for name in removed + changed for doc_id in indexed_files[name]["ids"]]
+    if vector_store is not None and stale_ids:
+        vector_store.delete(stale_ids)
+    for name in removed + changed:
+        indexed_files.pop(name, None)
+
+    # 只对新增和变更的文件重新分块、向量化
+    vector_store, file_ids = ingest_files(directory, changed + added, current_files, embeddings, vector_store)
+    for name, ids in file_ids.items():
+        indexed_files[name] = {"sha256": current_files[name], "ids": ids}
+
+    if vector_store is None:
+        raise ValueError(f"知识库目录 {directory} 中没有可用的文档")
+
+    print(
+        f"知识库索引: 共 {len(current_files)} 个文件，新增 {len(added)}，"
+        f"变更 {len(changed)}，删除 {len(removed)}"
+    )
+    content_changed = bool(added or changed or removed or manifest is None or rebuild)
+    ann_stale = manifest is None or not _ann_index_current(manifest, index_dir)
+    if content_changed:
+        save_index(vector_store, index_dir)
+    if content_changed or ann_stale:
+        # 内容变化或 ANN 索引参数变化时重新派生，只调整索引参数不需要重新向量化
+        ann_entry = write_ann_index(vector_store.index, index_dir, INDEX_NAME)
+        write_manifest(index_dir, {
+            "version": MANIFEST_VERSION,
+            "embedding_model": embedding_model,
+            "splitter": splitter_params(),
+            "ann_index": ann_entry,
+            "files": indexed_files,
+        })
+    return vector_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线构建知识库向量索引")
+    parser.add_argument("--source", default=settings.KNOWLEDGE_BASE_DIR, help="知识库源文件目录")
+    parser.add_argument("--index-dir", default=settings.VECTOR_STORE_PATH, help="索引输出目录")
+    parser.add_argument("--rebuild", action="store_true", help="忽略已有索引，全部重新构建")
+    parser.add_argument("--course", type=int, help="构建课程分片：源文件和索引目录取 COURSE_KNOWLEDGE_DIR / COURSE_VECTOR_STORE_DIR 下的课程目录")
+    args = parser.parse_args()
+    if args.course is not None:
+        from backend.app.services.course_index import course_index_dir, course_source_dir
+        args.source = course_source_dir(args.course)
+        args.index_dir = course_index_dir(args.course)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    vector_store = load_or_build_vector_store(args.source, args.index_dir, rebuild=args.rebuild)
+    print(f"索引已写入 {os.path.abspath(args.index_dir)}，共 {vector_store.index.ntotal} 个分块")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+检索结果缓存：相同查询直接复用 similarity_search 的结果，省去一次 embedding 和向量检索
+
+键为 (向量库名称, 归一化查询文本, k)，共享知识库和各课程分片（见 course_index）各自记录版本号。
+某个向量库写入（add_texts、重建索引）后版本号变化，它的旧条目在下一次访问时全部清空，
+不影响其他向量库的条目。条目同时受 TTL 和条数上限（LRU）约束。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from backend.app.core.config import settings
+from backend.app.services.embedding_cache import normalize_text
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # 向量库名称 -> 版本号
+        self._versions: Dict[str, object] = {}
+        # (向量库名称, 查询, k) -> (过期时间, 检索结果)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, kb_version, namespace: str) -> None:
+        """向量库版本变化时清空它的条目"""
+        if namespace not in self._versions:
+            self._versions[namespace] = kb_version
+        elif kb_version != self._versions[namespace]:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+            self._versions[namespace] = kb_version
+
+    def get(self, kb_version, query: str, k: int, namespace: str = "shared") -> Optional[List[Document]]:
+        key = (namespace, normalize_text(query), k)
+        with self._lock:
+            self._check_version(kb_version, namespace)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, kb_version, query: str, k: int, docs: List[Document], namespace: str = "shared") -> None:
+        with self._lock:
+            self._check_version(kb_version, namespace)
+            key = (namespace, normalize_text(query), k)
+            self._entries[key] = (time.monotonic() + self.ttl, list(docs))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+
+_retrieval_cache: Optional[RetrievalCache] = None
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    """进程内共享的检索结果缓存，关闭时返回 None"""
+    global _retrieval_cache
+    if not settings.RETRIEVAL_CACHE_ENABLED:
+        return None
+    if _retrieval_cache is None:
+        _retrieval_cache = RetrievalCache(
+            max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+            ttl=settings.RETRIEVAL_CACHE_TTL,
+        )
+    return _retrieval_cache
@@ -0,0 +1,102 @@
+"""
+问答语义缓存：相似问题直接复用已生成的回答
+
+用问题的向量（与检索共用同一次 embedding）做余弦相似度匹配，超过阈值即命中。
+缓存按知识库版本隔离：知识库发生写入（add_texts 等）后，旧版本的条目全部作废。
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from backend.app.core.config import settings
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, max_entries: int = 2000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._version = None
+        # key 仅用于 LRU 淘汰，值为 (单位向量, 问题, 回答, 原始生成耗时秒数)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_key = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
+
+    def _check_version(self, kb_version) -> None:
+        """知识库版本变化时清空缓存"""
+        if kb_version != self._version:
+            self._entries.clear()
+            self._version = kb_version
+
+    def lookup(self, vector: List[float], kb_version) -> Optional[str]:
+        """返回相似问题的缓存回答，未命中返回 None"""
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_version(kb_version)
+            if self._entries:
+                keys = list(self._entries)
+                matrix = np.stack([self._entries[key][0] for key in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key = keys[best]
+                    self._entries.move_to_end(key)
+                    _, _, answer, latency = self._entries[key]
+                    self.hits += 1
+                    self.saved_seconds += latency
+                    return answer
+            self.misses += 1
+            return None
+
+    def store(self, vector: List[float], kb_version, question: str, answer: str, latency: float) -> None:
+        with self._lock:
+            self._check_version(kb_version)
+            self._entries[self._next_key] = (self._normalize(vector), question, answer, latency)
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_ms": round(self.saved_seconds * 1000, 1),
+            "avg_saved_latency_ms": round(self.saved_seconds * 1000 / self.hits, 1) if self.hits else 0.0,
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "kb_version": self._version,
+        }
+
+
+_semantic_cache: Optional[SemanticAnswerCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticAnswerCache]:
+    """进程内共享的问答语义缓存，关闭时返回 None"""
+    global _semantic_cache
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticAnswerCache(
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+        )
+    return _semantic_cache
@@ -0,0 +1,87 @@
+"""
+当前用户缓存：get_current_user 按用户 id 缓存用户信息，认证通过后不再为每个请求查询 users 表
+
+缓存的是 schemas.user.User 快照（id、username、email、role、created_at），不是 ORM 对象，
+可以跨请求、跨数据库会话安全复用。条目受 TTL 和条数上限（LRU）约束；
+管理员修改或删除用户时调用 invalidate 立即失效（只作用于当前进程，其他进程由 TTL 兜底）。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from backend.app.core.config import settings
+from backend.app.schemas.user import User as UserSchema
+
+
+class UserCache:
+    def __init__(self, max_entries: int = 4096, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # 用户 id -> (过期时间, 用户信息)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[UserSchema]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user: UserSchema) -> None:
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+
+
+_user_cache: Optional[UserCache] = None
+
+
+def get_user_cache() -> Optional[UserCache]:
+    """进程内共享的当前用户缓存，关闭时返回 None"""
+    global _user_cache
+    if not settings.USER_CACHE_ENABLED:
+        return None
+    if _user_cache is None:
+        _user_cache = UserCache(
+            max_entries=settings.USER_CACHE_MAX_ENTRIES,
+            ttl=settings.USER_CACHE_TTL,
+        )
+    return _user_cache
+
+
+def invalidate_user(user_id: int) -> None:
+    cache = get_user_cache()
+    if cache is not None:
+        cache.invalidate(user_id)
@@ -0,0 +1,398 @@
+"""
+多 worker 共享的知识库向量服务
+
+数据分两段：
+    - 基础段：离线/启动时构建的 index.faiss（或由它派生的 ANN 索引），只读加载。
+      faiss 1.7.x 只能 mmap IVF 索引的倒排表（ivf_flat / ivf_pq），这部分由多个 worker 共用页缓存；
+      Flat 和 HNSW 索引会完整读入每个 worker 的堆内存，多 worker 部署时内存按 worker 数成倍占用
+    - 追加段：运行期写入（如教师补充的 extra_context）追加到 append_log.jsonl，
+      每行包含文本、metadata 和向量。各 worker 读取前回放日志中的新行，
+      因此任一 worker 写入的内容对所有 worker 可见，且不需要重复调用 embedding 接口
+检索时分别查询两段，按距离合并取前 k 个。
+开启混合检索时，两段的分块同时进入进程内 BM25 索引，关键词召回与向量召回按排名融合（见 hybrid_search）。
+进程内用读写锁保护：检索可并发，回放日志/重新加载基础段时独占。
+课程分片（见 course_index）同样是一个 VectorStoreService，可以只有追加段、没有基础段。
+"""
+import hashlib
+import json
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from backend.app.core.config import settings
+from backend.app.services.ann_index import apply_search_params, needs_refine, read_flags, search_params, with_refine
+from backend.app.services.hybrid_search import BM25Index, hybrid_rank
+from backend.app.services.knowledge_base import (
+    INDEX_NAME,
+    MANIFEST_NAME,
+    get_embeddings,
+    has_source_files,
+    index_is_current,
+    index_lock,
+    load_or_build_vector_store,
+    read_manifest,
+)
+from backend.app.services.retrieval_cache import get_retrieval_cache
+
+APPEND_LOG_NAME = "append_log.jsonl"
+
+
+class ReadWriteLock:
+    """写优先的读写锁，避免持续的检索请求让写入一直等待"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _size(path: str) -> int:
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _base_exists(index_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(index_dir, f"{INDEX_NAME}.{ext}")) for ext in ("faiss", "pkl"))
+
+
+def text_id(text: str) -> str:
+    """追加内容按文本哈希生成 id，重复提交同一段资料只入库一次"""
+    return "append:" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class VectorStoreService:
+    def __init__(
+        self,
+        index_dir: Optional[str] = None,
+        source_dir: Optional[str] = None,
+        embeddings: Optional[Embeddings] = None,
+        name: str = "shared"
+    ):
+        self.name = name
+        self.index_dir = index_dir or settings.VECTOR_STORE_PATH
+        self.source_dir = source_dir or settings.KNOWLEDGE_BASE_DIR
+        self._embeddings = embeddings or get_embeddings()
+        self.embedding_model = getattr(self._embeddings, "model", self._embeddings.__class__.__name__)
+
+        self._manifest_path = os.path.join(self.index_dir, MANIFEST_NAME)
+        self._log_path = os.path.join(self.index_dir, APPEND_LOG_NAME)
+        self._lock = ReadWriteLock()
+
+        self._base: Optional[FAISS] = None
+        self._base_mtime: Optional[int] = None
+        self._base_files: List[str] = []
+        self._delta: Optional[FAISS] = None
+        self._delta_ids = set()
+        self._log_offset = 0
+        self._keyword_index: Optional[BM25Index] = None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    @property
+    def version(self) -> str:
+        """基础段或追加段任一变化都会改变版本号，供依赖知识库内容的缓存判断失效"""
+        return f"{self._base_mtime}:{self._log_offset}"
+
+    # ---------- 加载与同步 ----------
+
+    def open(self, build: bool = True) -> "VectorStoreService":
+        """
+        同步源文件目录与磁盘索引（必要时增量构建），然后加载基础段和追加段
+        源文件目录为空或 build=False 时不构建基础段，只使用已有的索引和追加段
+        """
+        if build and has_source_files(self.source_dir) and not index_is_current(
+            self.source_dir, self.index_dir, self.embedding_model
+        ):
+            load_or_build_vector_store(self.source_dir, self.index_dir, self._embeddings)
+        with self._lock.write():
+            if _base_exists(self.index_dir):
+                self._load_base()
+            elif settings.HYBRID_SEARCH_ENABLED:
+                self._keyword_index = BM25Index()
+            self._replay_log()
+        return self
+
+    def _load_base(self) -> None:
+        # 与构建进程互斥，保证读到的 index.faiss 和 index.pkl 属于同一版本
+        with index_lock(self.index_dir):
+            # manifest 中记录了派生的 ANN 索引时使用它检索，否则使用精确索引
+            ann_entry = (read_manifest(self.index_dir) or {}).get("ann_index") or {}
+            ann_file = ann_entry.get("file")
+            flat_path = os.path.join(self.index_dir, f"{INDEX_NAME}.faiss")
+            if ann_file:
+                index = faiss.read_index(
+                    os.path.join(self.index_dir, ann_file),
+                    read_flags((ann_entry.get("params") or {}).get("type"))
+                )
+                apply_search_params(index)
+                self._base_files = [ann_file, f"{INDEX_NAME}.pkl"]
+                # 只有 ivf_pq 重排需要原始向量，其他 ANN 类型不再读入 index.faiss
+                if needs_refine(index):
+                    index = with_refine(index, faiss.read_index(flat_path))
+                    self._base_files.append(f"{INDEX_NAME}.faiss")
+            else:
+                index = faiss.read_index(flat_path)
+                self._base_files = [f"{INDEX_NAME}.faiss", f"{INDEX_NAME}.pkl"]
+            with open(os.path.join(self.index_dir, f"{INDEX_NAME}.pkl"), "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            self._base_mtime = _mtime_ns(self._manifest_path)
+        self._base = FAISS(self._embeddings, index, docstore, index_to_docstore_id)
+        if settings.HYBRID_SEARCH_ENABLED:
+            # 基础段重建后关键词索引随之重建，已回放的追加段一并加入
+            self._keyword_index = BM25Index()
+            self._keyword_index.add_documents(
+                docstore.search(doc_id) for doc_id in index_to_docstore_id.values()
+            )
+            if self._delta is not None:
+                self._keyword_index.add_documents(
+                    self._delta.docstore.search(doc_id) for doc_id in self._delta.index_to_docstore_id.values()
+                )
+
+    def _replay_log(self) -> None:
+        """读取追加日志中本进程尚未见过的完整行"""
+        if _size(self._log_path) <= self._log_offset:
+            return
+        with open(self._log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # 末尾可能是其他进程正在写入的半行，留到下次再读
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        entries = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry.get("embedding_model") != self.embedding_model:
+                print(f"跳过向量模型不一致的追加记录: {entry.get('id')}")
+                continue
+            if entry["id"] in self._delta_ids:
+                continue
+            self._delta_ids.add(entry["id"])
+            entries.append(entry)
+        if entries:
+            text_embeddings = [(entry["text"], entry["vector"]) for entry in entries]
+            metadatas = [entry.get("metadata") or {} for entry in entries]
+            ids = [entry["id"] for entry in entries]
+            if self._delta is None:
+                self._delta = FAISS.from_embeddings(
+                    text_embeddings, self._embeddings, metadatas=metadatas, ids=ids
+                )
+            else:
+                self._delta.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            if self._keyword_index is not None:
+                self._keyword_index.add_documents(
+                    Document(page_content=text, metadata=metadata)
+                    for (text, _), metadata in zip(text_embeddings, metadatas)
+                )
+        self._log_offset += end
+
+    def refresh(self) -> None:
+        """检查基础段是否被重建、追加日志是否有新内容，只做两次 stat"""
+        base_changed = _mtime_ns(self._manifest_path) != self._base_mtime
+        if not base_changed and _size(self._log_path) <= self._log_offset:
+            return
+        with self._lock.write():
+            if _mtime_ns(self._manifest_path) != self._base_mtime and _base_exists(self.index_dir):
+                self._load_base()
+            self._replay_log()
+
+    # ---------- 写入 ----------
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """向量化后写入追加日志，所有 worker 在下一次检索前可见"""
+        texts = list(texts)
+        ids = ids or [text_id(text) for text in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.refresh()
+        pending = [
+            (doc_id, text, metadata)
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+            if doc_id not in self._delta_ids
+        ]
+        if not pending:
+            return ids
+        vectors = self._embeddings.embed_documents([text for _, text, _ in pending])
+        lines = "".join(
+            json.dumps({
+                "id": doc_id,
+                "text": text,
+                "metadata": metadata,
+                "embedding_model": self.embedding_model,
+                "vector": vector,
+            }, ensure_ascii=False) + "\n"
+            for (doc_id, text, metadata), vector in zip(pending, vectors)
+        )
+        with index_lock(self.index_dir):
+            with open(self._log_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+        self.refresh()
+        return ids
+
+    # ---------- 检索 ----------
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs
+    ) -> List[Tuple[Document, float]]:
+        self.refresh()
+        with self._lock.read():
+            results = []
+            if self._base is not None:
+                results += self._base.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+            if self._delta is not None:
+                results += self._delta.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+        # 两段都使用 L2 距离，越小越相似
+        results.sort(key=lambda pair: pair[1])
+        return results[:k]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        embedding = self._embeddings.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def keyword_search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """BM25 关键词检索，未开启混合检索时返回空列表"""
+        self.refresh()
+        with self._lock.read():
+            if self._keyword_index is None:
+                return []
+            return self._keyword_index.search(query, k)
+
+    def hybrid_search(self, query: str, k: int = 4, embedding: Optional[List[float]] = None) -> List[Document]:
+        """
+        关键词召回与向量召回各取 HYBRID_CANDIDATES 个候选，按倒数排名融合（可选重排）后取前 k 个
+        已经算好查询向量时传入 embedding，避免重复调用 embedding 接口
+        """
+        if embedding is None:
+            embedding = self._embeddings.embed_query(query)
+        candidates = max(k, settings.HYBRID_CANDIDATES)
+        vector_docs = [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, candidates)]
+        if self._keyword_index is None:
+            return vector_docs[:k]
+        keyword_docs = [doc for doc, _ in self.keyword_search(query, candidates)]
+        return hybrid_rank(query, vector_docs, keyword_docs, k)
+
+    def _search(self, query: str, k: int, embedding: Optional[List[float]] = None) -> List[Document]:
+        if settings.HYBRID_SEARCH_ENABLED:
+            return self.hybrid_search(query, k, embedding)
+        if embedding is None:
+            embedding = self._embeddings.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k)
+
+    def retrieve(self, query: str, k: int = 4, embedding: Optional[List[float]] = None) -> List[Document]:
+        """
+        业务检索入口（问答、组卷）：按配置使用混合检索或纯向量检索，结果走检索结果缓存，
+        版本号变化（有新内容写入）后缓存自动失效
+        """
+        cache = get_retrieval_cache()
+        if cache is None:
+            return self._search(query, k, embedding)
+        self.refresh()
+        version = self.version
+        docs = cache.get(version, query, k, namespace=self.name)
+        if docs is None:
+            docs = self._search(query, k, embedding)
+            cache.put(version, query, k, docs, namespace=self.name)
+        return docs
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        """兼容 LangChain 接口；无过滤条件时等同于 retrieve"""
+        if kwargs:
+            return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+        return self.retrieve(query, k)
+
+    def is_empty(self) -> bool:
+        self.refresh()
+        return self._base is None and self._delta is None
+
+    def resident_bytes(self) -> int:
+        """
+        本进程常驻内存估算：已加载的索引文件按文件大小计算（Flat/HNSW 在堆内存中，
+        IVF 倒排表在可共享的页缓存中，但检索热数据时同样占用内存），
+        docstore 和追加段（JSON 行，含向量）按磁盘大小计算，BM25 索引与原文大小相当，已包含在内
+        """
+        return sum(_size(os.path.join(self.index_dir, name)) for name in self._base_files) + self._log_offset
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "base_chunks": self._base.index.ntotal if self._base is not None else 0,
+            "index_type": type(self._base.index).__name__ if self._base is not None else None,
+            "index_search_params": search_params(self._base.index) if self._base is not None else {},
+            "appended_chunks": self._delta.index.ntotal if self._delta is not None else 0,
+            "keyword_indexed_chunks": len(self._keyword_index) if self._keyword_index is not None else 0,
+            "append_log_bytes": self._log_offset,
+        }
+
+
+_vector_store_service: Optional[VectorStoreService] = None
+_service_lock = threading.Lock()
+
+
+def get_vector_store_service() -> VectorStoreService:
+    """进程内共享的知识库向量服务，首次调用时加载索引"""
+    global _vector_store_service
+    if _vector_store_service is None:
+        with _service_lock:
+            if _vector_store_service is None:
+                _vector_store_service = VectorStoreService().open()
+    return _vector_store_service
@@ -1,23 +1,22 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from models.database import Base
 import os
 from dotenv import load_dotenv
 
+from backend.app.core.config import settings
+from backend.app.db.session import get_engine
+
 load_dotenv()
 
-# 获取数据库URL
-DATABASE_URL = os.getenv("DB_URL", "sqlite:///./campus_agent.db")
+# 获取数据库URL，默认与后端使用同一个数据库
+DATABASE_URL = os.getenv("DB_URL", settings.DATABASE_URL)
 
-# 创建引擎
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}  # SQLite需要
-)
+# 创建引擎：与后端共用引擎工厂，同一数据库只有一个连接池，并使用相同的 WAL / busy_timeout 设置
+engine = get_engine(DATABASE_URL)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # 初始化数据库
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
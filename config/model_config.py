@@ -1,15 +1,42 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 import os
 from dotenv import load_dotenv
 
 class ModelConfig(BaseSettings):
     """模型配置"""
-    API_KEY: str = os.getenv("ZHIPU_API_KEY") #"c5ee8594faa94adfaca3a9c5f4128a20.s98xk3HJBhHQMVPF" # 
+    API_KEY: Optional[str] = os.getenv("ZHIPU_API_KEY") #"c5ee8594faa94adfaca3a9c5f4128a20.s98xk3HJBhHQMVPF" # 
     API_BASE_URL: str = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
     API_VERSION: str = "glm-4-plus"
 
+    # HTTP 连接池与超时（秒）
+    REQUEST_TIMEOUT: float = 60.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    # 鉴权 token 有效期，以及提前多久重新签发
+    AUTH_TOKEN_TTL: int = 3600
+    AUTH_TOKEN_REFRESH_MARGIN: int = 60
+
+    # 并发控制：每个模型服务商同时进行的请求数上限
+    PROVIDER_CONCURRENCY: Dict[str, int] = {"zhipuai": 8, "deepseek": 4}
+    DEFAULT_PROVIDER_CONCURRENCY: int = 4
+    # 令牌桶限流：每秒请求数，键为 "服务商" 或 "服务商:模型"；允许 RATE_LIMIT_BURST_SECONDS 秒的突发量
+    PROVIDER_RATE_LIMITS: Dict[str, float] = {"zhipuai": 10.0, "deepseek": 5.0}
+    DEFAULT_RATE_LIMIT: float = 5.0
+    RATE_LIMIT_BURST_SECONDS: float = 2.0
+    # 429/5xx/网络错误的重试：指数退避 + 抖动
+    GATEWAY_MAX_RETRIES: int = 3
+    BACKOFF_BASE: float = 0.5
+    BACKOFF_MAX: float = 8.0
+    # 单道题生成失败后的重试次数
+    QUESTION_MAX_RETRIES: int = 2
+    # 同一题型、同一知识点的题目一次请求最多生成的道数，1 表示逐题生成
+    QUESTION_BATCH_SIZE: int = 5
+    # 结构化输出本地修复失败后，请模型修正原输出的次数（见 utils/structured_output），用完仍失败才重新生成
+    STRUCTURED_OUTPUT_MAX_FIXES: int = 1
+
     class Config:
         env_file = ".env"
         extra = "allow"  # 允许额外的环境变量
\ No newline at end of file
@@ -87,7 +87,7 @@ SPECTACULAR_SETTINGS = {
 
 # JWT配置与FastAPI一致
 FASTAPI_JWT = {
-    'SECRET_KEY': "your-production-secret-key",  # 用于签名和验证 JWT 的密钥
+    'SECRET_KEY': os.environ.get('FASTAPI_SECRET_KEY'),  # 必须与 FastAPI 的 SECRET_KEY 一致，本地验签模式下未设置时启动检查报错
     'ALGORITHM': 'HS256',                 # JWT 使用的签名算法
     'USER_ID_FIELD': 'sub',  # JWT payload 中存储用户ID的字段名
     'USER_ID_CLAIM': 'sub',  # 声明从哪个字段获取用户身份信息
@@ -128,6 +128,16 @@ CORS_ALLOW_HEADERS = [
 
 FASTAPI_AUTH_VALIDATE_URL = 'http://localhost:8000/api/v1/auth/validate'  # FastAPI的token验证接口
 
+# FastAPIAuthMiddleware 的验证方式
+FASTAPI_AUTH = {
+    'MODE': os.environ.get('FASTAPI_AUTH_MODE', 'local'),  # local：本地验签；remote：每个新令牌调用 FastAPI 验证
+    'REMOTE_FALLBACK': True,  # 本地验签因密钥不一致失败时回退到 FastAPI 验证
+    'REMOTE_TIMEOUT': 3,      # 调用 FastAPI 验证接口的超时（秒）
+    'CACHE_TTL': 60,          # 已验证令牌的缓存时间（秒），不会超过令牌自身的过期时间
+    'CACHE_MAX_ENTRIES': 10000,
+    'USER_CHECK_TTL': 300,    # 本地验签后每隔多少秒向 FastAPI 确认一次用户仍然存在（按用户 id 缓存），0 表示不确认
+}
+
 
 
 
@@ -275,3 +285,10 @@ ZHIPUAI_MODEL_NAME = "glm-4"
 
 
 
+
+# 预生成题池（student/exercises/services/exercise_pool.py）
+EXERCISE_POOL_ENABLED = True  # 关闭后恢复请求时同步调用 LLM 出题
+EXERCISE_POOL_LOW_WATERMARK = 3  # 某个 (知识点, 难度, 练习类型) 剩余题目低于该值时后台补充
+EXERCISE_POOL_TARGET_SIZE = 10
+EXERCISE_POOL_BACKGROUND_REFILL = True  # 由 replenish_exercise_pool --loop 单独补充时可关闭
+STRUCTURED_OUTPUT_MAX_FIXES = 1  # LLM 返回的 JSON 本地修复失败后请模型修正的次数
@@ -1,12 +1,38 @@
 # utils/jwt_utils.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
 import jwt
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework.exceptions import AuthenticationFailed
 
+USER_CONFIRMED_KEY_PREFIX = 'fastapi_jwt:user_confirmed:'
+
+
 class FastAPIJWTValidator:
     """
     用于验证 FastAPI 生成的 JWT 令牌
     """
+    @staticmethod
+    def decode(token: str) -> dict:
+        """
+        本地验签并解码，失败时抛出 PyJWT 的原始异常，便于调用方区分过期和签名不匹配
+        """
+        return jwt.decode(
+            token,
+            settings.FASTAPI_JWT['SECRET_KEY'],
+            algorithms=[settings.FASTAPI_JWT['ALGORITHM']],
+            options={
+                'verify_exp': True,  # 验证过期时间
+                'verify_signature': True,  # 验证签名
+                'require': ['exp', settings.FASTAPI_JWT['USER_ID_CLAIM']],
+            }
+        )
+
     @staticmethod
     def validate_token(token: str) -> dict:
         """
@@ -16,17 +42,101 @@ class FastAPIJWTValidator:
         :raises: AuthenticationFailed 如果验证失败
         """
         try:
-            payload = jwt.decode(
-                token,
-                settings.FASTAPI_JWT['SECRET_KEY'],
-                algorithms=[settings.FASTAPI_JWT['ALGORITHM']],
-                options={
-                    'verify_exp': True,  # 验证过期时间
-                    'verify_signature': True,  # 验证签名
-                }
-            )
-            return payload
+            return FastAPIJWTValidator.decode(token)
         except jwt.ExpiredSignatureError:
             raise AuthenticationFailed('Token has expired')
         except jwt.InvalidTokenError as e:
-            raise AuthenticationFailed(f'Invalid token: {str(e)}')
\ No newline at end of file
+            raise AuthenticationFailed(f'Invalid token: {str(e)}')
+
+    @staticmethod
+    def to_auth_user(payload: dict) -> dict:
+        """转换为与 FastAPI /auth/validate 返回值相同的结构"""
+        return {
+            'valid': True,
+            'user_id': int(payload[settings.FASTAPI_JWT['USER_ID_CLAIM']]),
+            'username': payload.get('username'),
+            'role': payload.get(settings.FASTAPI_JWT['ROLE_CLAIM']),
+        }
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def token_expires_at(token: str) -> Optional[float]:
+    """读取令牌的 exp（不验签，只用于确定缓存的有效期）"""
+    try:
+        exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+    except jwt.InvalidTokenError:
+        return None
+    return float(exp) if exp is not None else None
+
+
+def is_user_confirmed(user_id: int) -> bool:
+    """USER_CHECK_TTL 内是否已向 FastAPI 确认过该用户仍然存在"""
+    return bool(cache.get(USER_CONFIRMED_KEY_PREFIX + str(user_id)))
+
+
+def mark_user_confirmed(user_id: int) -> None:
+    cache.set(USER_CONFIRMED_KEY_PREFIX + str(user_id), True, timeout=settings.FASTAPI_AUTH['USER_CHECK_TTL'])
+
+
+class ValidatedTokenCache:
+    """
+    已验证令牌 -> 用户信息 的进程内缓存
+    条目有效期取 TTL 和令牌 exp 中较早的一个，过期令牌不会因为缓存而继续可用
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 令牌摘要 -> (缓存到期时间, 用户信息)
+        self._entries = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = token_digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, token: str, auth_user: dict, expires_at: Optional[float] = None) -> None:
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        key = token_digest(token)
+        with self._lock:
+            self._entries[key] = (deadline, auth_user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token_digest(token), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> ValidatedTokenCache:
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                _token_cache = ValidatedTokenCache(
+                    ttl=settings.FASTAPI_AUTH['CACHE_TTL'],
+                    max_entries=settings.FASTAPI_AUTH['CACHE_MAX_ENTRIES'],
+                )
+    return _token_cache
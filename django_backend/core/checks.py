@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_fastapi_secret_key(app_configs, **kwargs):
+    """本地验签模式必须显式配置与 FastAPI 一致的密钥，否则所有令牌都会验签失败"""
+    if settings.FASTAPI_AUTH['MODE'] != 'local' or settings.FASTAPI_JWT.get('SECRET_KEY'):
+        return []
+    return [
+        Error(
+            'FASTAPI_JWT["SECRET_KEY"] 未配置',
+            hint='设置环境变量 FASTAPI_SECRET_KEY 为 FastAPI 的 SECRET_KEY，或设置 FASTAPI_AUTH_MODE=remote',
+            id='core.E001',
+        )
+    ]
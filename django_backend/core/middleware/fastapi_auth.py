@@ -1,12 +1,30 @@
 # core/middleware/fastapi_auth.py
+import jwt
 import requests
 from django.conf import settings
 from django.http import HttpResponse, HttpResponseForbidden
 from django.utils.deprecation import MiddlewareMixin
 
+from campus_agent.utils.jwt_utils import (
+    FastAPIJWTValidator,
+    get_token_cache,
+    is_user_confirmed,
+    mark_user_confirmed,
+    token_expires_at,
+)
+
+
 class FastAPIAuthMiddleware(MiddlewareMixin):
-    """用于验证 FastAPI 生成的 JWT 令牌的中间件"""
-    
+    """
+    用于验证 FastAPI 生成的 JWT 令牌的中间件
+
+    默认（FASTAPI_AUTH['MODE'] = 'local'）使用与 FastAPI 相同的密钥在本地验签，
+    验证结果按令牌缓存，不再为每个请求调用 FastAPI；
+    本地验签因密钥不一致失败时，若开启 REMOTE_FALLBACK，再回退到 FastAPI 的 /validate 接口。
+    本地验签无法得知用户是否已被删除，每个用户每隔 USER_CHECK_TTL 秒调用一次 /validate 确认，
+    被删除用户的令牌最迟在 USER_CHECK_TTL + CACHE_TTL 秒后失效。
+    """
+
     def process_request(self, request):
          # 打印请求基本信息
         print(f"\n===== [AuthMiddleware 调试] 开始处理请求 =====")
@@ -16,47 +34,99 @@ class FastAPIAuthMiddleware(MiddlewareMixin):
         # 1. 跳过不需要认证的接口（如登录、注册）
         if request.path in ["/api/auth/login", "/api/auth/register"]:
             print(f"[AuthMiddleware 调试] 路径 {request.path} 无需认证，直接放行")
-            return None  
-        
+            return None
+
         # 2. 从请求头提取令牌
         auth_header = request.META.get("HTTP_AUTHORIZATION")
         # print(f"[AuthMiddleware 调试] 提取到的认证头: {auth_header}")
         if not auth_header or not auth_header.startswith("Bearer "):
             print(f"[AuthMiddleware 调试] 错误：未提供有效的 Bearer 令牌")
             return HttpResponse('未提供有效的令牌（格式：Bearer <token>）', status=401)
-        
+
         token = auth_header.split("Bearer ")[1].strip()  # 提取令牌内容
         # print(f"[AuthMiddleware 调试] 提取到令牌: {token}")
 
+        # 3. 命中缓存直接放行
+        token_cache = get_token_cache()
+        user_data = token_cache.get(token)
+        if user_data is not None:
+            request.META['FASTAPI_AUTH_USER'] = user_data
+            return None
+
+        # 4. 本地验签，必要时回退到 FastAPI 的 /validate 接口
+        if settings.FASTAPI_AUTH['MODE'] == 'local':
+            try:
+                payload = FastAPIJWTValidator.decode(token)
+                user_data = FastAPIJWTValidator.to_auth_user(payload)
+            except jwt.ExpiredSignatureError:
+                return HttpResponse('令牌验证失败：令牌已过期', status=401)
+            except jwt.InvalidSignatureError:
+                if not settings.FASTAPI_AUTH['REMOTE_FALLBACK']:
+                    return HttpResponse('令牌验证失败：签名无效', status=401)
+                print(f"[AuthMiddleware 调试] 本地验签失败，回退到 FastAPI 验证")
+            except (jwt.InvalidTokenError, ValueError) as e:
+                return HttpResponse(f'令牌验证失败：{str(e)}', status=401)
+            else:
+                return self._confirm_user(request, token, user_data, payload.get('exp'))
 
-        
-        # 3. 调用 FastAPI 的 /validate 接口验证令牌
+        return self._validate_remote(request, token)
+
+    def _confirm_user(self, request, token, user_data, expires_at):
+        """
+        本地验签通过后确认用户仍然存在：USER_CHECK_TTL 内已确认过的用户直接放行，
+        否则调用 FastAPI 的 /validate；FastAPI 不可用时沿用令牌中的用户信息，不影响登录状态
+        """
+        if settings.FASTAPI_AUTH['USER_CHECK_TTL'] and not is_user_confirmed(user_data['user_id']):
+            try:
+                response = requests.get(
+                    url=settings.FASTAPI_AUTH_VALIDATE_URL,
+                    headers={"Authorization": f"Bearer {token}"},
+                    timeout=settings.FASTAPI_AUTH['REMOTE_TIMEOUT']
+                )
+            except requests.exceptions.RequestException as e:
+                print(f"[AuthMiddleware 调试] 用户确认失败，使用本地验签结果：{str(e)}")
+            else:
+                if response.status_code == 401:
+                    return HttpResponse('令牌验证失败：用户不存在或已被删除', status=401)
+                if response.status_code == 200:
+                    # 以数据库中的用户信息为准（角色、用户名可能已被修改）
+                    user_data = response.json()
+                    mark_user_confirmed(user_data['user_id'])
+                else:
+                    print(f"[AuthMiddleware 调试] 用户确认返回 {response.status_code}，使用本地验签结果")
+
+        get_token_cache().put(token, user_data, expires_at=expires_at)
+        request.META['FASTAPI_AUTH_USER'] = user_data
+        print(f"[中间件调试] FASTAPI_AUTH_USER 值: {user_data}")
+        return None
+
+    def _validate_remote(self, request, token):
         try:
             # 向 FastAPI 发送验证请求（使用你配置的 FASTAPI_AUTH_VALIDATE_URL）
             response = requests.get(
                 url=settings.FASTAPI_AUTH_VALIDATE_URL,
-                headers={"Authorization": f"Bearer {token}"}
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=settings.FASTAPI_AUTH['REMOTE_TIMEOUT']
             )
-            
+
             print(f"[AuthMiddleware 调试] 验证响应状态码: {response.status_code}")
             # print(f"[AuthMiddleware 调试] 响应内容（前200字符）: {response.text[:200]}...")
 
-            # 4. 处理 FastAPI 的返回结果
+            # 处理 FastAPI 的返回结果
             if response.status_code == 200:
                 # 验证成功：将用户信息绑定到 request 对象，供视图使用
                 user_data = response.json()  # 例如：{"user_id": 1, "role": "student"}
+                get_token_cache().put(token, user_data, expires_at=token_expires_at(token))
                  # 设置到原生请求对象的 META 中
                 request.META['FASTAPI_AUTH_USER'] = user_data
-                # 打印原生 META 键确认
-                # print(f"[中间件调试] 原生 request.META 键: {request.META.keys()}")
                 print(f"[中间件调试] FASTAPI_AUTH_USER 值: {user_data}")
                 return None
-            
+
             else:
                 # 验证失败（令牌无效、过期等）
                 return HttpResponse(f"令牌验证失败：{response.json().get('detail', '未知错误')}", status=401)
-        
+
         except requests.exceptions.RequestException as e:
             # 与 FastAPI 通信失败（如 FastAPI 未启动）
             print(f"[AuthMiddleware 调试] 认证服务通信失败：{str(e)}")
-            return HttpResponseForbidden(f"认证服务不可用：{str(e)}")
\ No newline at end of file
+            return HttpResponseForbidden(f"认证服务不可用：{str(e)}")
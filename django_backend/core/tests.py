@@ -1,3 +1,98 @@
-from django.test import TestCase
+import time
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+import jwt
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from campus_agent.utils.jwt_utils import get_token_cache
+from core.middleware.fastapi_auth import FastAPIAuthMiddleware
+
+
+def make_token(secret=None, expires_in=3600, **claims):
+    payload = {'sub': '7', 'role': 'student', 'username': 'alice', 'exp': int(time.time()) + expires_in}
+    payload.update(claims)
+    return jwt.encode(payload, secret or settings.FASTAPI_JWT['SECRET_KEY'], algorithm='HS256')
+
+
+def validate_response(status_code=200, **user):
+    data = {'valid': True, 'user_id': 7, 'username': 'alice', 'role': 'student'}
+    data.update(user)
+    return MagicMock(status_code=status_code, json=lambda: data if status_code == 200 else {'detail': '无效的认证凭据'})
+
+
+@override_settings(FASTAPI_JWT={**settings.FASTAPI_JWT, 'SECRET_KEY': 'test-secret'})
+class FastAPIAuthMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = FastAPIAuthMiddleware(lambda request: None)
+        get_token_cache().clear()
+        cache.clear()
+        # 用户存在性确认默认返回令牌中的用户
+        patcher = patch('core.middleware.fastapi_auth.requests.get', return_value=validate_response())
+        self.remote = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def authenticate(self, token):
+        request = self.factory.post('/api/student/exercises/generate/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return request, self.middleware.process_request(request)
+
+    def test_local_verification_confirms_user_once_per_ttl(self):
+        request, response = self.authenticate(make_token())
+        self.assertIsNone(response)
+        self.assertEqual(request.META['FASTAPI_AUTH_USER'], {
+            'valid': True, 'user_id': 7, 'username': 'alice', 'role': 'student'
+        })
+        # 同一用户的其他令牌在 USER_CHECK_TTL 内不再调用 FastAPI
+        _, response = self.authenticate(make_token(expires_in=1800))
+        self.assertIsNone(response)
+        self.remote.assert_called_once()
+
+    def test_deleted_user_rejected(self):
+        self.remote.return_value = validate_response(status_code=401)
+        _, response = self.authenticate(make_token())
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_check_failure_keeps_local_result(self):
+        self.remote.side_effect = requests.exceptions.ConnectionError('refused')
+        request, response = self.authenticate(make_token())
+        self.assertIsNone(response)
+        self.assertEqual(request.META['FASTAPI_AUTH_USER']['user_id'], 7)
+
+    @override_settings(FASTAPI_AUTH={**settings.FASTAPI_AUTH, 'USER_CHECK_TTL': 0})
+    def test_user_check_disabled(self):
+        _, response = self.authenticate(make_token())
+        self.assertIsNone(response)
+        self.remote.assert_not_called()
+
+    def test_cached_token_skips_decode(self):
+        token = make_token()
+        self.authenticate(token)
+        with patch('core.middleware.fastapi_auth.FastAPIJWTValidator.decode') as decode:
+            request, response = self.authenticate(token)
+        self.assertIsNone(response)
+        decode.assert_not_called()
+        self.assertEqual(request.META['FASTAPI_AUTH_USER']['user_id'], 7)
+
+    def test_expired_token_rejected(self):
+        _, response = self.authenticate(make_token(expires_in=-10))
+        self.assertEqual(response.status_code, 401)
+        self.remote.assert_not_called()
+
+    def test_cache_entry_never_outlives_token(self):
+        token = make_token(expires_in=1)
+        self.authenticate(token)
+        with patch('campus_agent.utils.jwt_utils.time.time', return_value=time.time() + 5):
+            self.assertIsNone(get_token_cache().get(token))
+
+    def test_signature_mismatch_falls_back_to_remote(self):
+        self.remote.return_value = validate_response(user_id=8, username='bob')
+        token = make_token(secret='another-secret')
+        request, response = self.authenticate(token)
+        self.assertIsNone(response)
+        self.assertEqual(request.META['FASTAPI_AUTH_USER']['user_id'], 8)
+        # 回退验证的结果同样进入缓存
+        self.authenticate(token)
+        self.remote.assert_called_once()
@@ -101,6 +101,13 @@ class Exercise(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # 预生成题池中尚未分配给学生的题目（见 services/exercise_pool），分配后置为 False
+    is_pooled = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_pooled', 'difficulty', 'exercise_type'], name='exercise_pool_idx'),
+        ]
 
     def clean(self):
         super().clean()
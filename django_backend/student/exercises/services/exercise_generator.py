@@ -5,6 +5,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from student.exercises.models import Exercise, ExerciseAttempt, StudentProfile, KnowledgePoint
 # 移除对 Django User 模型的依赖
 from .llm_service import LLMService
+from .exercise_pool import claim_exercise, create_exercise_from_llm, pool_enabled
 
 llm = LLMService()  # 初始化LLM服务
 
@@ -134,34 +135,34 @@ def generate_personalized_exercise(student_id, difficulty=None, knowledge_point_
 
 
 
-    # 5. 优先尝试LLM生成题目
-    if _should_use_llm(student_data):
+    # 5. 优先使用LLM生成的题目：开启题池时从预生成的题池中分配（只查库），题池为空时降级到数据库题目并触发后台补充，
+    #    数据库也没有合适题目（如题池冷启动）时才同步调用LLM
+    use_llm = _should_use_llm(student_data)
+    if use_llm and pool_enabled():
+        pool_kp_ids = knowledge_point_ids or list(KnowledgePoint.objects.filter(
+            name__in=student_data['weak_points']
+        ).values_list('id', flat=True))
+        exercise = claim_exercise(difficulty, exercise_type, pool_kp_ids)
+        if exercise is not None:
+            print(f"[题池] 分配题目 {exercise.id}")
+            return exercise
         try:
-            llm_result = llm.generate_question(
-                student_data=student_data,
+            return _get_fallback_exercise(
+                student_id=student_id_int,
                 difficulty=difficulty,
                 knowledge_point_ids=knowledge_point_ids,
-                exercise_type=exercise_type 
+                exercise_type=exercise_type
             )
-            
-            if "error" not in llm_result:
-                # 创建并返回新题目（适配Exercise模型）
-                return Exercise.objects.create(
-                    title=llm_result.get("title", "AI生成题目"),
-                    content=llm_result["question"],
-                    question_type=llm_result.get("question_type", "mc"),
-                    difficulty=difficulty,
-                    answer={
-                        "reference_answer": llm_result["answer"]["reference_answer"],  # 适配LLM返回格式
-                        "options": llm_result.get("options", []),
-                        "explanation": llm_result["answer"].get("explanation", "")
-                    },
-                    explanation=llm_result["answer"].get("explanation", ""),
-                    is_active=True,
-                    exercise_type=exercise_type  # 存储练习类型
-                )
-        except Exception as e:
-            print(f"[LLM Fallback] 生成失败: {str(e)}")
+        except ValueError:
+            print("[题池] 题池和数据库均无合适题目，同步调用LLM生成")
+            exercise = _generate_with_llm(student_data, difficulty, knowledge_point_ids, exercise_type)
+            if exercise is None:
+                raise
+            return exercise
+    elif use_llm:
+        exercise = _generate_with_llm(student_data, difficulty, knowledge_point_ids, exercise_type)
+        if exercise is not None:
+            return exercise
 
 
     # 6. 降级到数据库题目
@@ -173,6 +174,26 @@ def generate_personalized_exercise(student_id, difficulty=None, knowledge_point_
     )
 
 
+def _generate_with_llm(student_data, difficulty, knowledge_point_ids, exercise_type):
+    """同步调用LLM生成并保存题目，失败时返回 None"""
+    try:
+        llm_result = llm.generate_question(
+            student_data=student_data,
+            difficulty=difficulty,
+            knowledge_point_ids=knowledge_point_ids,
+            exercise_type=exercise_type 
+        )
+        
+        if "error" not in llm_result:
+            # 创建并返回新题目（适配Exercise模型）
+            return create_exercise_from_llm(
+                llm_result, difficulty, exercise_type or 'knowledge', knowledge_point_ids
+            )
+    except Exception as e:
+        print(f"[LLM Fallback] 生成失败: {str(e)}")
+    return None
+
+
 
 
 
@@ -214,7 +235,8 @@ def _get_fallback_exercise(student_id, difficulty, knowledge_point_ids=None, exe
     base_query = Exercise.objects.filter(
         difficulty__iexact=difficulty,  # 严格匹配难度
         exercise_type=exercise_type if exercise_type else Exercise.exercise_type,  # 匹配练习类型（如果指定）
-        is_active=True
+        is_active=True,
+        is_pooled=False  # 题池中的题目只通过 claim_exercise 分配
     ).exclude(id__in=recent_attempts)  # 排除近期做过的
     print(f"基础查询（难度+类型）结果数: {base_query.count()}")
 
@@ -265,7 +287,8 @@ def _get_fallback_exercise(student_id, difficulty, knowledge_point_ids=None, exe
         queryset = get_qualified_query(base_query | Exercise.objects.filter(
             difficulty__iexact=difficulty,
             exercise_type=exercise_type if exercise_type else Exercise.exercise_type,
-            is_active=True
+            is_active=True,
+            is_pooled=False
         ))  # 重新加入近期做过的题目
         if queryset and queryset.exists():
             print(f"放宽条件（允许重复做过的题目），结果数: {queryset.count()}")
@@ -280,7 +303,8 @@ def _get_fallback_exercise(student_id, difficulty, knowledge_point_ids=None, exe
             queryset = Exercise.objects.filter(
                 difficulty__in=allowed_difficulties,
                 exercise_type=exercise_type if exercise_type else Exercise.exercise_type,
-                is_active=True
+                is_active=True,
+                is_pooled=False
             )
             queryset = get_qualified_query(queryset)
             if queryset and queryset.exists():
@@ -290,7 +314,7 @@ def _get_fallback_exercise(student_id, difficulty, knowledge_point_ids=None, exe
     # 5. 最终检查（确保有可用题目）
     if not queryset or not queryset.exists():
         raise ValueError(
-            f"无符合条件的题目（难度: {difficulty}，类型: {exercise_type}，知识点: {knowledge_point_ids[:3]}...）"
+            f"无符合条件的题目（难度: {difficulty}，类型: {exercise_type}，知识点: {(knowledge_point_ids or [])[:3]}...）"
         )
 
 
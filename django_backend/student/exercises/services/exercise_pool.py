@@ -0,0 +1,229 @@
+"""
+预生成题池：按 (知识点, 难度, 练习类型) 提前用 LLM 生成题目，请求时直接从库中分配
+
+需要 LLM 出题的学生（有薄弱知识点或正确率偏低）是大多数，每次出题同步调用 LLM 要等好几秒。
+题池中的题目是 is_pooled=True 的 Exercise，分配给学生时用条件 UPDATE 置为 False，
+并发请求不会拿到同一道题；分配后的题目与原先同步生成的题目一样，成为普通题目。
+不限知识点的键 (None, 难度, 类型) 只包含没有关联知识点的题目，不会占用或消耗各知识点的题池。
+
+题池为空（冷启动、补充跟不上）时，generate_personalized_exercise 先降级到数据库中的现有题目，
+数据库也没有合适题目时才同步调用 LLM，保证开启题池后仍能出题。
+
+补充：
+    - 某个键分配后剩余数量低于 EXERCISE_POOL_LOW_WATERMARK 时，在后台线程中补到 EXERCISE_POOL_TARGET_SIZE，
+      同一个键同时只有一个补充任务
+    - python manage.py replenish_exercise_pool 批量预热（学生薄弱知识点涉及的所有键），
+      加 --loop 可作为常驻 worker 定期补充
+"""
+import logging
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from student.exercises.models import Exercise, KnowledgePoint, StudentProfile
+
+logger = logging.getLogger(__name__)
+
+DIFFICULTIES = ['easy', 'medium', 'hard']
+EXERCISE_TYPES = ['knowledge', 'weakness', 'simulation']
+# 预生成时没有具体学生，按难度给出一个典型正确率
+DIFFICULTY_CORRECT_RATES = {'easy': 0.5, 'medium': 0.7, 'hard': 0.9}
+
+# (知识点ID 或 None, 难度, 练习类型)
+PoolKey = Tuple[Optional[int], str, str]
+
+_refilling: Set[PoolKey] = set()
+_refilling_lock = threading.Lock()
+_llm = None
+
+
+def pool_enabled() -> bool:
+    return getattr(settings, 'EXERCISE_POOL_ENABLED', True)
+
+
+def low_watermark() -> int:
+    return getattr(settings, 'EXERCISE_POOL_LOW_WATERMARK', 3)
+
+
+def target_size() -> int:
+    return getattr(settings, 'EXERCISE_POOL_TARGET_SIZE', 10)
+
+
+def _get_llm():
+    global _llm
+    if _llm is None:
+        from .llm_service import LLMService
+        _llm = LLMService()
+    return _llm
+
+
+def pool_queryset(key: PoolKey):
+    knowledge_point_id, difficulty, exercise_type = key
+    queryset = Exercise.objects.filter(is_pooled=True, difficulty=difficulty, exercise_type=exercise_type)
+    if knowledge_point_id is None:
+        return queryset.filter(knowledge_points__isnull=True)
+    return queryset.filter(knowledge_points__id=knowledge_point_id)
+
+
+def pool_size(key: PoolKey) -> int:
+    return pool_queryset(key).count()
+
+
+def create_exercise_from_llm(
+    llm_result: dict,
+    difficulty: str,
+    exercise_type: str,
+    knowledge_point_ids: Optional[Iterable[int]] = None,
+    is_pooled: bool = False
+) -> Exercise:
+    """把 LLMService.generate_question 的结果保存为 Exercise"""
+    # answer 可能是字符串，也可能是 {reference_answer, explanation}
+    answer = llm_result["answer"]
+    if not isinstance(answer, dict):
+        answer = {"reference_answer": answer}
+    with transaction.atomic():
+        exercise = Exercise.objects.create(
+            title=llm_result.get("title", "AI生成题目"),
+            content=llm_result["question"],
+            question_type=llm_result.get("question_type", "mc"),
+            difficulty=difficulty,
+            answer={
+                "reference_answer": answer["reference_answer"],
+                "options": llm_result.get("options", []),
+                "explanation": answer.get("explanation", "")
+            },
+            explanation=answer.get("explanation", ""),
+            is_active=True,
+            is_pooled=is_pooled,
+            exercise_type=exercise_type
+        )
+        if knowledge_point_ids:
+            exercise.knowledge_points.set(knowledge_point_ids)
+    return exercise
+
+
+def claim_exercise(
+    difficulty: str,
+    exercise_type: Optional[str],
+    knowledge_point_ids: Optional[List[int]] = None
+) -> Optional[Exercise]:
+    """
+    从题池分配一道题（优先最早生成的），题池为空时返回 None
+    knowledge_point_ids 为空时从不限知识点的题池分配
+    """
+    exercise_type = exercise_type or 'knowledge'
+    if knowledge_point_ids:
+        queryset = Exercise.objects.filter(
+            is_pooled=True, difficulty=difficulty, exercise_type=exercise_type,
+            knowledge_points__id__in=knowledge_point_ids
+        ).distinct()
+    else:
+        queryset = pool_queryset((None, difficulty, exercise_type))
+    # 候选多取几道，被并发请求抢先分配时换下一道
+    for exercise_id in queryset.order_by('created_at', 'id').values_list('id', flat=True)[:5]:
+        if Exercise.objects.filter(id=exercise_id, is_pooled=True).update(is_pooled=False):
+            exercise = Exercise.objects.get(id=exercise_id)
+            _check_watermark(exercise, difficulty, exercise_type, knowledge_point_ids)
+            return exercise
+    logger.info(f"题池为空: 难度={difficulty} 类型={exercise_type} 知识点={knowledge_point_ids}")
+    for key in _keys_for(knowledge_point_ids, difficulty, exercise_type):
+        request_refill(key)
+    return None
+
+
+def _keys_for(knowledge_point_ids: Optional[List[int]], difficulty: str, exercise_type: str) -> List[PoolKey]:
+    if not knowledge_point_ids:
+        return [(None, difficulty, exercise_type)]
+    return [(kp_id, difficulty, exercise_type) for kp_id in knowledge_point_ids]
+
+
+def _check_watermark(
+    exercise: Exercise,
+    difficulty: str,
+    exercise_type: str,
+    knowledge_point_ids: Optional[List[int]]
+) -> None:
+    """分配后检查题目所属的键，低于水位时触发补充"""
+    if knowledge_point_ids:
+        requested = set(knowledge_point_ids)
+        kp_ids = [kp_id for kp_id in exercise.knowledge_points.values_list('id', flat=True) if kp_id in requested]
+    else:
+        kp_ids = []
+    for key in _keys_for(kp_ids, difficulty, exercise_type):
+        if pool_size(key) < low_watermark():
+            request_refill(key)
+
+
+def replenish(key: PoolKey, target: Optional[int] = None, llm=None) -> int:
+    """把一个键的题池补到 target 道，返回新生成的道数；单道生成失败时跳过"""
+    knowledge_point_id, difficulty, exercise_type = key
+    missing = (target or target_size()) - pool_size(key)
+    if missing <= 0:
+        return 0
+    llm = llm or _get_llm()
+    weak_points = []
+    if knowledge_point_id is not None:
+        weak_points = list(KnowledgePoint.objects.filter(id=knowledge_point_id).values_list('name', flat=True))
+    student_data = {"correct_rate": DIFFICULTY_CORRECT_RATES[difficulty], "weak_points": weak_points}
+    created = 0
+    for _ in range(missing):
+        try:
+            llm_result = llm.generate_question(
+                student_data=student_data,
+                difficulty=difficulty,
+                knowledge_point_ids=[knowledge_point_id] if knowledge_point_id is not None else [],
+                exercise_type=exercise_type
+            )
+        except Exception as e:
+            logger.warning(f"题池补充失败 {key}: {str(e)}")
+            continue
+        create_exercise_from_llm(
+            llm_result, difficulty, exercise_type,
+            [knowledge_point_id] if knowledge_point_id is not None else None,
+            is_pooled=True
+        )
+        created += 1
+    logger.info(f"题池 {key} 已补充 {created} 道")
+    return created
+
+
+def request_refill(key: PoolKey) -> None:
+    """在后台线程中补充题池，不占用当前请求；同一个键已在补充时忽略"""
+    if not getattr(settings, 'EXERCISE_POOL_BACKGROUND_REFILL', True):
+        return
+    with _refilling_lock:
+        if key in _refilling:
+            return
+        _refilling.add(key)
+
+    def run():
+        try:
+            replenish(key)
+        except Exception as e:
+            logger.error(f"题池后台补充失败 {key}: {str(e)}", exc_info=True)
+        finally:
+            with _refilling_lock:
+                _refilling.discard(key)
+            # 线程结束时释放本线程的数据库连接
+            connection.close()
+
+    threading.Thread(target=run, name=f"exercise-pool-{key}", daemon=True).start()
+
+
+def demand_keys(all_knowledge_points: bool = False) -> List[PoolKey]:
+    """需要预热的键：学生薄弱知识点（或全部知识点）× 难度 × 练习类型，以及不限知识点的键"""
+    if all_knowledge_points:
+        kp_ids = list(KnowledgePoint.objects.values_list('id', flat=True))
+    else:
+        kp_ids = list(
+            StudentProfile.weak_knowledge_points.through.objects
+            .values_list('knowledgepoint_id', flat=True).distinct()
+        )
+    return [
+        (kp_id, difficulty, exercise_type)
+        for kp_id in kp_ids + [None]
+        for difficulty in DIFFICULTIES
+        for exercise_type in EXERCISE_TYPES
+    ]
@@ -7,8 +7,43 @@ from django.conf import settings
 from student.exercises.models import KnowledgePoint
 
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Union
+from pydantic import BaseModel, ConfigDict, field_validator
 from zhipuai import ZhipuAI
+from utils.llm_gateway import Priority, get_gateway
+from utils.structured_output import parse_or_fix_sync
+
+
+class GeneratedExercise(BaseModel):
+    """generate_question 的返回格式；question_type、options 等其他字段原样保留"""
+    model_config = ConfigDict(extra="allow")
+
+    title: str
+    question: str
+    answer: Union[str, Dict[str, Any]]
+
+    @field_validator("title", "question")
+    @classmethod
+    def _not_empty(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError("不能为空")
+        return value
+
+    @field_validator("answer", mode="before")
+    @classmethod
+    def _normalize_answer(cls, value: Any) -> Any:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return value
+
+    @field_validator("answer")
+    @classmethod
+    def _check_answer(cls, value: Union[str, Dict[str, Any]]) -> Union[str, Dict[str, Any]]:
+        if isinstance(value, dict) and "reference_answer" not in value:
+            raise ValueError("answer为对象时必须包含reference_answer字段")
+        if isinstance(value, str) and not value.strip():
+            raise ValueError("答案为空")
+        return value
 
 
 
@@ -17,16 +52,23 @@ class LLMService:
         self.api_key = api_key or getattr(settings, 'ZHIPUAI_API_KEY', '')
         if not self.api_key:
             raise ValueError("未配置ZHIPUAI_API_KEY")
-        self.client = ZhipuAI(api_key=self.api_key)
+        # 重试由网关统一处理，SDK 自身不再重试
+        self.client = ZhipuAI(api_key=self.api_key, max_retries=0)
+        self.model = getattr(settings, 'ZHIPUAI_MODEL_NAME', 'glm-4')
     
     def _call_zhipuai(self, prompt: str) -> str:
-        """调用智谱AI接口"""
+        """调用智谱AI接口（经网关限流、排队和重试）"""
         try:
-            response = self.client.chat.completions.create(
-                model="glm-4",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                response_format={"type": "json_object"}  # 要求返回JSON格式
+            response = get_gateway().call_sync(
+                "zhipuai",
+                self.model,
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    response_format={"type": "json_object"}  # 要求返回JSON格式
+                ),
+                Priority.INTERACTIVE
             )
             return response.choices[0].message.content
         except Exception as e:
@@ -37,34 +79,36 @@ class LLMService:
                 error_msg = "API调用过于频繁，请稍后再试"
             raise ValueError(error_msg)
     
-    def generate_question(self, student_data: Dict[str, Any], difficulty: str, knowledge_point_ids: list) -> Dict[str, str]:
+    def generate_question(
+        self,
+        student_data: Dict[str, Any],
+        difficulty: str,
+        knowledge_point_ids: list,
+        exercise_type: str = None
+    ) -> Dict[str, Any]:
         """生成题目"""
         try:
-            prompt = self._build_prompt(student_data, difficulty, knowledge_point_ids)
+            prompt = self._build_prompt(student_data, difficulty, knowledge_point_ids, exercise_type)
             llm_output = self._call_zhipuai(prompt)
-            
-            # 尝试解析JSON
-            try:
-                result = json.loads(llm_output)
-            except json.JSONDecodeError:
-                # 如果解析失败，尝试提取可能的JSON部分
-                if "{" in llm_output and "}" in llm_output:
-                    json_str = llm_output[llm_output.index("{"):llm_output.rindex("}")+1]
-                    result = json.loads(json_str)
-                else:
-                    raise ValueError("API返回结果不是有效的JSON格式")
-            
-            # 验证结果格式
-            required_fields = ["title", "question", "answer"]
-            if not all(key in result for key in required_fields):
-                raise ValueError(f"返回结果缺少必要字段，需要包含: {', '.join(required_fields)}")
-                
-            return result
+            # 容错解析并校验字段，本地修复不了时只请模型修正这段输出，不重新出题
+            result = parse_or_fix_sync(
+                llm_output,
+                GeneratedExercise,
+                self._call_zhipuai,
+                max_fixes=getattr(settings, 'STRUCTURED_OUTPUT_MAX_FIXES', None)
+            )
+            return result.model_dump()
             
         except Exception as e:
             raise ValueError(f"题目生成失败: {str(e)}")
 
-    def _build_prompt(self, student_data: Dict[str, Any], difficulty: str, knowledge_point_ids: list) -> str:
+    def _build_prompt(
+        self,
+        student_data: Dict[str, Any],
+        difficulty: str,
+        knowledge_point_ids: list,
+        exercise_type: str = None
+    ) -> str:
         """构造生成题目的提示词"""
         prompt = f"""你必须返回一个严格的JSON格式响应，包含title、question和answer三个字段。
 根据以下要求生成一个数学题目：
@@ -72,6 +116,7 @@ class LLMService:
 - 薄弱点: {', '.join(student_data['weak_points'])}
 - 难度: {difficulty}
 - 知识点ID: {', '.join(map(str, knowledge_point_ids))}
+- 练习类型: {exercise_type or 'normal'}
 
 返回示例格式：
 {{
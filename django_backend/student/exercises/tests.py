@@ -66,4 +66,80 @@ class LLMServiceTestCase(TestCase):
         # 验证
         self.assertEqual(result["title"], "模拟测试题")
         self.assertEqual(result["question"], "1 + 1等于多少？")
-        self.assertEqual(result["answer"], "2")
\ No newline at end of file
+        self.assertEqual(result["answer"], "2")
+    @patch('student.exercises.services.llm_service.ZhipuAI')
+    def test_generate_question_repairs_locally(self, mock_zhipuai):
+        """代码块、前后说明文字、多余逗号在本地修复，不再调用模型"""
+        mock_response = MagicMock()
+        mock_response.choices = [MagicMock()]
+        mock_response.choices[0].message.content = (
+            '好的，题目如下：\n```json\n{"title": "加法", "question": "1 + 1等于多少？", "answer": 2,}\n```\n以上。'
+        )
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.return_value = mock_response
+        mock_zhipuai.return_value = mock_client
+
+        llm = LLMService(api_key="mock_key")
+        result = llm.generate_question(
+            student_data={"correct_rate": 0.5, "weak_points": ["算术"]},
+            difficulty="easy",
+            knowledge_point_ids=[1]
+        )
+
+        self.assertEqual(result["question"], "1 + 1等于多少？")
+        self.assertEqual(result["answer"], "2")
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+
+    @patch('student.exercises.services.llm_service.ZhipuAI')
+    def test_generate_question_fix_prompt(self, mock_zhipuai):
+        """缺少字段时只发送修正请求，修正后的结果直接使用"""
+        def response(content):
+            mock_response = MagicMock()
+            mock_response.choices = [MagicMock()]
+            mock_response.choices[0].message.content = content
+            return mock_response
+
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.side_effect = [
+            response(json.dumps({"title": "加法", "question": "1 + 1等于多少？"}, ensure_ascii=False)),
+            response(json.dumps({"title": "加法", "question": "1 + 1等于多少？", "answer": "2"})),
+        ]
+        mock_zhipuai.return_value = mock_client
+
+        llm = LLMService(api_key="mock_key")
+        result = llm.generate_question(
+            student_data={"correct_rate": 0.5, "weak_points": ["算术"]},
+            difficulty="easy",
+            knowledge_point_ids=[1]
+        )
+
+        self.assertEqual(result["answer"], "2")
+        fix_prompt = mock_client.chat.completions.create.call_args_list[1].kwargs["messages"][0]["content"]
+        self.assertIn("answer", fix_prompt)
+        self.assertIn("1 + 1等于多少？", fix_prompt)
+
+    @patch('student.exercises.services.llm_service.ZhipuAI')
+    def test_generate_question_non_ascii_bare_word(self, mock_zhipuai):
+        """未加引号的中文值无法本地修复时走修正请求，而不是抛出异常"""
+        def response(content):
+            mock_response = MagicMock()
+            mock_response.choices = [MagicMock()]
+            mock_response.choices[0].message.content = content
+            return mock_response
+
+        mock_client = MagicMock()
+        mock_client.chat.completions.create.side_effect = [
+            response('{"title": "判断", "question": "1 + 1等于2吗？", "answer": 正确}'),
+            response(json.dumps({"title": "判断", "question": "1 + 1等于2吗？", "answer": "正确"}, ensure_ascii=False)),
+        ]
+        mock_zhipuai.return_value = mock_client
+
+        llm = LLMService(api_key="mock_key")
+        result = llm.generate_question(
+            student_data={"correct_rate": 0.5, "weak_points": ["算术"]},
+            difficulty="easy",
+            knowledge_point_ids=[1]
+        )
+
+        self.assertEqual(result["answer"], "正确")
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from student.exercises.services.exercise_pool import (
+    DIFFICULTIES,
+    EXERCISE_TYPES,
+    demand_keys,
+    low_watermark,
+    pool_size,
+    replenish,
+    target_size,
+)
+
+
+class Command(BaseCommand):
+    help = 'Pre-generate exercises into the pool for keys below the low watermark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--knowledge-point', type=int, action='append', dest='knowledge_points',
+                            help='只补充指定知识点（可重复），默认取学生薄弱知识点')
+        parser.add_argument('--all-knowledge-points', action='store_true', help='补充所有知识点')
+        parser.add_argument('--difficulty', choices=DIFFICULTIES, help='只补充指定难度')
+        parser.add_argument('--exercise-type', choices=EXERCISE_TYPES, help='只补充指定练习类型')
+        parser.add_argument('--target', type=int, help='每个键补到的道数，默认 EXERCISE_POOL_TARGET_SIZE')
+        parser.add_argument('--loop', action='store_true', help='常驻运行，每隔 --interval 秒检查一次')
+        parser.add_argument('--interval', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            created = self.replenish_once(options)
+            self.stdout.write(self.style.SUCCESS(f"Pool replenished: {created} exercises created"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def replenish_once(self, options) -> int:
+        if options['knowledge_points']:
+            keys = [
+                (kp_id, difficulty, exercise_type)
+                for kp_id in options['knowledge_points']
+                for difficulty in DIFFICULTIES
+                for exercise_type in EXERCISE_TYPES
+            ]
+        else:
+            keys = demand_keys(all_knowledge_points=options['all_knowledge_points'])
+        keys = [
+            key for key in keys
+            if (not options['difficulty'] or key[1] == options['difficulty'])
+            and (not options['exercise_type'] or key[2] == options['exercise_type'])
+        ]
+        target = options['target'] or target_size()
+        created = 0
+        for key in keys:
+            size = pool_size(key)
+            # 只补充低于水位的键；显式指定 --target 时补到目标道数
+            if size >= low_watermark() and not options['target']:
+                continue
+            if size < target:
+                self.stdout.write(f"{key}: {size} -> {target}")
+                created += replenish(key, target)
+        return created
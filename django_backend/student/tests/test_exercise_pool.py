@@ -0,0 +1,121 @@
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from student.exercises.models import Exercise, KnowledgePoint, StudentProfile
+from student.exercises.services import exercise_pool
+from student.exercises.services.exercise_generator import generate_personalized_exercise
+
+
+def fake_llm():
+    llm = MagicMock()
+    llm.generate_question.side_effect = lambda **kwargs: {
+        "title": "预生成题目",
+        "question": f"关于知识点 {kwargs['knowledge_point_ids']} 的题目",
+        "answer": "A",
+    }
+    return llm
+
+
+@override_settings(EXERCISE_POOL_BACKGROUND_REFILL=False, EXERCISE_POOL_LOW_WATERMARK=2, EXERCISE_POOL_TARGET_SIZE=3)
+class ExercisePoolTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.kp = KnowledgePoint.objects.create(name="树莓派GPIO控制", description="GPIO")
+        cls.other_kp = KnowledgePoint.objects.create(name="OpenCV人脸检测", description="OpenCV")
+        cls.profile = StudentProfile.objects.create(fastapi_user_id=1001, username="student", correct_rate=0.5)
+        cls.profile.weak_knowledge_points.add(cls.kp)
+
+    def fill_pool(self, kp=None, difficulty='easy', exercise_type='knowledge', target=3):
+        key = (kp.id if kp else None, difficulty, exercise_type)
+        return exercise_pool.replenish(key, target, llm=fake_llm())
+
+    def test_replenish_fills_to_target(self):
+        self.assertEqual(self.fill_pool(self.kp), 3)
+        # 已经达到目标道数时不再生成
+        self.assertEqual(self.fill_pool(self.kp), 0)
+        pooled = Exercise.objects.filter(is_pooled=True)
+        self.assertEqual(pooled.count(), 3)
+        self.assertEqual(list(pooled.first().knowledge_points.all()), [self.kp])
+        self.assertEqual(pooled.first().answer["reference_answer"], "A")
+
+    def test_claim_serves_each_exercise_once(self):
+        self.fill_pool(self.kp)
+        claimed = {exercise_pool.claim_exercise('easy', 'knowledge', [self.kp.id]).id for _ in range(3)}
+        self.assertEqual(len(claimed), 3)
+        self.assertFalse(Exercise.objects.filter(id__in=claimed, is_pooled=True).exists())
+        self.assertIsNone(exercise_pool.claim_exercise('easy', 'knowledge', [self.kp.id]))
+
+    def test_claim_matches_key(self):
+        self.fill_pool(self.kp)
+        self.assertIsNone(exercise_pool.claim_exercise('easy', 'knowledge', [self.other_kp.id]))
+        self.assertIsNone(exercise_pool.claim_exercise('hard', 'knowledge', [self.kp.id]))
+        self.assertIsNone(exercise_pool.claim_exercise('easy', 'weakness', [self.kp.id]))
+        # 不限知识点的请求不消耗各知识点的题池
+        self.assertIsNone(exercise_pool.claim_exercise('easy', 'knowledge'))
+        self.fill_pool()
+        self.assertIsNotNone(exercise_pool.claim_exercise('easy', 'knowledge'))
+
+    def test_any_knowledge_point_pool_counts_only_unlinked_exercises(self):
+        self.fill_pool(self.kp)
+        self.assertEqual(exercise_pool.pool_size((None, 'easy', 'knowledge')), 0)
+        self.assertEqual(self.fill_pool(), 3)
+        self.assertEqual(exercise_pool.pool_size((None, 'easy', 'knowledge')), 3)
+        self.assertEqual(exercise_pool.pool_size((self.kp.id, 'easy', 'knowledge')), 3)
+
+    def test_low_watermark_triggers_refill(self):
+        self.fill_pool(self.kp)
+        with patch.object(exercise_pool, 'request_refill') as request_refill:
+            exercise_pool.claim_exercise('easy', 'knowledge', [self.kp.id])
+            request_refill.assert_not_called()
+            exercise_pool.claim_exercise('easy', 'knowledge', [self.kp.id])
+            request_refill.assert_called_once_with((self.kp.id, 'easy', 'knowledge'))
+
+    def test_personalized_exercise_served_from_pool(self):
+        """需要 LLM 出题的学生从题池分配，请求内不调用 LLM"""
+        self.fill_pool(self.kp)
+        with patch('student.exercises.services.exercise_generator.llm') as llm:
+            exercise = generate_personalized_exercise(1001, difficulty='easy', exercise_type='knowledge')
+            llm.generate_question.assert_not_called()
+        self.assertFalse(exercise.is_pooled)
+        self.assertIn(self.kp, exercise.knowledge_points.all())
+
+    def test_pool_miss_falls_back_to_database(self):
+        preset = Exercise.objects.create(
+            title="预置题目", content="预置题目", difficulty='easy',
+            answer={"reference_answer": "A"}, exercise_type='knowledge'
+        )
+        preset.knowledge_points.add(self.kp)
+        with patch('student.exercises.services.exercise_generator.llm') as llm, \
+                patch.object(exercise_pool, 'request_refill') as request_refill:
+            exercise = generate_personalized_exercise(1001, difficulty='easy', exercise_type='knowledge')
+            llm.generate_question.assert_not_called()
+        self.assertEqual(exercise, preset)
+        request_refill.assert_called_once_with((self.kp.id, 'easy', 'knowledge'))
+
+    def test_fallback_skips_pooled_exercises(self):
+        self.fill_pool(self.kp)
+        with patch('student.exercises.services.exercise_generator.claim_exercise', return_value=None), \
+                patch('student.exercises.services.exercise_generator.llm') as llm:
+            llm.generate_question.return_value = {"error": "模型不可用"}
+            with self.assertRaises(ValueError):
+                generate_personalized_exercise(1001, difficulty='easy', exercise_type='knowledge')
+        self.assertEqual(Exercise.objects.filter(is_pooled=True).count(), 3)
+
+    def test_cold_start_generates_synchronously(self):
+        """题池和数据库都没有合适题目时同步调用 LLM，而不是直接报错"""
+        with patch('student.exercises.services.exercise_generator.llm', fake_llm()) as llm, \
+                patch.object(exercise_pool, 'request_refill') as request_refill:
+            exercise = generate_personalized_exercise(1001, difficulty='easy', exercise_type='knowledge')
+        llm.generate_question.assert_called_once()
+        self.assertFalse(exercise.is_pooled)
+        request_refill.assert_called_once_with((self.kp.id, 'easy', 'knowledge'))
+
+    def test_replenish_command_fills_weak_points(self):
+        with patch.object(exercise_pool, '_get_llm', return_value=fake_llm()):
+            call_command('replenish_exercise_pool', '--difficulty', 'easy', '--exercise-type', 'knowledge',
+                         stdout=StringIO())
+        self.assertEqual(exercise_pool.pool_size((self.kp.id, 'easy', 'knowledge')), 3)
+        self.assertEqual(exercise_pool.pool_size((self.other_kp.id, 'easy', 'knowledge')), 0)
@@ -23,6 +23,8 @@ from backend.app.db.base_class import Base
 import backend.app.models.user
 import backend.app.models.course
 import backend.app.models.exam
+import backend.app.models.chat
+import backend.app.models.exam_job
 
 # 添加模型的元数据
 target_metadata = Base.metadata
@@ -0,0 +1,50 @@
+"""add exam jobs
+
+Revision ID: 7c2e9d4b1a6f
+Revises: 23281893f1c9
+Create Date: 2026-10-18 10:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e9d4b1a6f'
+down_revision: Union[str, None] = '23281893f1c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('exam_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('idempotency_key', sa.String(length=64), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('request', sa.Text(), nullable=False),
+    sa.Column('progress', sa.Text(), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('worker_id', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_exam_jobs_user_id'), 'exam_jobs', ['user_id'], unique=False)
+    op.create_index(op.f('ix_exam_jobs_idempotency_key'), 'exam_jobs', ['idempotency_key'], unique=False)
+    op.create_index(op.f('ix_exam_jobs_status'), 'exam_jobs', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_exam_jobs_status'), table_name='exam_jobs')
+    op.drop_index(op.f('ix_exam_jobs_idempotency_key'), table_name='exam_jobs')
+    op.drop_index(op.f('ix_exam_jobs_user_id'), table_name='exam_jobs')
+    op.drop_table('exam_jobs')
@@ -0,0 +1,29 @@
+"""add chat session summary
+
+Revision ID: b5d8a1f7e2c3
+Revises: 9f3b6e2a4c1d
+Create Date: 2026-10-18 17:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d8a1f7e2c3'
+down_revision: Union[str, None] = '9f3b6e2a4c1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('chat_sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summary_until_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('chat_sessions') as batch_op:
+        batch_op.drop_column('summary_until_id')
+        batch_op.drop_column('summary')
@@ -0,0 +1,236 @@
+"""
+接口压测：按指定并发驱动学生问答、组卷和练习生成接口，统计 p50/p95/p99 延迟和吞吐量
+
+    python scripts/benchmark.py --scenarios qa,exam,exercise --concurrency 8 --requests 50 \
+        --student student1:123456 --teacher teacher1:123456
+
+配合 scripts/mock_llm_server.py 可以在没有真实模型服务的环境下重复测量（见 README）。
+--json 输出机器可读的结果，便于在 CI 中与上一次的结果比较。
+"""
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+QA_QUESTIONS = [
+    "什么是数据库事务的ACID特性？",
+    "TCP三次握手的过程是怎样的？",
+    "进程和线程有什么区别？",
+    "请解释一下快速排序的时间复杂度。",
+    "什么是操作系统中的死锁？如何避免？",
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法百分位"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Scenario:
+    def __init__(self, name: str, send: Callable[[httpx.AsyncClient, int], "asyncio.Future"]):
+        self.name = name
+        self.send = send
+        self.latencies: List[float] = []
+        self.first_byte: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def record_error(self, reason: str) -> None:
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        latencies = self.latencies
+        result = {
+            "scenario": self.name,
+            "requests": len(latencies) + sum(self.errors.values()),
+            "succeeded": len(latencies),
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+                "p99": round(percentile(latencies, 99) * 1000, 1),
+                "max": round(max(latencies) * 1000, 1) if latencies else 0.0,
+            },
+        }
+        if self.first_byte:
+            result["first_byte_ms"] = {
+                "p50": round(percentile(self.first_byte, 50) * 1000, 1),
+                "p95": round(percentile(self.first_byte, 95) * 1000, 1),
+                "p99": round(percentile(self.first_byte, 99) * 1000, 1),
+            }
+        return result
+
+
+async def login(client: httpx.AsyncClient, base_url: str, credentials: str, role: str) -> str:
+    username, _, password = credentials.partition(":")
+    response = await client.post(
+        f"{base_url}/api/v1/auth/login",
+        json={"username": username, "password": password, "role": role},
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def build_scenarios(args, student_token: Optional[str], teacher_token: Optional[str]) -> List[Scenario]:
+    fastapi_url = args.fastapi_url.rstrip("/")
+    django_url = args.django_url.rstrip("/")
+    student_headers = {"Authorization": f"Bearer {student_token}"} if student_token else {}
+    teacher_headers = {"Authorization": f"Bearer {teacher_token}"} if teacher_token else {}
+    scenarios = []
+
+    for name in args.scenarios.split(","):
+        name = name.strip()
+        if name == "qa":
+            async def send(client, i):
+                response = await client.post(
+                    f"{fastapi_url}/api/v1/student/qa",
+                    json={"question": QA_QUESTIONS[i % len(QA_QUESTIONS)]},
+                    headers=student_headers,
+                )
+                response.raise_for_status()
+                return None
+        elif name == "qa_stream":
+            async def send(client, i):
+                first = None
+                start = time.perf_counter()
+                async with client.stream(
+                    "POST",
+                    f"{fastapi_url}/api/v1/student/qa/stream",
+                    json={"question": QA_QUESTIONS[i % len(QA_QUESTIONS)]},
+                    headers=student_headers,
+                ) as response:
+                    response.raise_for_status()
+                    async for _ in response.aiter_bytes():
+                        if first is None:
+                            first = time.perf_counter() - start
+                return first
+        elif name == "exam":
+            async def send(client, i):
+                response = await client.post(
+                    f"{fastapi_url}/api/v1/exams/generate",
+                    json={
+                        "course_id": args.course_id,
+                        "knowledge_points": ["数据结构", "操作系统"],
+                        "question_types": {"single_choice": 3, "true_false": 2},
+                        "question_scores": {"single_choice": 5, "true_false": 2},
+                        "difficulty": 3,
+                        "exam_title": f"压测试卷{i}",
+                    },
+                    headers=teacher_headers,
+                )
+                response.raise_for_status()
+                return None
+        elif name == "exercise":
+            async def send(client, i):
+                response = await client.post(
+                    f"{django_url}/api/student/exercises/generate/",
+                    json={
+                        "difficulty": ("easy", "medium", "hard")[i % 3],
+                        "type": "knowledge",
+                        "knowledge_point_ids": [],
+                    },
+                    headers=student_headers,
+                )
+                response.raise_for_status()
+                return None
+        else:
+            raise SystemExit(f"未知场景: {name}（可选 qa, qa_stream, exam, exercise）")
+        scenarios.append(Scenario(name, send))
+    return scenarios
+
+
+async def run_scenario(scenario: Scenario, client: httpx.AsyncClient, concurrency: int, total: int) -> dict:
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                first_byte = await scenario.send(client, i)
+            except httpx.HTTPStatusError as e:
+                scenario.record_error(str(e.response.status_code))
+                continue
+            except httpx.HTTPError as e:
+                scenario.record_error(type(e).__name__)
+                continue
+            scenario.latencies.append(time.perf_counter() - start)
+            if first_byte is not None:
+                scenario.first_byte.append(first_byte)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return scenario.report(time.perf_counter() - start)
+
+
+def print_report(result: dict) -> None:
+    latency = result["latency_ms"]
+    print(
+        f"[{result['scenario']}] 成功 {result['succeeded']}/{result['requests']}  "
+        f"吞吐 {result['throughput_rps']} req/s  "
+        f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+        f"mean {latency['mean']}ms  max {latency['max']}ms"
+    )
+    if "first_byte_ms" in result:
+        first_byte = result["first_byte_ms"]
+        print(f"    首字节 p50 {first_byte['p50']}ms  p95 {first_byte['p95']}ms  p99 {first_byte['p99']}ms")
+    if result["errors"]:
+        print(f"    错误: {result['errors']}")
+
+
+async def main_async(args) -> List[dict]:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        student_token = args.student_token
+        teacher_token = args.teacher_token
+        if not student_token and args.student:
+            student_token = await login(client, args.fastapi_url.rstrip("/"), args.student, "student")
+        if not teacher_token and args.teacher:
+            teacher_token = await login(client, args.fastapi_url.rstrip("/"), args.teacher, "teacher")
+
+        results = []
+        for scenario in build_scenarios(args, student_token, teacher_token):
+            if args.warmup:
+                await run_scenario(Scenario(scenario.name, scenario.send), client, 1, args.warmup)
+            result = await run_scenario(scenario, client, args.concurrency, args.requests)
+            result["concurrency"] = args.concurrency
+            results.append(result)
+            if not args.json:
+                print_report(result)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CampusAgent 接口压测")
+    parser.add_argument("--fastapi-url", default="http://localhost:8000")
+    parser.add_argument("--django-url", default="http://localhost:8001")
+    parser.add_argument("--scenarios", default="qa,exam,exercise", help="逗号分隔：qa, qa_stream, exam, exercise")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个场景正式计时前的预热请求数")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--course-id", type=int, default=1)
+    parser.add_argument("--student", help="学生账号 用户名:密码")
+    parser.add_argument("--teacher", help="教师账号 用户名:密码")
+    parser.add_argument("--student-token")
+    parser.add_argument("--teacher-token")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
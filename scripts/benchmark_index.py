@@ -0,0 +1,170 @@
+"""
+向量索引基准：在同一批向量上比较 ivf_flat / ivf_pq / hnsw 与精确 Flat 索引的 recall@k、单次查询延迟和内存占用
+
+    # 使用已构建的知识库索引（index.faiss），随机留出 200 个分块向量作为查询
+    python -m scripts.benchmark_index --index-dir ./knowledge/vector_store --k 3,10
+
+    # 语料还不大时，用合成数据估算百万级分块的表现
+    python -m scripts.benchmark_index --synthetic 1000000 --dim 2048 --types ivf_pq --nprobe 8,16,32
+
+recall@k 为 ANN 返回的前 k 个结果中属于精确前 k 个的比例；内存为索引序列化后的大小，
+同时换算为每百万分块的占用（ivf_pq 精确重排读取磁盘上的原始向量，不计入）。查询逐条执行，与线上每次问答检索一次的方式一致。
+构建参数默认取自配置（VECTOR_INDEX_*），可用命令行覆盖；--json 输出机器可读的结果。
+"""
+import argparse
+import json
+import math
+import os
+import time
+from typing import List
+
+import faiss
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.services.ann_index import apply_search_params, build_ann_index, with_refine
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法百分位"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def load_corpus(args):
+    """返回 (库向量, 查询向量)"""
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        # 高斯混合模拟分块向量的聚类结构
+        centers = rng.normal(size=(max(1, args.synthetic // 1000), args.dim)).astype("float32")
+        def sample(n):
+            return centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, args.dim)).astype("float32")
+        return np.vstack([sample(min(100000, args.synthetic - i)) for i in range(0, args.synthetic, 100000)]), sample(args.queries)
+
+    flat = faiss.read_index(os.path.join(args.index_dir, "index.faiss"))
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    if args.query_file:
+        from backend.app.services.knowledge_base import get_embeddings
+        with open(args.query_file, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        return vectors, np.array(get_embeddings().embed_documents(questions), dtype="float32")
+    # 留出部分分块向量作为查询，不在库中出现
+    held_out = rng.choice(len(vectors), min(args.queries, len(vectors) // 10 or 1), replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    return vectors[mask], vectors[held_out]
+
+
+def index_bytes(index: faiss.Index) -> int:
+    return len(faiss.serialize_index(index))
+
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies, hits = [], 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(ids[0]) & set(truth[i][:k]))
+    return {
+        "recall": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }
+
+
+def build_params(args, index_type: str) -> dict:
+    if index_type == "hnsw":
+        return {"type": "hnsw", "hnsw_m": args.hnsw_m, "ef_construction": args.ef_construction}
+    params = {"type": index_type, "nlist": args.nlist}
+    if index_type == "ivf_pq":
+        params.update(pq_m=args.pq_m, pq_nbits=args.pq_nbits)
+    return params
+
+
+def run(args) -> List[dict]:
+    vectors, queries = load_corpus(args)
+    ks = [int(k) for k in args.k.split(",")]
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, max(ks))
+    if not args.json:
+        print(f"库向量 {flat.ntotal} 个，维度 {flat.d}，查询 {len(queries)} 个")
+
+    results = []
+
+    def report(name: str, index: faiss.Index, build_s: float, search_param: dict, size: int = None):
+        size = size or index_bytes(index)
+        for k in ks:
+            result = {
+                "index": name,
+                **search_param,
+                "k": k,
+                **measure(index, queries, truth, k),
+                "build_s": round(build_s, 2),
+                "bytes": size,
+                "mb_per_million": round(size / flat.ntotal * 1e6 / 2 ** 20, 1),
+            }
+            results.append(result)
+            if not args.json:
+                params = " ".join(f"{key}={value}" for key, value in search_param.items())
+                print(
+                    f"[{name}{' ' + params if params else ''}] k={k}  recall {result['recall']:.4f}  "
+                    f"p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  "
+                    f"{result['mb_per_million']} MB/百万分块  构建 {result['build_s']}s"
+                )
+
+    report("flat", flat, 0.0, {})
+    for index_type in [t for t in args.types.split(",") if t]:
+        start = time.perf_counter()
+        index = build_ann_index(flat, build_params(args, index_type), args.train_sample)
+        build_s = time.perf_counter() - start
+        if index_type == "hnsw":
+            for ef_search in [int(v) for v in args.ef_search.split(",")]:
+                apply_search_params(index, ef_search=ef_search)
+                report(index_type, index, build_s, {"ef_search": ef_search})
+        else:
+            refines = [int(v) for v in args.pq_refine.split(",")] if index_type == "ivf_pq" else [0]
+            for nprobe in [int(v) for v in args.nprobe.split(",")]:
+                apply_search_params(index, nprobe=nprobe)
+                for refine in refines:
+                    param = {"nlist": faiss.extract_index_ivf(index).nlist, "nprobe": nprobe}
+                    if index_type == "ivf_pq":
+                        param["refine"] = refine
+                    # 精确重排读取的是磁盘上的 index.faiss，内存仍按 PQ 索引本身计算
+                    report(index_type, with_refine(index, flat, refine), build_s, param, index_bytes(index))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量索引 recall@k / 延迟 / 内存基准")
+    parser.add_argument("--index-dir", default=settings.VECTOR_STORE_PATH, help="已构建的知识库索引目录")
+    parser.add_argument("--synthetic", type=int, default=0, help="使用 N 个合成向量代替知识库索引")
+    parser.add_argument("--dim", type=int, default=2048, help="合成向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--query-file", help="每行一个问题，调用 embedding 接口生成查询向量")
+    parser.add_argument("--types", default="ivf_flat,ivf_pq,hnsw")
+    parser.add_argument("--k", default="3,10", help="逗号分隔的 k 值")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF 查询参数，逗号分隔")
+    parser.add_argument("--ef-search", default="16,32,64,128", help="HNSW 查询参数，逗号分隔")
+    parser.add_argument("--pq-refine", default=f"0,{settings.VECTOR_INDEX_PQ_REFINE}", help="ivf_pq 精确重排倍数，逗号分隔")
+    parser.add_argument("--nlist", type=int, default=settings.VECTOR_INDEX_NLIST)
+    parser.add_argument("--pq-m", type=int, default=settings.VECTOR_INDEX_PQ_M)
+    parser.add_argument("--pq-nbits", type=int, default=settings.VECTOR_INDEX_PQ_NBITS)
+    parser.add_argument("--hnsw-m", type=int, default=settings.VECTOR_INDEX_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=settings.VECTOR_INDEX_EF_CONSTRUCTION)
+    parser.add_argument("--train-sample", type=int, default=settings.VECTOR_INDEX_TRAIN_SAMPLE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+本地模拟大模型服务：与智谱 / DeepSeek 使用相同的 HTTP 协议，用于离线压测和 CI
+
+    POST /api/paas/v4/chat/completions   智谱对话（支持 stream=true 的 SSE）
+    POST /api/paas/v4/embeddings         智谱向量
+    POST /v1/chat/completions            DeepSeek（OpenAI 兼容）对话
+    GET  /stats                          已处理的请求数与注入的错误数
+
+返回内容由 prompt 哈希决定，同样的请求总是得到同样的题目；延迟按对数正态分布抽样，
+再按 token 速率计算生成耗时。可以按比例注入 429/5xx 错误。
+
+启动：
+    python scripts/mock_llm_server.py --port 9000 --latency-ms 600 --tokens-per-sec 60 --error-rate 0.02
+让后端指向模拟服务：
+    API_BASE_URL=http://localhost:9000/api/paas/v4/chat/completions
+    ZHIPUAI_BASE_URL=http://localhost:9000/api/paas/v4
+    DEEPSEEK_BASE_URL=http://localhost:9000/v1
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock LLM Server")
+
+options = argparse.Namespace(
+    latency_ms=500.0,
+    latency_sigma=0.3,
+    tokens_per_sec=50.0,
+    error_rate=0.0,
+    error_statuses=[429, 500, 503],
+    dim=2048,
+    seed=42,
+)
+rng = random.Random(options.seed)
+counters = {"chat": 0, "stream": 0, "embeddings": 0, "errors": 0}
+
+QUESTION_TYPES = {
+    "【单选题】": "single_choice",
+    "【多选题】": "multiple_choice",
+    "【判断题】": "true_false",
+    "【填空题】": "completion",
+    "【案例分析题】": "case_analysis",
+    "【编程题】": "programming",
+}
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _mock_question(question_type: str, seed: str, index: int = 0) -> dict:
+    tag = f"{seed[:8]}-{index}"
+    question = {
+        "content": f"[模拟题 {tag}] 关于该知识点，下列说法中正确的是？",
+        "answer": "A",
+        "analysis": f"模拟解析 {tag}",
+    }
+    if question_type == "single_choice":
+        question["options"] = ["A. 说法一", "B. 说法二", "C. 说法三", "D. 说法四"]
+    elif question_type == "multiple_choice":
+        question["options"] = ["A. 说法一", "B. 说法二", "C. 说法三", "D. 说法四"]
+        question["answer"] = ["A", "C"]
+    elif question_type == "true_false":
+        question["answer"] = "正确"
+    elif question_type == "programming":
+        question["answer"] = "def solution():\n    return 42"
+    return question
+
+
+def mock_completion(prompt: str) -> str:
+    """根据 prompt 的特征返回与真实接口格式一致的确定性内容"""
+    seed = _digest(prompt)
+    for marker, question_type in QUESTION_TYPES.items():
+        if marker in prompt:
+            batch = re.search(r"一次生成(\d+)道", prompt)
+            if batch:
+                items = [_mock_question(question_type, seed, i) for i in range(int(batch.group(1)))]
+                return json.dumps(items, ensure_ascii=False)
+            return json.dumps(_mock_question(question_type, seed), ensure_ascii=False)
+    if "title、question和answer" in prompt:
+        return json.dumps({
+            "title": f"模拟练习 {seed[:8]}",
+            "question": "计算 12 + 30 的结果。",
+            "answer": "42",
+        }, ensure_ascii=False)
+    if "structured_draft" in prompt:
+        return json.dumps({
+            "structured_draft": {"title": "模拟课件", "modules": []},
+            "training_plan": {"goals": [], "tasks": []},
+            "schedule": {"total_hours": 2, "items": []},
+            "ppt_outline": {"title": "模拟课件", "slides": []},
+        }, ensure_ascii=False)
+    return f"这是模拟回答（{seed[:8]}）。" + "根据课程资料，该问题的要点如下。" * 4
+
+
+def _sample_latency() -> float:
+    """对数正态分布的首 token 延迟（秒），中位数为 latency_ms"""
+    return options.latency_ms / 1000 * math.exp(rng.gauss(0, options.latency_sigma))
+
+
+def _maybe_error():
+    if options.error_rate and rng.random() < options.error_rate:
+        counters["errors"] += 1
+        status = rng.choice(options.error_statuses)
+        headers = {"Retry-After": "1"} if status == 429 else {}
+        return JSONResponse({"error": {"code": str(status), "message": "mock error"}}, status_code=status, headers=headers)
+    return None
+
+
+def _usage(prompt: str, content: str) -> dict:
+    return {
+        "prompt_tokens": len(prompt),
+        "completion_tokens": len(content),
+        "total_tokens": len(prompt) + len(content),
+    }
+
+
+async def _chat(request: Request):
+    body = await request.json()
+    prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+    model = body.get("model", "mock")
+    error = _maybe_error()
+    if error is not None:
+        return error
+    content = mock_completion(prompt)
+    completion_id = uuid.uuid4().hex
+    created = int(time.time())
+
+    if body.get("stream"):
+        counters["stream"] += 1
+
+        async def events():
+            await asyncio.sleep(_sample_latency())
+            step = 4
+            for i in range(0, len(content), step):
+                piece = content[i:i + step]
+                chunk = {
+                    "id": completion_id, "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(len(piece) / options.tokens_per_sec)
+            final = {
+                "id": completion_id, "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "delta": {"role": "assistant", "content": ""}}],
+                "usage": _usage(prompt, content),
+            }
+            yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    counters["chat"] += 1
+    await asyncio.sleep(_sample_latency() + len(content) / options.tokens_per_sec)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+        "usage": _usage(prompt, content),
+    }
+
+
+@app.post("/api/paas/v4/chat/completions")
+async def zhipu_chat(request: Request):
+    return await _chat(request)
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    return await _chat(request)
+
+
+@app.post("/api/paas/v4/embeddings")
+async def zhipu_embeddings(request: Request):
+    body = await request.json()
+    texts = body.get("input", [])
+    if isinstance(texts, str):
+        texts = [texts]
+    error = _maybe_error()
+    if error is not None:
+        return error
+    counters["embeddings"] += 1
+    # 向量化比对话快得多，只取十分之一的延迟
+    await asyncio.sleep(_sample_latency() / 10)
+    data = []
+    for i, text in enumerate(texts):
+        vector_rng = random.Random(_digest(text))
+        vector = [vector_rng.gauss(0, 1) for _ in range(options.dim)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        data.append({"index": i, "object": "embedding", "embedding": [v / norm for v in vector]})
+    tokens = sum(len(text) for text in texts)
+    return {
+        "object": "list",
+        "model": body.get("model", "embedding-3"),
+        "data": data,
+        "usage": {"prompt_tokens": tokens, "completion_tokens": 0, "total_tokens": tokens},
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return {**counters, "options": {k: v for k, v in vars(options).items()}}
+
+
+def main():
+    global rng
+    parser = argparse.ArgumentParser(description="本地模拟大模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=options.latency_ms, help="首 token 延迟中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=options.latency_sigma, help="对数正态分布的 sigma，越大长尾越明显")
+    parser.add_argument("--tokens-per-sec", type=float, default=options.tokens_per_sec, help="生成速度（字/秒）")
+    parser.add_argument("--error-rate", type=float, default=options.error_rate, help="注入错误的比例 0~1")
+    parser.add_argument("--error-statuses", default="429,500,503", help="注入错误时随机选用的状态码")
+    parser.add_argument("--dim", type=int, default=options.dim, help="向量维度，需与索引一致")
+    parser.add_argument("--seed", type=int, default=options.seed)
+    args = parser.parse_args()
+
+    options.latency_ms = args.latency_ms
+    options.latency_sigma = args.latency_sigma
+    options.tokens_per_sec = args.tokens_per_sec
+    options.error_rate = args.error_rate
+    options.error_statuses = [int(code) for code in args.error_statuses.split(",") if code]
+    options.dim = args.dim
+    options.seed = args.seed
+    rng = random.Random(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""课程资料解析：备课智能体和知识库构建共用"""
+from docx import Document
+import PyPDF2
+
+
+def parse_docx(file_path):
+    """解析 docx 文件，返回全部文本内容"""
+    doc = Document(file_path)
+    content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
+    return content
+
+def parse_pdf(file_path):
+    """解析 pdf 文件，返回全部文本内容"""
+    content = ""
+    with open(file_path, "rb") as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        for page in pdf_reader.pages:
+            content += page.extract_text() or ""
+    return content
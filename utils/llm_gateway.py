@@ -0,0 +1,380 @@
+"""
+大模型服务商网关：所有调用模型接口的代码路径共用的调度层
+
+    - 每个服务商一个并发上限（PROVIDER_CONCURRENCY），排队时按优先级放行：
+      交互类请求（学生问答、练习生成）排在批量任务（组卷、备课）前面
+    - 每个 服务商/模型 一个令牌桶（PROVIDER_RATE_LIMITS，单位：请求/秒），平滑突发流量
+    - 429、5xx 和网络错误按指数退避 + 随机抖动重试，优先遵循 Retry-After；退避期间不占用并发名额
+    - 共享连接池：异步路径共用当前事件循环的 httpx.AsyncClient，同步路径（Django、备课智能体）
+      复用进程内的 SDK 客户端
+    - 异步限制器和连接池按事件循环弱引用登记，asyncio.run 或工作线程中的事件循环关闭后，
+      下次登记新事件循环时一并清理，不会随事件循环数量累积
+
+异步：await get_gateway().call(provider, model, send, priority)
+同步：get_gateway().call_sync(provider, model, send, priority)
+send 为无参函数，每次重试都会重新调用。
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+
+from config.model_config import ModelConfig
+
+try:
+    import h2  # noqa: F401  安装了 h2 才能启用 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class TokenBucket:
+    """令牌桶，rate 为每秒补充的令牌数，capacity 为允许的突发量"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预订一个令牌，返回需要等待的秒数（令牌可以预支，等待结束时即可使用）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class AsyncPriorityLimiter:
+    """按优先级放行的异步并发限制（绑定单个事件循环）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: list = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 名额已经转交过来但调用方被取消，交给下一个等待者
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # 名额直接转交，active 不变
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class PriorityLimiter:
+    """按优先级放行的线程并发限制，供同步调用路径使用"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def acquire(self, priority: int) -> None:
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            while self.active >= self.limit or self._waiters[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self.active += 1
+            self._cond.notify_all()
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429/5xx、超时和连接错误可以重试；鉴权失败、参数错误等直接抛出"""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, httpx.TransportError):
+        return True
+    # zhipuai / openai SDK 的网络错误
+    name = type(error).__name__
+    return name.endswith("ConnectionError") or name.endswith("TimeoutError")
+
+
+def _closed_loops(registry: weakref.WeakKeyDictionary) -> List[asyncio.AbstractEventLoop]:
+    return [loop for loop in list(registry.keys()) if loop.is_closed()]
+
+
+class ProviderGateway:
+    def __init__(self, config: Optional[ModelConfig] = None):
+        self.config = config or ModelConfig()
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 事件循环 -> {服务商: 限制器}
+        self._async_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncPriorityLimiter]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._sync_limiters: Dict[str, PriorityLimiter] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    # ---------- 限流与并发 ----------
+
+    def _limit(self, provider: str) -> int:
+        return self.config.PROVIDER_CONCURRENCY.get(provider, self.config.DEFAULT_PROVIDER_CONCURRENCY)
+
+    def _bucket(self, provider: str, model: str) -> TokenBucket:
+        key = f"{provider}:{model}"
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                limits = self.config.PROVIDER_RATE_LIMITS
+                rate = limits.get(key, limits.get(provider, self.config.DEFAULT_RATE_LIMIT))
+                bucket = self._buckets[key] = TokenBucket(
+                    rate, max(1.0, rate * self.config.RATE_LIMIT_BURST_SECONDS)
+                )
+            return bucket
+
+    def _async_limiter(self, provider: str) -> AsyncPriorityLimiter:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            limiters = self._async_limiters.get(loop)
+            if limiters is None:
+                for closed in _closed_loops(self._async_limiters):
+                    del self._async_limiters[closed]
+                limiters = self._async_limiters[loop] = {}
+            limiter = limiters.get(provider)
+            if limiter is None:
+                limiter = limiters[provider] = AsyncPriorityLimiter(self._limit(provider))
+            return limiter
+
+    def _sync_limiter(self, provider: str) -> PriorityLimiter:
+        with self._lock:
+            limiter = self._sync_limiters.get(provider)
+            if limiter is None:
+                limiter = self._sync_limiters[provider] = PriorityLimiter(self._limit(provider))
+            return limiter
+
+    def _count(self, provider: str, field: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                provider, {"requests": 0, "retries": 0, "throttled": 0, "failures": 0}
+            )
+            stats[field] += 1
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, priority: int = Priority.INTERACTIVE):
+        """占用一个并发名额并取得令牌后执行一次请求"""
+        limiter = self._async_limiter(provider)
+        await limiter.acquire(priority)
+        try:
+            wait = self._bucket(provider, model).reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._count(provider, "requests")
+            yield
+        finally:
+            limiter.release()
+
+    @contextmanager
+    def slot_sync(self, provider: str, model: str, priority: int = Priority.INTERACTIVE):
+        limiter = self._sync_limiter(provider)
+        limiter.acquire(priority)
+        try:
+            wait = self._bucket(provider, model).reserve()
+            if wait > 0:
+                time.sleep(wait)
+            self._count(provider, "requests")
+            yield
+        finally:
+            limiter.release()
+
+    # ---------- 重试 ----------
+
+    def retry_delay(self, provider: str, error: BaseException, attempt: int) -> Optional[float]:
+        """第 attempt 次（从 0 开始）失败后的等待秒数，不应重试时返回 None"""
+        if attempt >= self.config.GATEWAY_MAX_RETRIES or not is_retryable(error):
+            self._count(provider, "failures")
+            return None
+        self._count(provider, "retries")
+        if _status_code(error) == 429:
+            self._count(provider, "throttled")
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.config.BACKOFF_MAX)
+        # full jitter
+        return random.uniform(0, min(self.config.BACKOFF_MAX, self.config.BACKOFF_BASE * 2 ** attempt))
+
+    async def call(
+        self,
+        provider: str,
+        model: str,
+        send: Callable[[], Awaitable[T]],
+        priority: int = Priority.INTERACTIVE
+    ) -> T:
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(provider, model, priority):
+                    return await send()
+            except Exception as e:
+                delay = self.retry_delay(provider, e, attempt)
+                if delay is None:
+                    raise
+                print(f"{provider} 请求失败，{delay:.2f}s 后第{attempt + 1}次重试: {e}")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def call_sync(
+        self,
+        provider: str,
+        model: str,
+        send: Callable[[], T],
+        priority: int = Priority.INTERACTIVE
+    ) -> T:
+        attempt = 0
+        while True:
+            try:
+                with self.slot_sync(provider, model, priority):
+                    return send()
+            except Exception as e:
+                delay = self.retry_delay(provider, e, attempt)
+                if delay is None:
+                    raise
+                print(f"{provider} 请求失败，{delay:.2f}s 后第{attempt + 1}次重试: {e}")
+                attempt += 1
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        result = {}
+        with self._lock:
+            per_loop = [dict(limiters) for limiters in self._async_limiters.values()]
+        for provider, counters in self._stats.items():
+            async_limiters = [limiters[provider] for limiters in per_loop if provider in limiters]
+            in_flight = sum(limiter.active for limiter in async_limiters)
+            waiting = sum(limiter.waiting for limiter in async_limiters)
+            sync_limiter = self._sync_limiters.get(provider)
+            if sync_limiter is not None:
+                in_flight += sync_limiter.active
+                waiting += sync_limiter.waiting
+            result[provider] = {
+                **counters,
+                "in_flight": in_flight,
+                "waiting": waiting,
+                "concurrency": self._limit(provider),
+            }
+        return result
+
+
+_gateway: Optional[ProviderGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> ProviderGateway:
+    """进程内共享的模型服务商网关"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = ProviderGateway()
+    return _gateway
+
+
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_http_clients_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """当前事件循环共享的连接池（keep-alive，可用时启用 HTTP/2）"""
+    loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        client = _http_clients.get(loop)
+        if client is not None and not client.is_closed:
+            return client
+        # 已关闭的事件循环无法再 await aclose()，释放引用后由垃圾回收关闭底层连接
+        for closed in _closed_loops(_http_clients):
+            del _http_clients[closed]
+        config = ModelConfig()
+        client = _http_clients[loop] = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json"
+            },
+            timeout=config.REQUEST_TIMEOUT
+        )
+        return client
+
+
+async def close_http_clients() -> None:
+    """关闭当前事件循环的共享连接池（应用关闭时调用；asyncio.run 的调用方在返回前调用可立即释放连接）"""
+    with _http_clients_lock:
+        client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -1,4 +1,4 @@
-import httpx
+import asyncio
 import json
 import hmac
 import base64
@@ -7,42 +7,75 @@ import hashlib
 from config.model_config import ModelConfig
 from langchain_community.chat_models import ChatZhipuAI
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from zhipuai import ZhipuAI
 import os
+from typing import AsyncIterator, Dict, Optional
 from dotenv import load_dotenv
+from utils.llm_gateway import HTTP2_AVAILABLE, Priority, close_http_clients, get_gateway, get_http_client
+
+DEFAULT_SYSTEM_PROMPT = "你是一个善于生成考试试卷的助手，你的任务是根据用户的要求生成高质量的考试试题。"
+
+def _b64url(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
 
 class ChatGLMClient:
-    def __init__(self):
+    provider = "zhipuai"
+
+    # 进程内共享：鉴权 token 缓存与请求统计
+    _token_cache: Dict[str, tuple] = {}
+    in_flight = 0
+    total_requests = 0
+    failed_requests = 0
+
+    def __init__(self, priority: Priority = Priority.INTERACTIVE):
+        """priority: 在网关中的排队优先级，批量任务使用 Priority.BATCH"""
         self.config = ModelConfig()
+        self.priority = priority
         load_dotenv()
         self.api_key = api_key = os.getenv("ZHIPU_API_KEY")#os.environ["ZHIPU_API_KEY"]#self.config.API_KEY.strip()
-        print("实际读取到的API_KEY:", repr(self.api_key))  # 添加这一行
-        self.client = httpx.AsyncClient(
-            base_url=self.config.API_BASE_URL,
-            headers={
-                "Authorization": self._generate_auth_string(),  # 使用新的认证方式
-                "Content-Type": "application/json",
-                "Accept": "application/json"
-            },
-            timeout=30.0
-        )
-        print("Loaded api_key:", self.api_key)
-    
+        self.last_usage: Optional[dict] = None
+
     def _generate_auth_string(self) -> str:
-        """生成认证字符串"""
+        """生成智谱 API 鉴权用的 JWT，缓存到过期前再重新签发"""
+        now = time.time()
+        cached = ChatGLMClient._token_cache.get(self.api_key)
+        if cached and cached[1] - self.config.AUTH_TOKEN_REFRESH_MARGIN > now:
+            return cached[0]
         try:
             api_key_id, api_key_secret = self.api_key.split('.')
+            expires_at = now + self.config.AUTH_TOKEN_TTL
+            header = {"alg": "HS256", "sign_type": "SIGN"}
+            payload = {
+                "api_key": api_key_id,
+                "exp": int(expires_at * 1000),
+                "timestamp": int(now * 1000)
+            }
+            signing_input = f"{_b64url(header)}.{_b64url(payload)}"
             # 生成 HMAC-SHA256 签名
-            timestamp = str(int(time.time()))
             signature = hmac.new(
                 api_key_secret.encode('utf-8'),
-                f"{timestamp}.{api_key_id}".encode('utf-8'),
+                signing_input.encode('utf-8'),
                 hashlib.sha256
-            ).hexdigest()
-            
-            return f"{api_key_id}.{timestamp}.{signature}"
+            ).digest()
+            token = f"{signing_input}.{base64.urlsafe_b64encode(signature).rstrip(b'=').decode()}"
         except Exception as e:
             raise Exception(f"生成认证字符串失败: {str(e)}")
+        ChatGLMClient._token_cache[self.api_key] = (token, expires_at)
+        return token
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "in_flight": cls.in_flight,
+            "total_requests": cls.total_requests,
+            "failed_requests": cls.failed_requests,
+            "http2": HTTP2_AVAILABLE,
+            "providers": get_gateway().stats(),
+        }
+
+    async def close(self):
+        await close_http_clients()
 
     # async def generate_text(self, prompt: str) -> str:
     #     """调用 API 生成文本"""
@@ -89,26 +122,105 @@ class ChatGLMClient:
     # async def close(self):
     #     await self.client.aclose()
 
-    async def generate_text(self, prompt: str) -> str:
-        """调用 ZhipuAI SDK 生成文本"""
-        try:
-            print("utils/model_client.py的generate_text在工作")
-            client = ZhipuAI(api_key=self.api_key)
-            response = client.chat.completions.create(
-                model="glm-4-plus",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个善于生成考试试卷的助手，你的任务是根据用户的要求生成高质量的考试试题。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
+    def _build_request(self, prompt: str, system_prompt: str, stream: bool = False) -> dict:
+        request_data = {
+            "model": self.config.API_VERSION,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        if stream:
+            request_data["stream"] = True
+        return request_data
+
+    async def generate_text(
+        self,
+        prompt: str,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        timeout: Optional[float] = None
+    ) -> str:
+        """调用智谱 chat/completions 接口生成文本（不阻塞事件循环，经网关限流、排队和重试）"""
+        request_data = self._build_request(prompt, system_prompt)
+
+        async def send() -> dict:
+            response = await get_http_client().post(
+                self.config.API_BASE_URL,
+                json=request_data,
+                headers={"Authorization": f"Bearer {self._generate_auth_string()}"},
+                timeout=timeout or self.config.REQUEST_TIMEOUT
             )
-            print("ZhipuAI response:", response)
+            response.raise_for_status()
+            return response.json()
+
+        ChatGLMClient.in_flight += 1
+        ChatGLMClient.total_requests += 1
+        try:
+            result = await get_gateway().call(self.provider, self.config.API_VERSION, send, self.priority)
             # 兼容返回结构
-            return response.choices[0].message.content
+            return result["choices"][0]["message"]["content"]
+        except Exception as e:
+            ChatGLMClient.failed_requests += 1
+            raise Exception(f"API调用失败: {str(e)}")
+        finally:
+            ChatGLMClient.in_flight -= 1
+
+    async def stream_text(
+        self,
+        prompt: str,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """以 SSE 流式调用 chat/completions，逐段返回模型输出；结束后 last_usage 为接口返回的 token 用量"""
+        request_data = self._build_request(prompt, system_prompt, stream=True)
+        self.last_usage = None
+        gateway = get_gateway()
+        ChatGLMClient.in_flight += 1
+        ChatGLMClient.total_requests += 1
+        try:
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    async with gateway.slot(self.provider, self.config.API_VERSION, self.priority):
+                        async with get_http_client().stream(
+                            "POST",
+                            self.config.API_BASE_URL,
+                            json=request_data,
+                            headers={"Authorization": f"Bearer {self._generate_auth_string()}"},
+                            timeout=timeout or self.config.REQUEST_TIMEOUT
+                        ) as response:
+                            response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                chunk = json.loads(data)
+                                if chunk.get("usage"):
+                                    self.last_usage = chunk["usage"]
+                                choices = chunk.get("choices") or [{}]
+                                delta = choices[0].get("delta", {}).get("content")
+                                if delta:
+                                    started = True
+                                    yield delta
+                    return
+                except Exception as e:
+                    # 已经输出过内容就不能再重试，否则客户端会收到重复的片段
+                    delay = None if started else gateway.retry_delay(self.provider, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(delay)
         except Exception as e:
-            raise Exception(f"API调用失败: {str(e)}")
\ No newline at end of file
+            ChatGLMClient.failed_requests += 1
+            raise Exception(f"API调用失败: {str(e)}")
+        finally:
+            ChatGLMClient.in_flight -= 1
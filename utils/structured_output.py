@@ -0,0 +1,296 @@
+"""
+大模型结构化输出：容错解析、schema 校验、本地修复和定向修正
+
+模型返回的 JSON 常见问题：包在 markdown 代码块里、前后夹带说明文字、末尾多余逗号、
+字符串里直接换行、Python 风格的 True/None、输出被截断。整道题重新生成要再走一遍检索上下文和完整提示词，
+这里按代价从低到高处理：
+    1. 逐字符扫描，找出括号配对完整的顶层 JSON 值（不会像贪婪正则那样把两段 JSON 连同中间文字一起截取）
+    2. 解析失败时在本地修复上述常见问题后再解析
+    3. 解析结果按 pydantic schema 校验（选项格式等可在 schema 的校验器中就地规范化）
+    4. 仍然不合格时，只把原始输出和错误信息发给模型要求修正（不带背景材料，提示词很短），
+       最多 STRUCTURED_OUTPUT_MAX_FIXES 次；修正也失败才由调用方重新生成
+
+异步：await parse_or_fix(raw, schema, fix)
+同步：parse_or_fix_sync(raw, schema, fix)
+fix 接收修正提示词，返回模型的回复。
+"""
+import json
+import re
+import threading
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from config.model_config import ModelConfig
+
+M = TypeVar("M", bound=BaseModel)
+
+_CODE_FENCE = re.compile(r"```[A-Za-z]*\s*([\s\S]*?)\s*```")
+_BARE_WORD = re.compile(r"[A-Za-z_]+")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+FIX_PROMPT_TEMPLATE = """下面的JSON不符合要求：{error}
+要求的字段：{fields}
+请只修正格式和不符合要求的字段，其余内容保持不变，直接返回修正后的JSON（不要返回markdown代码块）：
+{raw}"""
+
+
+class StructuredOutputError(ValueError):
+    """模型输出无法解析或未通过 schema 校验"""
+
+    def __init__(self, message: str, raw: Optional[str] = None):
+        super().__init__(message)
+        self.raw = raw
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"parsed": 0, "repaired": 0, "fixed": 0, "failed": 0, "fix_calls": 0}
+
+    def incr(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+
+_stats = _Stats()
+
+
+def stats() -> dict:
+    """parsed: 直接解析成功；repaired: 本地修复后成功；fixed: 模型修正后成功；failed: 修正后仍失败"""
+    return dict(_stats.counts)
+
+
+def strip_code_fences(text: str) -> str:
+    match = _CODE_FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def scan_json_values(text: str) -> Iterator[str]:
+    """
+    逐字符扫描，依次返回括号配对完整的顶层 {...} / [...] 片段；字符串内的括号不计入
+    文本在 JSON 中途结束（输出被截断）时，最后返回未闭合的部分，交给 repair_json 补全
+    """
+    stack: List[str] = []
+    start = None
+    in_string = escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = bool(stack)
+        elif ch in "{[":
+            if not stack:
+                start = i
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            if ch != stack[-1]:
+                # 括号不匹配，放弃这一段，从后面重新找
+                stack.clear()
+                continue
+            stack.pop()
+            if not stack:
+                yield text[start:i + 1]
+    if stack:
+        yield text[start:]
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(text: str) -> str:
+    """
+    本地修复常见问题：多余的逗号、字符串中的原始换行/制表符、True/False/None、
+    未闭合的字符串和括号（输出被截断时）
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            elif ch == "\n":
+                ch = "\\n"
+            elif ch == "\r":
+                ch = "\\r"
+            elif ch == "\t":
+                ch = "\\t"
+            out.append(ch)
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch.isalpha():
+            match = _BARE_WORD.match(text, i)
+            if match is None:
+                # 中文等非 ASCII 裸词原样保留，解析失败后走修正流程
+                out.append(ch)
+                i += 1
+                continue
+            word = match.group(0)
+            out.append(_PY_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    _drop_trailing_comma(out)
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def loads_tolerant(fragment: str) -> Tuple[Any, bool]:
+    """返回 (解析结果, 是否经过本地修复)，修复后仍不合法时抛出 ValueError"""
+    try:
+        return json.loads(fragment), False
+    except ValueError:
+        return json.loads(repair_json(fragment)), True
+
+
+def _candidates(text: str) -> Iterator[Tuple[Any, bool]]:
+    for fragment in scan_json_values(strip_code_fences(text)):
+        try:
+            yield loads_tolerant(fragment)
+        except ValueError:
+            continue
+
+
+def parse_json(text: str, expect: Optional[type] = dict) -> Any:
+    """取回复中第一个能解析且类型符合 expect 的 JSON 值，找不到时抛出 StructuredOutputError"""
+    for value, repaired in _candidates(text):
+        if expect is None or isinstance(value, expect):
+            _stats.incr("repaired" if repaired else "parsed")
+            return value
+    raise StructuredOutputError("回复中没有可解析的JSON", raw=text)
+
+
+def parse_json_items(text: str) -> List[dict]:
+    """
+    从应当返回 JSON 数组的回复中取出各个对象
+    数组整体无法解析（如中途被截断）时，逐个扫描其中完整的对象，保住格式正确的部分
+    """
+    for value, _ in _candidates(text):
+        if isinstance(value, list) and any(isinstance(item, dict) for item in value):
+            return [item for item in value if isinstance(item, dict)]
+        if isinstance(value, dict):
+            # 只要求一道题时模型可能直接返回单个对象
+            return [value]
+    decoder = json.JSONDecoder()
+    items = []
+    position = text.find("{")
+    while position != -1:
+        try:
+            item, end = decoder.raw_decode(text, position)
+        except ValueError:
+            position = text.find("{", position + 1)
+            continue
+        if isinstance(item, dict):
+            items.append(item)
+        position = text.find("{", end)
+    return items
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "；".join(
+        f"{'.'.join(str(loc) for loc in e['loc']) or '整体'}: {e['msg']}" for e in error.errors()
+    )
+
+
+def schema_fields(schema: Type[BaseModel]) -> str:
+    return "，".join(
+        f"{name}（必填）" if field.is_required() else name for name, field in schema.model_fields.items()
+    )
+
+
+def validate(data: Any, schema: Type[M], raw: Optional[str] = None) -> M:
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        raise StructuredOutputError(format_validation_error(e), raw=raw) from None
+
+
+def parse_structured(text: str, schema: Type[M]) -> M:
+    """解析 + 本地修复 + schema 校验，不调用模型"""
+    return validate(parse_json(text), schema, raw=text)
+
+
+def build_fix_prompt(raw: str, error: str, schema: Type[BaseModel]) -> str:
+    return FIX_PROMPT_TEMPLATE.format(error=error, fields=schema_fields(schema), raw=raw.strip())
+
+
+def _max_fixes(max_fixes: Optional[int]) -> int:
+    return ModelConfig().STRUCTURED_OUTPUT_MAX_FIXES if max_fixes is None else max_fixes
+
+
+async def parse_or_fix(
+    raw: str,
+    schema: Type[M],
+    fix: Callable[[str], Awaitable[str]],
+    max_fixes: Optional[int] = None
+) -> M:
+    """本地解析失败时让模型修正原输出，修正次数用完仍不合格时抛出 StructuredOutputError"""
+    max_fixes = _max_fixes(max_fixes)
+    for attempt in range(max_fixes + 1):
+        try:
+            result = parse_structured(raw, schema)
+            if attempt:
+                _stats.incr("fixed")
+            return result
+        except StructuredOutputError as e:
+            error = e
+        if attempt < max_fixes:
+            _stats.incr("fix_calls")
+            raw = await fix(build_fix_prompt(raw, str(error), schema))
+    _stats.incr("failed")
+    raise error
+
+
+def parse_or_fix_sync(
+    raw: str,
+    schema: Type[M],
+    fix: Callable[[str], str],
+    max_fixes: Optional[int] = None
+) -> M:
+    """parse_or_fix 的同步版本（Django 等同步调用方使用）"""
+    max_fixes = _max_fixes(max_fixes)
+    for attempt in range(max_fixes + 1):
+        try:
+            result = parse_structured(raw, schema)
+            if attempt:
+                _stats.incr("fixed")
+            return result
+        except StructuredOutputError as e:
+            error = e
+        if attempt < max_fixes:
+            _stats.incr("fix_calls")
+            raw = fix(build_fix_prompt(raw, str(error), schema))
+    _stats.incr("failed")
+    raise error